@@ -0,0 +1,55 @@
+"""
+Helpers shared by the benchmark scripts. The scripts are run from the project
+folder, for example `python benchmarks/search_benchmark.py`.
+"""
+import os
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django() -> None:
+    """
+    Makes the project importable and configures Django.
+    """
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'iemacies.settings')
+
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """
+    Runs the enclosed block against a freshly migrated throwaway database, so
+    that benchmarks never touch the development data.
+    """
+    from django.db import connection
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def time_call(function, repeat: int) -> dict[str, float]:
+    """
+    Calls a function repeatedly and returns its timings in milliseconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'median_ms': statistics.median(timings),
+        'min_ms': min(timings),
+        'max_ms': max(timings),
+    }
@@ -0,0 +1,373 @@
+"""
+Drives every route in main/urls.py with concurrent HTTP clients and reports
+throughput and latency percentiles per route.
+
+The benchmark generates a dataset in a throwaway SQLite file, starts the
+development server (or uvicorn with `--server asgi`) against it and runs
+anonymous, student and teacher scenarios, including form submissions.
+Everything runs locally.
+
+Usage:
+    python benchmarks/load_benchmark.py [--users 2000] [--requests 200] [--concurrency 8] [--server asgi]
+                                        [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from itertools import count
+from pathlib import Path
+from typing import Callable
+
+from common import BASE_DIR, setup_django
+
+PASSWORD = 'password'
+
+
+@dataclass
+class Scenario:
+    route: str
+    role: str
+    path: str
+    method: str = 'GET'
+    # Called with a sequence number, so that submissions can be made unique
+    data: Callable[[int], dict] | None = None
+    variant: str = ''
+
+    @property
+    def key(self) -> str:
+        return ' '.join(filter(None, [self.route, self.variant, self.method, self.role]))
+
+
+@dataclass
+class Client:
+    """
+    An HTTP client that doesn't follow redirects, so each measurement covers
+    exactly one request. Anonymous clients keep no cookies besides the CSRF
+    token, so submitting the login form doesn't log them in for later requests.
+    """
+    base_url: str
+    jar: http.cookiejar.CookieJar | None = None
+    csrf_token: str = ''
+    opener: urllib.request.OpenerDirector = field(init=False)
+
+    def __post_init__(self):
+        handlers = [NoRedirect()]
+        if self.jar is not None:
+            handlers.append(urllib.request.HTTPCookieProcessor(self.jar))
+        self.opener = urllib.request.build_opener(*handlers)
+
+    def request(self, method: str, path: str, data: dict | None = None) -> int:
+        headers = {'X-CSRFToken': self.csrf_token, 'Referer': self.base_url}
+        if self.jar is None:
+            headers['Cookie'] = f'csrftoken={self.csrf_token}'
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        request = urllib.request.Request(self.base_url + path, data=body, method=method, headers=headers)
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            error.read()
+            return error.code
+
+    def fetch_csrf_token(self) -> None:
+        jar = self.jar if self.jar is not None else http.cookiejar.CookieJar()
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+        opener.open(self.base_url + '/login/', timeout=60).read()
+        self.csrf_token = next(cookie.value for cookie in jar if cookie.name == 'csrftoken')
+
+    def login(self, username: str) -> None:
+        self.fetch_csrf_token()
+        status = self.request('POST', '/login/', {'username': username, 'password': PASSWORD})
+        if status != 302:
+            raise RuntimeError(f'Logging in as {username} failed with status {status}.')
+        # Logging in rotates the CSRF token
+        self.csrf_token = next(cookie.value for cookie in self.jar if cookie.name == 'csrftoken')
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def manage(env: dict, *args: str, **kwargs) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, str(BASE_DIR / 'manage.py'), *args], env=env, check=True,
+                          cwd=BASE_DIR, **kwargs)
+
+
+def prepare_database(env: dict, options: argparse.Namespace) -> None:
+    """
+    Generates the dataset into a new database file. An existing --database is
+    only reused, never overwritten, as it may hold somebody's data.
+    """
+    if options.database and Path(options.database).exists():
+        if not options.reuse:
+            raise SystemExit(f'{options.database} already exists, pass --reuse to benchmark it '
+                             'or choose a new file.')
+        print(f'Reusing {options.database}')
+        return
+    print(f'Generating a dataset with {options.users} users in {env["SQLITE_PATH"]}')
+    manage(env, 'migrate', '--verbosity', '0')
+    manage(env, 'generate_dataset', '--users', str(options.users), '--seed', str(options.seed),
+           stdout=subprocess.DEVNULL)
+
+
+def start_server(env: dict, port: int, server_type: str) -> subprocess.Popen:
+    if server_type == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', 'iemacies.asgi:application', '--host', '127.0.0.1',
+                   '--port', str(port)]
+    else:
+        command = [sys.executable, str(BASE_DIR / 'manage.py'), 'runserver', f'127.0.0.1:{port}', '--noreload']
+    server = subprocess.Popen(command, env=env, cwd=BASE_DIR, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return server
+        except OSError:
+            if server.poll() is not None:
+                raise RuntimeError('The server exited before accepting connections.')
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('The server did not start within a minute.')
+
+
+def pick_objects() -> dict:
+    """
+    Picks objects from the generated dataset for the scenarios: a review whose
+    reviewer has an ongoing application to the reviewed advert, so that the
+    student and the teacher can chat with each other.
+    """
+    from django.db.models import F
+    from main.models import Application, Review
+
+    review = Review.objects.select_related('advert__owner', 'advert__subject', 'reviewer').filter(
+        advert__applications__applicant=F('reviewer'),
+        advert__applications__status=Application.Status.ONGOING,
+    ).first()
+    if review is None:
+        raise RuntimeError('The dataset has no reviewed ongoing application, generate more users.')
+    application = Application.objects.get(advert=review.advert, applicant=review.reviewer)
+    return {
+        'student': review.reviewer,
+        'teacher': review.advert.owner,
+        'advert': review.advert,
+        'subject': review.advert.subject,
+        'application': application,
+        'review': review,
+    }
+
+
+def build_scenarios(objects: dict) -> list[Scenario]:
+    student, teacher = objects['student'], objects['teacher']
+    advert, subject = objects['advert'], objects['subject']
+    application, review = objects['application'], objects['review']
+    advert_form = {
+        'subject': subject.id, 'description': advert.description, 'price': advert.price,
+        'is_active': 'on' if advert.is_active else '',
+    }
+    return [
+        Scenario('home', 'anonymous', '/'),
+        Scenario('login', 'anonymous', '/login/'),
+        Scenario('login', 'anonymous', '/login/', 'POST',
+                 lambda i: {'username': student.username, 'password': PASSWORD}),
+        Scenario('register', 'anonymous', '/register/'),
+        Scenario('register', 'anonymous', '/register/', 'POST',
+                 lambda i: {'username': f'bench{os.getpid()}x{i}', 'password1': 'bench-Pass-123',
+                            'password2': 'bench-Pass-123'}),
+        Scenario('logout', 'anonymous', '/logout/'),
+        Scenario('profile_detail', 'anonymous', f'/profile/{teacher.profile.id}'),
+        Scenario('profile_detail', 'student', f'/profile/{student.profile.id}'),
+        Scenario('profile_detail', 'teacher', f'/profile/{teacher.profile.id}'),
+        Scenario('profile_update', 'student', f'/profile/{student.profile.id}/update'),
+        Scenario('profile_update', 'student', f'/profile/{student.profile.id}/update', 'POST',
+                 lambda i: {'username': student.username, 'full_name': f'Student {i}',
+                            'description': student.profile.description}),
+        Scenario('chat_list', 'student', '/chat/'),
+        Scenario('chat_detail', 'student', f'/chat/{teacher.id}'),
+        Scenario('chat_detail', 'student', f'/chat/{teacher.id}', 'POST', lambda i: {'message': f'Message {i}'}),
+        Scenario('chat_poll', 'student', f'/chat/{teacher.id}/poll?after=0&timeout=0'),
+        Scenario('advert_list', 'anonymous', '/advert/'),
+        Scenario('advert_list', 'anonymous', f'/advert/?subject={subject.id}&min_rating=5&sort=rating',
+                 variant='filtered'),
+        Scenario('advert_list', 'student', '/advert/'),
+        Scenario('advert_create', 'teacher', '/advert/create'),
+        Scenario('advert_create', 'teacher', f'/advert/create/{subject.id}', variant='subject'),
+        Scenario('advert_create', 'teacher', '/advert/create', 'POST', lambda i: advert_form),
+        Scenario('advert_detail', 'anonymous', f'/advert/{advert.id}'),
+        Scenario('advert_detail', 'student', f'/advert/{advert.id}'),
+        Scenario('advert_update', 'teacher', f'/advert/{advert.id}/update'),
+        Scenario('advert_update', 'teacher', f'/advert/{advert.id}/update', 'POST', lambda i: advert_form),
+        Scenario('application_create', 'student', f'/application/create/{advert.id}'),
+        Scenario('application_create', 'student', f'/application/create/{advert.id}', 'POST',
+                 lambda i: {'description': application.description}),
+        Scenario('application_detail', 'student', f'/application/{application.id}'),
+        Scenario('application_detail', 'teacher', f'/application/{application.id}', 'POST',
+                 lambda i: {'status': application.status}),
+        Scenario('application_update', 'student', f'/application/{application.id}/update'),
+        Scenario('application_update', 'student', f'/application/{application.id}/update', 'POST',
+                 lambda i: {'description': application.description}),
+        Scenario('review_create', 'student', f'/review/create/{advert.id}'),
+        Scenario('review_create', 'student', f'/review/create/{advert.id}', 'POST',
+                 lambda i: {'rating': review.rating, 'review': review.review}),
+        Scenario('review_detail', 'anonymous', f'/review/{review.id}'),
+        Scenario('review_update', 'student', f'/review/{review.id}/update'),
+        Scenario('review_update', 'student', f'/review/{review.id}/update', 'POST',
+                 lambda i: {'rating': review.rating, 'review': review.review}),
+        Scenario('subject_list', 'anonymous', '/subject/'),
+        Scenario('subject_list', 'anonymous', '/subject/?query=algebra', variant='search'),
+        Scenario('subject_detail', 'anonymous', f'/subject/{subject.id}'),
+        Scenario('api_list', 'anonymous', '/api/adverts/?page_size=500'),
+        Scenario('api_list', 'anonymous', f'/api/reviews/?advert={advert.id}&fields=id,rating,reviewer_username',
+                 variant='filtered'),
+        Scenario('api_detail', 'anonymous', f'/api/adverts/{advert.id}'),
+        Scenario('api_bulk', 'anonymous', '/api/adverts/bulk?ids=' + ','.join(
+            str(advert_id) for advert_id in range(advert.id, advert.id + 500))),
+    ]
+
+
+def check_coverage(scenarios: list[Scenario]) -> None:
+    from main.urls import urlpatterns
+
+    missing = {pattern.name for pattern in urlpatterns} - {scenario.route for scenario in scenarios}
+    if missing:
+        raise RuntimeError(f'Routes without a benchmark scenario: {", ".join(sorted(missing))}')
+
+
+def run_scenario(scenario: Scenario, client: Client, options: argparse.Namespace) -> dict:
+    sequence = count()
+
+    def send() -> tuple[float, int]:
+        data = scenario.data(next(sequence)) if scenario.data else None
+        start = time.perf_counter()
+        status = client.request(scenario.method, scenario.path, data)
+        return (time.perf_counter() - start) * 1000, status
+
+    for _ in range(options.warmup):
+        send()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(options.concurrency) as executor:
+        results = list(executor.map(lambda _: send(), range(options.requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in results)
+    percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    statuses = sorted({status for _, status in results})
+    return {
+        'requests': len(results),
+        'errors': sum(status >= 400 for _, status in results),
+        'statuses': statuses,
+        'throughput_rps': len(results) / elapsed,
+        'mean_ms': statistics.fmean(latencies),
+        'p50_ms': percentiles[49],
+        'p95_ms': percentiles[94],
+        'p99_ms': percentiles[98],
+    }
+
+
+def compare(results: dict, baseline_path: str) -> None:
+    baseline = json.loads(Path(baseline_path).read_text())['routes']
+    print(f'\n{"route":60} {"p50 ms":>16} {"p95 ms":>16} {"req/s":>16}')
+    for key, current in results['routes'].items():
+        previous = baseline.get(key)
+        if previous is None:
+            print(f'{key:60} {"(new)":>16}')
+            continue
+        cells = []
+        for metric in ('p50_ms', 'p95_ms', 'throughput_rps'):
+            change = (current[metric] - previous[metric]) / previous[metric] * 100 if previous[metric] else 0
+            cells.append(f'{current[metric]:8.1f} {change:+6.1f}%')
+        print(f'{key:60} {" ".join(f"{cell:>16}" for cell in cells)}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000, help='Users in the generated dataset.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database', help='New SQLite file for the dataset, a temporary file by default.')
+    parser.add_argument('--reuse', action='store_true', help='Benchmark an existing --database file as it is.')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario.')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients per scenario.')
+    parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per scenario.')
+    parser.add_argument('--server', choices=['wsgi', 'asgi'], default='wsgi',
+                        help='Serve with the WSGI development server or with uvicorn and the async views.')
+    parser.add_argument('--only', help='Only run scenarios whose key contains this text.')
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--compare', help='Compare the results with a previous JSON file.')
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = {**os.environ, 'SQLITE_PATH': options.database or os.path.join(directory, 'benchmark.sqlite3')}
+        prepare_database(env, options)
+
+        os.environ['SQLITE_PATH'] = env['SQLITE_PATH']
+        setup_django()
+        objects = pick_objects()
+        scenarios = build_scenarios(objects)
+        check_coverage(scenarios)
+        if options.only:
+            scenarios = [scenario for scenario in scenarios if options.only in scenario.key]
+
+        port = free_port()
+        server = start_server(env, port, options.server)
+        try:
+            base_url = f'http://127.0.0.1:{port}'
+            clients = {'anonymous': Client(base_url)}
+            clients['anonymous'].fetch_csrf_token()
+            for role in ('student', 'teacher'):
+                clients[role] = Client(base_url, http.cookiejar.CookieJar())
+                clients[role].login(objects[role].username)
+
+            results = {
+                'meta': {
+                    'created_at': datetime.now(timezone.utc).isoformat(),
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'users': options.users,
+                    'seed': options.seed,
+                    'requests': options.requests,
+                    'concurrency': options.concurrency,
+                    'server': options.server,
+                },
+                'routes': {},
+            }
+            for scenario in scenarios:
+                stats = run_scenario(scenario, clients[scenario.role], options)
+                results['routes'][scenario.key] = stats
+                print(f'{scenario.key:60} {stats["throughput_rps"]:8.1f} req/s  p50 {stats["p50_ms"]:7.1f} ms  '
+                      f'p95 {stats["p95_ms"]:7.1f} ms  p99 {stats["p99_ms"]:7.1f} ms  statuses {stats["statuses"]}')
+        finally:
+            server.terminate()
+            server.wait()
+
+    if options.output:
+        Path(options.output).write_text(json.dumps(results, indent=2))
+        print(f'\nResults written to {options.output}')
+    if options.compare:
+        compare(results, options.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Measures how the recommendation build scales with the dataset size.
+
+For every user count a dataset is generated in a throwaway database and the
+build is timed by phase: reading the applications, computing the neighbours
+and the full rebuild including storing the rows. `--synthetic` also times the
+computation alone on random applications, to reach millions of rows without
+generating them in the database. Peak memory is traced for the computation.
+
+Usage:
+    python benchmarks/recommendation_benchmark.py [--users 1000 5000 20000] [--synthetic 1000000 5000000]
+                                                  [--chunk-pairs 5000000]
+"""
+import argparse
+import time
+import tracemalloc
+from io import StringIO
+
+from common import setup_django, test_database
+
+
+def compute(data: dict, chunk_pairs: int) -> tuple[int, float, float]:
+    """
+    Computes the advert and subject neighbours without storing them.
+
+    Returns:
+        tuple[int, float, float]: The number of neighbours, the elapsed
+            seconds and the peak traced memory in MB.
+    """
+    from main import recommendations
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    rows = 0
+    for users, items, candidates in [(data['students'], data['adverts'], data['active']),
+                                     (data['subject_students'], data['subjects'], None)]:
+        for chunk in recommendations.top_neighbours(users, items, candidates=candidates, chunk_pairs=chunk_pairs):
+            rows += len(chunk[0])
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return rows, elapsed, peak
+
+
+def synthetic_data(applications: int, seed: int) -> dict:
+    """
+    Random applications with three per student, ten per advert and twenty
+    adverts per subject, like the generated datasets.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    students = rng.integers(0, max(1, applications // 3), applications)
+    adverts = rng.integers(0, max(1, applications // 10), applications)
+    return {'students': students, 'adverts': adverts, 'subject_students': students, 'subjects': adverts // 20,
+            'active': None}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, nargs='*', default=[1000, 5000, 20000])
+    parser.add_argument('--synthetic', type=int, nargs='*', default=[],
+                        help='Numbers of random applications to time the computation with.')
+    parser.add_argument('--chunk-pairs', type=int, help='Co-application pairs computed at a time.')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.core.management import call_command
+
+    from main import recommendations
+    from main.models import Application
+
+    chunk_pairs = args.chunk_pairs or recommendations.CHUNK_PAIRS
+    print(f'{"dataset":<24}{"applications":>14}{"load":>10}{"compute":>10}{"rebuild":>10}'
+          f'{"neighbours":>12}{"peak MB":>10}')
+
+    for users in args.users:
+        with test_database():
+            call_command('generate_dataset', '--users', str(users), '--seed', str(args.seed), '--workers', '1',
+                         '--max-messages', '1', '--skip-rebuild', stdout=StringIO())
+            applications = Application.objects.count()
+
+            started = time.perf_counter()
+            data = recommendations.load_applications()
+            load = time.perf_counter() - started
+            rows, elapsed, peak = compute(data, chunk_pairs)
+            started = time.perf_counter()
+            recommendations.rebuild(chunk_pairs=chunk_pairs)
+            rebuild = time.perf_counter() - started
+        print(f'{f"{users} users":<24}{applications:>14}{load:>9.2f}s{elapsed:>9.2f}s{rebuild:>9.2f}s'
+              f'{rows:>12}{peak:>10.1f}')
+
+    for applications in args.synthetic:
+        rows, elapsed, peak = compute(synthetic_data(applications, args.seed), chunk_pairs)
+        print(f'{"synthetic":<24}{applications:>14}{"":>10}{elapsed:>9.2f}s{"":>10}{rows:>12}{peak:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Compares the full-text subject search with the icontains search it replaced.
+
+Usage: python benchmarks/search_benchmark.py [--subjects 100000] [--repeat 20]
+"""
+import argparse
+import random
+
+from common import setup_django, test_database, time_call
+
+WORDS = [
+    'algebra', 'analysis', 'biology', 'calculus', 'chemistry', 'geometry', 'history',
+    'literature', 'mechanics', 'physics', 'programming', 'statistics', 'economics',
+    'linear', 'organic', 'modern', 'applied', 'theoretical', 'introduction', 'advanced',
+    'vectors', 'matrices', 'reactions', 'cells', 'forces', 'energy', 'markets', 'proofs',
+]
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'tu', 'ra', 'si', 'vo', 'de', 'pa', 'ri', 'gu']
+
+QUERIES = ['algebra', 'linear algebra', 'organic chem', 'quantum', 'advanced statistics']
+
+
+def vocabulary(rng: random.Random, size: int = 20_000) -> tuple[list[str], list[float]]:
+    """
+    Returns the subject words and synthetic filler words with Zipf-like
+    weights, so that query selectivity resembles real text.
+    """
+    words = WORDS + [''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(size)]
+    weights = [1 / (rank + 10) for rank in range(len(words))]
+    rng.shuffle(weights)
+    return words, weights
+
+
+def populate(subject_count: int, seed: int) -> None:
+    from main import search
+    from main.models import Subject
+
+    rng = random.Random(seed)
+    words, weights = vocabulary(rng)
+    batch = []
+    for i in range(subject_count):
+        batch.append(Subject(
+            title=' '.join(rng.choices(words, weights, k=3)).title(),
+            description=' '.join(rng.choices(words, weights, k=30)),
+        ))
+        if len(batch) == 5000:
+            Subject.objects.bulk_create(batch)
+            batch = []
+    Subject.objects.bulk_create(batch)
+    search.rebuild(batch_size=5000)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--subjects', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.db.models import Q
+
+    from main import search
+    from main.models import Subject
+
+    with test_database() as connection:
+        print(f'Populating {args.subjects} subjects ({connection.vendor})...')
+        populate(args.subjects, args.seed)
+
+        print(f'{"query":<22}{"title icontains":>18}{"title+desc icontains":>22}{"full-text":>12}')
+        for query in QUERIES:
+            title_only = time_call(lambda: list(Subject.objects.filter(
+                title__icontains=query).values_list('id', flat=True)[:args.limit]), args.repeat)
+            both = time_call(lambda: list(Subject.objects.filter(
+                Q(title__icontains=query) | Q(description__icontains=query)
+            ).values_list('id', flat=True)[:args.limit]), args.repeat)
+            full_text = time_call(lambda: search.search_subject_ids(query, args.limit), args.repeat)
+            print(f'{query:<22}{title_only["median_ms"]:>16.2f}ms'
+                  f'{both["median_ms"]:>20.2f}ms{full_text["median_ms"]:>10.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Measures the similar adverts index on synthetic descriptions.
+
+For every advert count an index is built from random Zipf-like descriptions
+into a temporary folder, then the queries of random adverts are timed, before
+and after appending updated adverts. Recall is the share of the exact top
+adverts found, scoring every advert sharing a word instead of the candidates.
+The database isn't used.
+
+Usage:
+    python benchmarks/similar_benchmark.py [--adverts 100000 500000] [--queries 1000] [--updates 10000]
+                                           [--recall-queries 50]
+"""
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from common import setup_django
+from search_benchmark import vocabulary
+
+SUBJECTS = 2000
+
+
+def descriptions(count: int, seed: int):
+    """
+    Yields (id, description, subject title) rows with 10 to 60 words each.
+    """
+    import numpy as np
+
+    words, weights = vocabulary(random.Random(seed), size=50_000)
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(10, 61, count)
+    chosen = rng.choice(len(words), size=int(lengths.sum()), p=np.array(weights) / sum(weights))
+    subjects = rng.integers(0, SUBJECTS, count)
+    ends = np.cumsum(lengths)
+    for advert_id, start, end, subject in zip(range(1, count + 1), ends - lengths, ends, subjects):
+        yield advert_id, ' '.join(words[word] for word in chosen[start:end]), f'Subject {subject}'
+
+
+def time_queries(index, advert_ids: list[int]) -> dict[str, float]:
+    timings = []
+    for advert_id in advert_ids:
+        started = time.perf_counter()
+        index.similar(advert_id)
+        timings.append((time.perf_counter() - started) * 1000)
+    percentiles = statistics.quantiles(timings, n=100)
+    return {'median_ms': statistics.median(timings), 'p95_ms': percentiles[94], 'max_ms': max(timings)}
+
+
+def recall(index, advert_ids: list[int]) -> float:
+    from main import similar
+
+    found = [set(advert_id for advert_id, _ in index.similar(advert_id)) for advert_id in advert_ids]
+    budget, candidates = similar.POSTINGS_BUDGET, similar.CANDIDATES
+    similar.POSTINGS_BUDGET, similar.CANDIDATES = len(index.term_rows), len(index.ids)
+    try:
+        exact = [set(advert_id for advert_id, _ in index.similar(advert_id)) for advert_id in advert_ids]
+    finally:
+        similar.POSTINGS_BUDGET, similar.CANDIDATES = budget, candidates
+    return sum(len(a & b) for a, b in zip(found, exact)) / max(sum(len(b) for b in exact), 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--adverts', type=int, nargs='*', default=[100_000, 500_000])
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--updates', type=int, default=10_000, help='Adverts appended as updates.')
+    parser.add_argument('--recall-queries', type=int, default=50, help='Queries compared with exact scoring.')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from main import similar
+
+    print(f'{"adverts":>10}{"build":>10}{"size MB":>10}{"query":>10}{"median":>10}{"p95":>10}{"max":>10}{"recall":>10}')
+    for count in args.adverts:
+        with tempfile.TemporaryDirectory() as directory:
+            started = time.perf_counter()
+            name = similar.write_index(Path(directory), descriptions(count, args.seed))
+            build = time.perf_counter() - started
+            folder = Path(directory) / name
+            size = sum(path.stat().st_size for path in folder.iterdir()) / 2 ** 20
+
+            index = similar.SimilarIndex(folder)
+            rng = random.Random(args.seed)
+            queried = rng.sample(range(1, count + 1), min(args.queries, count))
+            index.similar(queried[0])
+            timings = time_queries(index, queried)
+            found = recall(index, queried[:args.recall_queries])
+            print(f'{count:>10}{build:>9.1f}s{size:>10.1f}{"built":>10}{timings["median_ms"]:>8.2f}ms'
+                  f'{timings["p95_ms"]:>8.2f}ms{timings["max_ms"]:>8.2f}ms{found:>10.3f}')
+
+            # Updated adverts are appended, then read by the next query
+            started = time.perf_counter()
+            for advert_id, text, title in descriptions(args.updates, args.seed + 1):
+                index.append(rng.randrange(1, count + 1), similar.vectorise(similar.term_counts(text, title),
+                                                                            index.idf))
+            index.refresh()
+            index.similar(queried[0])
+            update = (time.perf_counter() - started) * 1000 / max(args.updates, 1)
+            timings = time_queries(index, queried)
+            print(f'{"":>10}{f"{update:.2f}ms":>10}{"":>10}{"updated":>10}{timings["median_ms"]:>8.2f}ms'
+                  f'{timings["p95_ms"]:>8.2f}ms{timings["max_ms"]:>8.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -9,8 +9,18 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'iemacies.settings')
+os.environ.setdefault('ASYNC_VIEWS', 'true')
+# The sync code of each ASGI request runs in its own thread, so persistent
+# connections would pile up instead of being reused
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
+
+# Like runserver, serve the static files while developing
+if settings.DEBUG:
+    application = ASGIStaticFilesHandler(application)
@@ -54,6 +54,8 @@ TAILWIND_APP_NAME = 'theme'
 NPM_BIN_PATH = os.environ.get('NPM_BIN_PATH', 'npm')
 
 MIDDLEWARE = [
+    'main.middleware.PerformanceMiddleware',
+    'main.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -67,7 +69,7 @@ ROOT_URLCONF = 'iemacies.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'main.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -76,6 +78,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'main.context_processors.unread_messages',
+                'main.context_processors.viewer_role',
             ],
         },
     },
@@ -83,25 +87,123 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'iemacies.wsgi.application'
 
+# Serve the async versions of the read-heavy views, enabled by default by the
+# ASGI entry point
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'false').lower() == 'true'
+
+
+# Performance instrumentation
+# Timings are sent in Server-Timing headers, requests slower than the threshold
+# are logged with their slowest SQL statements. The headers expose the queries
+# of every page to any client, so deployments enable them explicitly
+
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'false').lower() == 'true'
+SLOW_REQUEST_THRESHOLD_MS = float(os.environ.get('SLOW_REQUEST_THRESHOLD_MS', 500))
+SLOW_REQUEST_LOGGED_QUERIES = 5
+# Long polling requests are slow by design
+SLOW_REQUEST_IGNORED_URLS = ['chat_poll']
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'main.performance': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+        'main.database': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
+# * Set DB_ENGINE="postgresql" and the DB_* variables in .env to use postgresql
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+# Seconds a connection is reused by the following requests, 0 closes it after
+# every request (the ASGI entry point defaults to 0)
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME'),
+            'USER': os.environ.get('DB_USER'),
+            'PASSWORD': os.environ.get('DB_PASSWORD'),
+            'HOST': os.environ.get('DB_HOST'),
+            'PORT': os.environ.get('DB_PORT'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            # Reused connections are checked before the first query of a request
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'connect_timeout': 5},
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'main.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        }
+    }
+
+# Applied to every new SQLite connection by main.backends.sqlite3
+SQLITE_PRAGMAS = {
+    # Readers don't block the writer and the writer doesn't block readers
+    'journal_mode': 'WAL',
+    # Only the last commits can be lost on power loss in WAL mode
+    'synchronous': 'NORMAL',
+    # Milliseconds a connection waits for the write lock
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+# Read replicas, a comma separated list of SQLite files (or hosts for
+# postgresql). Safe requests read from a random replica, unsafe requests and
+# the user's requests in the following seconds use the primary (see
+# main/routers.py)
+DATABASE_REPLICAS = []
+for index, replica in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica_{index}'] = {**DATABASES['default'],
+                                     'HOST' if DB_ENGINE == 'postgresql' else 'NAME': replica.strip(),
+                                     'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica_{index}')
+
+DATABASE_ROUTERS = ['main.routers.PrimaryReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+REPLICA_STICKY_COOKIE = 'read_primary'
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# * Cached data is invalidated on writes, so deployments running several
+# * processes need a shared backend (for example redis or memcached)
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-        # * Uncomment the following lines and comment the ones above to use postgresql
-        # 'ENGINE': 'django.db.backends.postgresql',
-        # 'NAME':os.environ.get('DB_NAME'),
-        # 'USER':os.environ.get('DB_USER'),
-        # 'PASSWORD':os.environ.get('DB_PASSWORD'),
-        # 'HOST':os.environ.get('DB_HOST'),
-        # 'PORT':os.environ.get('DB_PORT'),
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'iemacies'),
     }
 }
 
 
+# Rendered advert rows are keyed on object versions, so they can be kept long
+FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('FRAGMENT_CACHE_TIMEOUT', 60 * 60 * 24))
+
+# Pages served to anonymous visitors are purged when the objects they show
+# change, the timeout only bounds how long unused pages are kept. 0 disables
+# the page cache
+PAGE_CACHE_TIMEOUT = int(os.environ.get('PAGE_CACHE_TIMEOUT', 60 * 10))
+# Seconds other requests wait for a page being rendered
+PAGE_CACHE_LOCK_TIMEOUT = 10
+
+# Folder of the memory-mapped similar adverts index, written by the
+# `rebuild_similar_adverts` command and shared by all processes
+SIMILAR_ADVERTS_DIR = os.environ.get('SIMILAR_ADVERTS_DIR', BASE_DIR / 'similar_adverts')
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -1,10 +1,30 @@
+from django import forms
 from django.contrib import admin
 
-from main.models import Profile, Chat, Advert, Application, Review, Subject
+from main.models import Profile, Chat, Advert, Application, Review, Subject, SubjectClosure
+
+
+class SubjectAdminForm(forms.ModelForm):
+    class Meta:
+        model = Subject
+        fields = '__all__'
+
+    def clean_sub_subjects(self):
+        sub_subjects = self.cleaned_data['sub_subjects']
+        if self.instance.pk and SubjectClosure.creates_cycle(
+                self.instance.pk, [subject.pk for subject in sub_subjects]):
+            raise forms.ValidationError(
+                'A subject cannot depend on itself, directly or through its sub-subjects.')
+        return sub_subjects
+
+
+@admin.register(Subject)
+class SubjectAdmin(admin.ModelAdmin):
+    form = SubjectAdminForm
+
 
 admin.site.register(Profile)
 admin.site.register(Chat)
 admin.site.register(Advert)
 admin.site.register(Application)
 admin.site.register(Review)
-admin.site.register(Subject)
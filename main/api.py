@@ -0,0 +1,217 @@
+"""
+Read-only JSON API for subjects, adverts, reviews and profiles.
+
+Every resource lists its public fields, and every endpoint runs a single
+`values()` query selecting only the requested fields, so no model instances
+are created. Fields of related rows are joined into the same query.
+
+    GET api/<resource>/?fields=id,title&page_size=100&cursor=...
+    GET api/<resource>/<id>?fields=...
+    GET api/<resource>/bulk?ids=1,2,3&fields=...
+
+Lists are ordered by id and paginated by keyset, following `next_cursor`.
+"""
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Callable
+
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.http import HttpRequest, JsonResponse
+
+from main.models import Profile, Advert, Review, Subject
+from main.pagination import DEFAULT_PAGE_SIZE, paginate_keyset
+
+MAX_PAGE_SIZE = 500
+MAX_BULK_IDS = 500
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+@dataclass(frozen=True)
+class Resource:
+    queryset: Callable[[], models.QuerySet]
+    fields: tuple[str, ...]
+    # Fields read from related rows, by their lookup
+    related: dict[str, str] = field(default_factory=dict)
+    # Query parameters filtering the lists, by their lookup
+    filters: dict[str, str] = field(default_factory=dict)
+
+
+RESOURCES = {
+    'subjects': Resource(
+        queryset=lambda: Subject.objects.all(),
+        fields=('id', 'title', 'description', 'created_at', 'updated_at'),
+    ),
+    'adverts': Resource(
+        queryset=lambda: Advert.objects.filter(is_active=True).with_listing_data(),
+        fields=('id', 'description', 'price', 'created_at', 'updated_at', 'owner', 'owner_username', 'subject',
+                'subject_title', 'review_count', 'rating_sum', 'average_rating', 'rating_histogram'),
+        related={'owner_username': 'owner__username', 'subject_title': 'subject__title'},
+        filters={'subject': 'subject', 'owner': 'owner'},
+    ),
+    'reviews': Resource(
+        queryset=lambda: Review.objects.all(),
+        fields=('id', 'review', 'rating', 'created_at', 'updated_at', 'advert', 'reviewer', 'reviewer_username'),
+        related={'reviewer_username': 'reviewer__username'},
+        filters={'advert': 'advert', 'reviewer': 'reviewer'},
+    ),
+    'profiles': Resource(
+        queryset=lambda: Profile.objects.all(),
+        fields=('id', 'user', 'username', 'full_name', 'description', 'role'),
+        related={'username': 'user__username'},
+        filters={'role': 'role'},
+    ),
+}
+
+
+class ApiError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def api_view(view):
+    """
+    Looks up the resource of the request and answers errors as JSON. The API
+    is read-only, so only GET and HEAD requests are allowed.
+    """
+    @wraps(view)
+    def wrapper(request: HttpRequest, resource: str, *args, **kwargs) -> JsonResponse:
+        try:
+            if request.method not in SAFE_METHODS:
+                raise ApiError(f'Method not allowed: {request.method}', status=405)
+            if resource not in RESOURCES:
+                raise ApiError(f'Unknown resource: {resource}', status=404)
+            return view(request, RESOURCES[resource], *args, **kwargs)
+        except ApiError as e:
+            response = JsonResponse({'error': str(e)}, status=e.status)
+            if e.status == 405:
+                response['Allow'] = ', '.join(SAFE_METHODS)
+            return response
+
+    return wrapper
+
+
+def parse_int(value: str, name: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        raise ApiError(f'{name} must be an integer') from None
+
+
+def selected_fields(request: HttpRequest, resource: Resource) -> list[str]:
+    """
+    Returns the fields requested with the `fields` parameter, all by default.
+    """
+    if not request.GET.get('fields'):
+        return list(resource.fields)
+    names = list(dict.fromkeys(name.strip() for name in request.GET['fields'].split(',') if name.strip()))
+    unknown = [name for name in names if name not in resource.fields]
+    if unknown:
+        raise ApiError(f'Unknown fields: {", ".join(unknown)}')
+    return names
+
+
+def select(queryset: models.QuerySet, resource: Resource, names: list[str]) -> models.QuerySet:
+    """
+    Selects the given fields as dictionaries keyed by the field names. The id
+    is always selected, for the cursors and bulk lookups.
+    """
+    plain = [name for name in names if name not in resource.related]
+    if 'id' not in plain:
+        plain.append('id')
+    related = {name: models.F(resource.related[name]) for name in names if name in resource.related}
+    return queryset.values(*plain, **related)
+
+
+def serialise(rows: list[dict], names: list[str]) -> list[dict]:
+    if 'id' in names:
+        return rows
+    for row in rows:
+        del row['id']
+    return rows
+
+
+@api_view
+def apiList(request: HttpRequest, resource: Resource) -> JsonResponse:
+    """
+    View function that returns a page of a resource ordered by id, with the
+    cursors of the neighbouring pages. The resource's filters are applied
+    from the query parameters.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        resource (Resource): The listed resource.
+
+    Returns:
+        JsonResponse: The rows of the page and the cursors.
+    """
+    names = selected_fields(request, resource)
+    page_size = parse_int(request.GET.get('page_size', DEFAULT_PAGE_SIZE), 'page_size')
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise ApiError(f'page_size must be between 1 and {MAX_PAGE_SIZE}')
+
+    queryset = resource.queryset()
+    try:
+        queryset = queryset.filter(**{lookup: request.GET[name] for name, lookup in resource.filters.items()
+                                      if name in request.GET})
+    except (ValueError, ValidationError):
+        raise ApiError(f'Invalid filter, the filters are: {", ".join(resource.filters)}') from None
+
+    page = paginate_keyset(select(queryset, resource, names), request.GET.get('cursor'), ordering=('id',),
+                           per_page=page_size)
+    # The cursors are built before the ids are dropped
+    return JsonResponse({
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+        'results': serialise(page.object_list, names),
+    })
+
+
+@api_view
+def apiDetail(request: HttpRequest, resource: Resource, pk: int) -> JsonResponse:
+    """
+    View function that returns a single row of a resource.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        resource (Resource): The resource of the row.
+        pk (int): The primary key of the row.
+
+    Returns:
+        JsonResponse: The row, or an error with status 404.
+    """
+    names = selected_fields(request, resource)
+    rows = list(select(resource.queryset().filter(pk=pk), resource, names))
+    if not rows:
+        raise ApiError('Not found', status=404)
+    return JsonResponse(serialise(rows, names)[0])
+
+
+@api_view
+def apiBulk(request: HttpRequest, resource: Resource) -> JsonResponse:
+    """
+    View function that returns the rows of a resource with the ids given in
+    the comma separated `ids` parameter, in the requested order.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        resource (Resource): The resource of the rows.
+
+    Returns:
+        JsonResponse: The found rows and the ids that weren't found.
+    """
+    names = selected_fields(request, resource)
+    ids = list(dict.fromkeys(parse_int(value, 'ids') for value in request.GET.get('ids', '').split(',')
+                             if value.strip()))
+    if not ids:
+        raise ApiError('ids is required')
+    if len(ids) > MAX_BULK_IDS:
+        raise ApiError(f'At most {MAX_BULK_IDS} ids can be fetched at once')
+
+    rows = {row['id']: row for row in select(resource.queryset().filter(pk__in=ids), resource, names)}
+    found = [rows[pk] for pk in ids if pk in rows]
+    return JsonResponse({
+        'results': serialise(found, names),
+        'missing': [pk for pk in ids if pk not in rows],
+    })
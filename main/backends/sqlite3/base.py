@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite backend for serving concurrent requests. New connections apply
+    `SQLITE_PRAGMAS` (WAL journal, busy timeout, mmap), and transactions start
+    with BEGIN IMMEDIATE. A deferred transaction that reads before writing
+    fails at once with "database is locked" when another connection wrote in
+    between, while an immediate one waits for the lock up to the busy timeout.
+    """
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
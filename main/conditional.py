@@ -0,0 +1,239 @@
+"""
+Conditional GET support for the detail pages.
+
+A validator function reads a version of everything a page shows with a single
+query of aggregates: the newest `updated_at` and the number of the object's
+dependent rows, and the versions of its reviews and rankings. Two versions are
+kept outside the database: the names version, bumped whenever a user or a
+subject is renamed, as pages show many usernames and subject titles without a
+timestamp of their own, and the version of the similar adverts index.
+
+The ETag hashes the versions together with the viewer's state shown on the
+page (their id, role and unread message count), so owners and other viewers
+revalidate separately. Last-Modified is only sent to anonymous visitors, whose
+pages don't depend on anything else.
+
+The profile page has no timestamp of its own, so anonymous visitors of it only
+get an ETag.
+"""
+import hashlib
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Callable
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib import messages
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Count, Max, Sum
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from main import similar
+from main.context_processors import aload_viewer
+from main.models import Profile, Conversation, Advert, AdvertRanking, AdvertRecommendation, Application, Review, \
+    Subject, SubjectClosure, SubjectRecommendation
+
+Versions = tuple[datetime | None, list] | None
+
+NAMES_KEY = 'conditional:names'
+
+
+def bump_names_version() -> None:
+    """
+    Changes the names version, after a user or a subject was renamed.
+    """
+    def bump() -> None:
+        cache.set(NAMES_KEY, time.time(), timeout=None)
+
+    bump()
+    # Pages validated before the rename is committed still show the old name
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(bump)
+
+
+def names_version() -> tuple[float | None, datetime | None]:
+    version = cache.get(NAMES_KEY)
+    return version, datetime.fromtimestamp(version, tz=timezone.utc) if version else None
+
+
+def viewer_versions(request: HttpRequest) -> list:
+    """
+    Returns the parts of a page that depend on the viewer. The role and
+    unread message count are stored on the request for the context
+    processors, so rendering doesn't query them again.
+    """
+    if not request.user.is_authenticated:
+        return ['anonymous']
+    if not hasattr(request, 'viewer_role'):
+        request.viewer_role = Profile.objects.filter(
+            user=request.user).values_list('role', flat=True).first()
+    if not hasattr(request, 'unread_message_count'):
+        request.unread_message_count = Conversation.objects.unread_total(request.user)
+    return [request.user.pk, request.viewer_role, request.unread_message_count]
+
+
+def newest(*timestamps: datetime | None) -> datetime | None:
+    return max((timestamp for timestamp in timestamps if timestamp is not None), default=None)
+
+
+def conditional_page(validator: Callable[[HttpRequest, int], Versions]):
+    """
+    Answers conditional GET requests of a detail view with 304 Not Modified
+    when the validators still match, without rendering the page. Works with
+    both sync and async views.
+    """
+    def check(request: HttpRequest, pk: int) -> tuple[HttpResponse | None, str | None, int | None]:
+        # Pending messages are shown once, on whichever page comes next
+        if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+            return None, None, None
+        versions = validator(request, pk)
+        if versions is None:
+            return None, None, None
+
+        last_modified, parts = versions
+        parts = [validator.__name__, *parts, *viewer_versions(request)]
+        etag = 'W/"{}"'.format(hashlib.md5(repr(parts).encode()).hexdigest())
+        if last_modified is None or request.user.is_authenticated:
+            timestamp = None
+        else:
+            timestamp = int(last_modified.timestamp())
+        return get_conditional_response(request, etag=etag, last_modified=timestamp), etag, timestamp
+
+    def finish(response: HttpResponse, etag: str | None, timestamp: int | None) -> HttpResponse:
+        if etag and response.status_code == 200:
+            response.headers.setdefault('ETag', etag)
+            if timestamp is not None:
+                response.headers.setdefault('Last-Modified', http_date(timestamp))
+        return response
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request: HttpRequest, pk: int) -> HttpResponse:
+                await aload_viewer(request)
+                response, etag, timestamp = await sync_to_async(check)(request, pk)
+                if response is None:
+                    response = await view(request, pk)
+                return finish(response, etag, timestamp)
+        else:
+            @wraps(view)
+            def wrapper(request: HttpRequest, pk: int) -> HttpResponse:
+                response, etag, timestamp = check(request, pk)
+                if response is None:
+                    response = view(request, pk)
+                return finish(response, etag, timestamp)
+        return wrapper
+
+    return decorator
+
+
+# ------------------------------ Validators ------------------------------------
+#
+# Rows that are only removed or replaced are counted, so deleting a row
+# changes the ETag even though no timestamp moves.
+
+
+def aggregates(queryset: models.QuerySet, **expressions) -> dict[str, models.Subquery]:
+    """
+    Turns aggregates over a queryset into scalar subqueries, so that all the
+    versions of a page are read with a single query.
+    """
+    whole = queryset.order_by().annotate(whole=models.Value(1)).values('whole')
+    return {name: models.Subquery(whole.annotate(**{name: expression}).values(name))
+            for name, expression in expressions.items()}
+
+
+def advert_detail(request: HttpRequest, pk: int) -> Versions:
+    """
+    The advert with its owner and subject, its reviews, the recommended and
+    similar adverts and, for the owner, its applications.
+    """
+    row = Advert.objects.filter(pk=pk).annotate(
+        **aggregates(Review.objects.filter(advert=pk), newest_review=Max('updated_at')),
+        **aggregates(AdvertRecommendation.objects.filter(advert=pk, recommended__is_active=True),
+                     recommendation_count=Count('id'), newest_recommendation=Max('created_at'),
+                     newest_recommended=Max('recommended__updated_at')),
+        **aggregates(Application.objects.filter(advert=pk, advert__owner=request.user.pk),
+                     application_count=Count('id'), newest_application=Max('updated_at')),
+    ).values_list(
+        'updated_at', 'subject__updated_at', 'newest_review', 'newest_recommendation', 'newest_recommended',
+        'newest_application', 'review_version', 'owner_id', 'recommendation_count', 'application_count').first()
+    if row is None:
+        return None
+
+    names, names_changed = names_version()
+    index = similar.index_version()
+    index_changed = datetime.fromtimestamp(index[2], tz=timezone.utc) if index else None
+    return newest(*row[:6], names_changed, index_changed), [*row, names, index]
+
+
+def subject_detail(request: HttpRequest, pk: int) -> Versions:
+    """
+    The subject with its active adverts and their owners, ratings and
+    rankings, the subjects in its prerequisite tree and the recommended
+    subjects.
+    """
+    row = Subject.objects.filter(pk=pk).annotate(
+        # Closure rows are only ever added, removed or shortened
+        **aggregates(SubjectClosure.subject_links(pk),
+                     link_count=Count('id'), last_link=Max('id'), depths=Sum('depth'),
+                     newest_ancestor=Max('ancestor__updated_at'), newest_descendant=Max('descendant__updated_at')),
+        **aggregates(Advert.objects.filter(subject=pk, is_active=True),
+                     advert_count=Count('id'), newest_advert=Max('updated_at'), review_versions=Sum('review_version')),
+        **aggregates(AdvertRanking.objects.filter(subject=pk, is_active=True),
+                     newest_ranking=Max('updated_at'), scores=Sum('score')),
+        **aggregates(SubjectRecommendation.objects.filter(subject=pk),
+                     recommendation_count=Count('id'), newest_recommendation=Max('created_at'),
+                     newest_recommended=Max('recommended__updated_at')),
+    ).values_list(
+        'updated_at', 'newest_ancestor', 'newest_descendant', 'newest_advert', 'newest_ranking',
+        'newest_recommendation', 'newest_recommended', 'link_count', 'last_link', 'depths', 'advert_count',
+        'review_versions', 'scores', 'recommendation_count').first()
+    if row is None:
+        return None
+
+    names, names_changed = names_version()
+    return newest(*row[:7], names_changed), [*row, names]
+
+
+def profile_detail(request: HttpRequest, pk: int) -> Versions:
+    """
+    The profile, which has no timestamp of its own, and for its user their
+    adverts, or their reviews and applications for students.
+    """
+    # Only the profile's owner sees their lists
+    row = Profile.objects.filter(pk=pk).annotate(
+        **aggregates(Advert.objects.filter(owner=request.user.pk, owner__profile=pk),
+                     advert_count=Count('id'), newest_advert=Max('updated_at')),
+        **aggregates(Review.objects.filter(reviewer=request.user.pk, reviewer__profile=pk),
+                     review_count=Count('id'), newest_review=Max('updated_at'),
+                     newest_reviewed=Max('advert__updated_at')),
+        **aggregates(Application.objects.filter(applicant=request.user.pk, applicant__profile=pk),
+                     application_count=Count('id'), newest_application=Max('updated_at'),
+                     newest_applied=Max('advert__updated_at')),
+    ).values_list(
+        'newest_advert', 'newest_review', 'newest_reviewed', 'newest_application', 'newest_applied',
+        'user_id', 'user__username', 'full_name', 'description', 'role', 'advert_count', 'review_count',
+        'application_count').first()
+    if row is None:
+        return None
+
+    if request.user.is_authenticated and request.user.pk == row[5]:
+        request.viewer_role = row[9]
+        names, names_changed = names_version()
+        return newest(*row[:5], names_changed), [*row, names]
+    return None, list(row)
+
+
+def review_detail(request: HttpRequest, pk: int) -> Versions:
+    """
+    The review with the names of its reviewer, advert owner and subject.
+    """
+    review = Review.objects.filter(pk=pk).values_list(
+        'updated_at', 'reviewer__username', 'advert__owner__username', 'advert__subject__updated_at').first()
+    if review is None:
+        return None
+    return newest(review[0], review[3]), [review]
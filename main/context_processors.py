@@ -0,0 +1,63 @@
+from django.http import HttpRequest
+from django.utils.functional import SimpleLazyObject
+
+from main.models import Profile, Conversation
+
+
+def viewer_role(request: HttpRequest) -> dict:
+    """
+    Context processor exposing the viewer's role, read from the stored role
+    on their profile. The role is lazy and resolved at most once per request.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        dict: The context variables.
+    """
+    if not request.user.is_authenticated:
+        return {}
+    if hasattr(request, 'viewer_role'):
+        return {'viewer_role': request.viewer_role}
+
+    def resolve() -> str | None:
+        try:
+            return request.user.profile.role
+        except Profile.DoesNotExist:
+            return None
+    return {'viewer_role': SimpleLazyObject(resolve)}
+
+
+def unread_messages(request: HttpRequest) -> dict:
+    """
+    Context processor exposing the viewer's total unread message count. The
+    count is lazy, so it is only queried when a template actually displays it.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        dict: The context variables.
+    """
+    if not request.user.is_authenticated:
+        return {}
+    if hasattr(request, 'unread_message_count'):
+        return {'unread_message_count': request.unread_message_count}
+    return {'unread_message_count': SimpleLazyObject(lambda: Conversation.objects.unread_total(request.user))}
+
+
+async def aload_viewer(request: HttpRequest) -> None:
+    """
+    Resolves the viewer and the values of the context processors above before
+    an async view renders its template, since queries can't run lazily while
+    rendering in an async context. Does nothing for a viewer already loaded.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+    """
+    request.user = await request.auser()
+    if not request.user.is_authenticated or hasattr(request, 'unread_message_count'):
+        return
+    request.viewer_role = await Profile.objects.filter(
+        user=request.user).values_list('role', flat=True).afirst()
+    request.unread_message_count = await Conversation.objects.aunread_total(request.user)
@@ -0,0 +1,44 @@
+import json
+import logging
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger('main.database')
+
+# Aliases whose settings were already logged by this process
+logged_aliases: set[str] = set()
+
+
+@receiver(connection_created)
+def log_database_settings(sender, connection, **kwargs) -> None:
+    """
+    Logs the effective settings of each database on its first connection, as
+    reported by the database itself rather than read from the settings.
+    """
+    if connection.alias in logged_aliases:
+        return
+    logged_aliases.add(connection.alias)
+
+    details = {
+        'event': 'database_settings',
+        'alias': connection.alias,
+        'vendor': connection.vendor,
+        'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+        'conn_health_checks': connection.settings_dict['CONN_HEALTH_CHECKS'],
+    }
+    # The raw cursor keeps these queries out of the request metrics
+    cursor = connection.connection.cursor()
+    try:
+        if connection.vendor == 'sqlite':
+            for name in settings.SQLITE_PRAGMAS:
+                # In-memory databases don't report mmap_size
+                row = cursor.execute(f'PRAGMA {name}').fetchone()
+                details[name] = row[0] if row else None
+        elif connection.vendor == 'postgresql':
+            cursor.execute('SHOW server_version')
+            details['server_version'] = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+    logger.info(json.dumps(details, default=str))
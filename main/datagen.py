@@ -0,0 +1,188 @@
+"""
+Row generators for the `generate_dataset` command.
+
+The generators are plain functions without Django imports, so they can run in
+worker processes started with either the fork or the spawn method. Every
+chunk seeds its own random generator from the dataset seed and the chunk's
+position, so the generated rows don't depend on the number of workers.
+
+Teachers are the first users, and every teacher owns the same number of
+adverts, so the owner of an advert can be computed from its id without
+sharing state between the workers.
+"""
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+# Columns of the generated tables, in the order of the generated tuples
+COLUMNS = {
+    'auth.user': ['id', 'password', 'last_login', 'is_superuser', 'username', 'first_name', 'last_name',
+                  'email', 'is_staff', 'is_active', 'date_joined'],
+    'auth.user_groups': ['user_id', 'group_id'],
+    'main.profile': ['id', 'full_name', 'description', 'role', 'user_id'],
+    'main.subject': ['id', 'title', 'description', 'created_at', 'updated_at'],
+    'main.subject_sub_subjects': ['from_subject_id', 'to_subject_id'],
+    'main.advert': ['id', 'description', 'price', 'is_active', 'created_at', 'updated_at', 'review_count',
+                    'rating_sum', 'rating_histogram', 'rating_average', 'review_version', 'owner_id',
+                    'subject_id'],
+    'main.application': ['id', 'description', 'status', 'created_at', 'updated_at', 'advert_id',
+                         'applicant_id'],
+    'main.review': ['review', 'rating', 'created_at', 'updated_at', 'advert_id', 'reviewer_id'],
+    'main.chat': ['message', 'created_at', 'updated_at', 'sender_id', 'receiver_id'],
+}
+
+FIRST_NAMES = ['Anna', 'Janis', 'Liga', 'Martins', 'Elina', 'Karlis', 'Ilze', 'Peteris', 'Marta', 'Andris',
+               'Laura', 'Edgars', 'Zane', 'Roberts', 'Kristine', 'Toms']
+LAST_NAMES = ['Berzina', 'Kalnins', 'Ozola', 'Liepins', 'Krumina', 'Jansons', 'Vitola', 'Petersons']
+TOPICS = ['Algebra', 'Geometry', 'Calculus', 'Statistics', 'Physics', 'Chemistry', 'Biology', 'History',
+          'Literature', 'Programming', 'Databases', 'Networks', 'Economics', 'Philosophy', 'Latvian',
+          'English', 'German', 'Music Theory', 'Drawing', 'Astronomy']
+LEVELS = ['Basics', 'Intermediate', 'Advanced', 'Olympiad Prep', 'Exam Prep', 'Applied']
+PHRASES = ['Lessons tailored to your pace.', 'Homework help and exam preparation.',
+           'Plenty of practice problems included.', 'Online or in person in Riga.',
+           'Ten years of teaching experience.', 'Focus on understanding, not memorising.']
+MESSAGES = ['Hi, is the time still free?', 'Yes, see you then.', 'Could we move it by an hour?',
+            'I finished the exercises.', 'Great work, here are the next ones.', 'Thanks!',
+            'I have a question about the last topic.', 'Sure, we can go over it again.']
+
+# Weights of the Application statuses PENDING, ONGOING, FINISHED and REJECTED
+STATUS_WEIGHTS = [('PENDING', 3), ('ONGOING', 3), ('FINISHED', 3), ('REJECTED', 1)]
+RATING_WEIGHTS = [1, 1, 1, 2, 3, 5, 8, 12, 14, 10]
+EMPTY_HISTOGRAM = '[0, 0, 0, 0, 0, 0, 0, 0, 0, 0]'
+
+# Naive UTC timestamps in this format are accepted by both SQLite and PostgreSQL
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+@dataclass(frozen=True)
+class DatasetSpec:
+    seed: int
+    users: int
+    teachers: int
+    subjects: int
+    adverts_per_teacher: int
+    applications_per_student: int
+    max_messages: int
+    password: str
+    teacher_group_id: int
+    # First ids of the generated rows, after any existing data
+    user_base: int
+    profile_base: int
+    subject_base: int
+    advert_base: int
+    application_base: int
+    start: datetime = datetime(2023, 1, 1)
+
+    @property
+    def students(self) -> int:
+        return self.users - self.teachers
+
+    @property
+    def adverts(self) -> int:
+        return self.teachers * self.adverts_per_teacher
+
+    def rng(self, kind: str, chunk_start: int) -> random.Random:
+        return random.Random(f'{self.seed}:{kind}:{chunk_start}')
+
+    def timestamp(self, seconds: float) -> str:
+        return (self.start + timedelta(seconds=seconds)).strftime(TIMESTAMP_FORMAT)
+
+
+def generate_users(spec: DatasetSpec, start: int, stop: int) -> dict[str, list[tuple]]:
+    """
+    Generates the users, profiles and teacher group memberships of the users
+    with indexes in [start, stop).
+    """
+    rng = spec.rng('users', start)
+    rows = {'auth.user': [], 'auth.user_groups': [], 'main.profile': []}
+    for index in range(start, stop):
+        user_id = spec.user_base + index
+        is_teacher = index < spec.teachers
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        joined = spec.timestamp(rng.uniform(0, 365 * 86400))
+        rows['auth.user'].append((
+            user_id, spec.password, None, False, f'user{user_id}', first, last, '', False, True, joined))
+        rows['main.profile'].append((
+            spec.profile_base + index, f'{first} {last}', rng.choice(PHRASES),
+            'teacher' if is_teacher else 'student', user_id))
+        if is_teacher:
+            rows['auth.user_groups'].append((user_id, spec.teacher_group_id))
+    return rows
+
+
+def generate_subjects(spec: DatasetSpec) -> dict[str, list[tuple]]:
+    """
+    Generates the subjects and a prerequisite DAG between them. Subjects only
+    depend on subjects with lower indexes, so the graph has no cycles.
+    """
+    rng = spec.rng('subjects', 0)
+    rows = {'main.subject': [], 'main.subject_sub_subjects': []}
+    for index in range(spec.subjects):
+        subject_id = spec.subject_base + index
+        created = spec.timestamp(index)
+        title = f'{TOPICS[index % len(TOPICS)]} {LEVELS[index // len(TOPICS) % len(LEVELS)]}'
+        if index >= len(TOPICS) * len(LEVELS):
+            title += f' {index // (len(TOPICS) * len(LEVELS)) + 1}'
+        rows['main.subject'].append((subject_id, title, rng.choice(PHRASES), created, created))
+
+        candidates = range(max(0, index - 50), index)
+        for prerequisite in rng.sample(candidates, min(len(candidates), rng.randint(0, 3))):
+            rows['main.subject_sub_subjects'].append((subject_id, spec.subject_base + prerequisite))
+    return rows
+
+
+def generate_adverts(spec: DatasetSpec, start: int, stop: int) -> dict[str, list[tuple]]:
+    """
+    Generates the adverts of the teachers with indexes in [start, stop), each
+    for a different subject.
+    """
+    rng = spec.rng('adverts', start)
+    rows = {'main.advert': []}
+    for teacher in range(start, stop):
+        subjects = rng.sample(range(spec.subjects), spec.adverts_per_teacher)
+        for offset, subject in enumerate(subjects):
+            created = spec.timestamp(rng.uniform(0, 365 * 86400))
+            rows['main.advert'].append((
+                spec.advert_base + teacher * spec.adverts_per_teacher + offset,
+                ' '.join(rng.sample(PHRASES, 2)), rng.randint(3, 60), rng.random() < 0.9, created, created,
+                0, 0, EMPTY_HISTOGRAM, 0, 0, spec.user_base + teacher, spec.subject_base + subject))
+    return rows
+
+
+def generate_activity(spec: DatasetSpec, start: int, stop: int) -> dict[str, list[tuple]]:
+    """
+    Generates the applications, reviews and chat histories of the students
+    with indexes in [start, stop). Reviews follow finished and some ongoing
+    applications, and chats follow ongoing and finished applications.
+    """
+    rng = spec.rng('activity', start)
+    statuses, weights = zip(*STATUS_WEIGHTS)
+    rows = {'main.application': [], 'main.review': [], 'main.chat': []}
+    for student in range(start, stop):
+        student_id = spec.user_base + spec.teachers + student
+        adverts = rng.sample(range(spec.adverts), spec.applications_per_student)
+        for offset, advert in enumerate(adverts):
+            advert_id = spec.advert_base + advert
+            teacher_id = spec.user_base + advert // spec.adverts_per_teacher
+            status = rng.choices(statuses, weights)[0]
+            seconds = rng.uniform(0, 365 * 86400)
+            created = spec.timestamp(seconds)
+            rows['main.application'].append((
+                spec.application_base + student * spec.applications_per_student + offset,
+                rng.choice(MESSAGES), status, created, created, advert_id, student_id))
+
+            if status == 'FINISHED' or status == 'ONGOING' and rng.random() < 0.3:
+                rating = rng.choices(range(1, 11), RATING_WEIGHTS)[0]
+                reviewed = spec.timestamp(seconds + rng.uniform(86400, 30 * 86400))
+                rows['main.review'].append((
+                    rng.choice(PHRASES), rating, reviewed, reviewed, advert_id, student_id))
+
+            if status in ('ONGOING', 'FINISHED'):
+                sender, receiver = student_id, teacher_id
+                for _ in range(rng.randint(1, spec.max_messages)):
+                    seconds += rng.uniform(60, 86400)
+                    sent = spec.timestamp(seconds)
+                    rows['main.chat'].append((rng.choice(MESSAGES), sent, sent, sender, receiver))
+                    if rng.random() < 0.7:
+                        sender, receiver = receiver, sender
+    return rows
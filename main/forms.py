@@ -1,9 +1,14 @@
 from django import forms
+from django.core.cache import cache
 from django.forms import ModelForm
 from django.contrib.auth.forms import UserChangeForm
 from django.contrib.auth.models import User
+from django.db import models
 
-from .models import Profile, Advert, Application, Review
+from .models import Profile, Advert, Application, Review, Subject, SubjectClosure, RATING_MIN, RATING_MAX, \
+    RANKING_ORDERING
+
+FACET_CACHE_TIMEOUT = 60
 
 
 class UserForm(UserChangeForm):
@@ -38,3 +43,102 @@ class ReviewForm(ModelForm):
 
 class SubjectSearchForm(forms.Form):
     query = forms.CharField(max_length=100, required=False)
+
+
+class AdvertSearchForm(forms.Form):
+    SORT_ORDERINGS = {
+        'recent': ('-created_at', '-id'),
+        'price': ('price', 'id'),
+        '-price': ('-price', '-id'),
+        'rating': ('-rating_average', '-id'),
+        'top': RANKING_ORDERING,
+    }
+
+    subject = forms.ModelChoiceField(queryset=Subject.objects.all(), required=False)
+    include_sub_subjects = forms.BooleanField(required=False)
+    min_price = forms.IntegerField(min_value=0, required=False)
+    max_price = forms.IntegerField(min_value=0, required=False)
+    min_rating = forms.IntegerField(min_value=RATING_MIN, max_value=RATING_MAX, required=False)
+    sort = forms.ChoiceField(
+        choices=[
+            ('recent', 'Newest'),
+            ('price', 'Price: low to high'),
+            ('-price', 'Price: high to low'),
+            ('rating', 'Rating'),
+            ('top', 'Top teachers'),
+        ],
+        required=False,
+        widget=forms.Select(attrs={'class': 'p-2 border rounded-md'}),
+    )
+
+    def filter(self, queryset: models.QuerySet[Advert]) -> models.QuerySet[Advert]:
+        """
+        Applies the subject, price and rating filters to an advert queryset.
+        Including sub-subjects matches every transitive sub-subject through the
+        subject closure table. Sorting by top teachers annotates the ranking
+        scores.
+        """
+        subject = self.cleaned_data.get('subject')
+        queryset = queryset.filter(self.subject_filter(), self.price_filter())
+        if self.cleaned_data.get('min_rating') is not None:
+            queryset = queryset.filter(rating_average__gte=self.cleaned_data['min_rating'])
+        if self.cleaned_data.get('sort') == 'top':
+            single_subject = subject if not self.cleaned_data.get('include_sub_subjects') else None
+            queryset = queryset.ranked(single_subject)
+        return queryset
+
+    def subject_filter(self) -> models.Q:
+        """
+        Returns the condition of the subject filter, empty without a subject.
+        """
+        subject = self.cleaned_data.get('subject')
+        if subject is not None and self.cleaned_data.get('include_sub_subjects'):
+            return models.Q(subject__in=SubjectClosure.objects.filter(ancestor=subject).values('descendant'))
+        if subject is not None:
+            return models.Q(subject=subject)
+        return models.Q()
+
+    def price_filter(self) -> models.Q:
+        """
+        Returns the condition of the price filters, empty without prices.
+        """
+        condition = models.Q()
+        if self.cleaned_data.get('min_price') is not None:
+            condition &= models.Q(price__gte=self.cleaned_data['min_price'])
+        if self.cleaned_data.get('max_price') is not None:
+            condition &= models.Q(price__lte=self.cleaned_data['max_price'])
+        return condition
+
+    def ordering(self) -> tuple[str, ...]:
+        """
+        Returns the keyset ordering of the selected sort option.
+        """
+        return self.SORT_ORDERINGS[self.cleaned_data.get('sort') or 'recent']
+
+    def facets(self) -> dict[str, list[dict]]:
+        """
+        Returns the subject and price facet counts of the active adverts that
+        satisfy the filters, each facet without its own filter. The counts are
+        cached briefly.
+        """
+        if not self.is_valid():
+            return self.cached_facets('advert:facets', Advert.objects.filter(is_active=True))
+
+        data = self.cleaned_data
+        subject = data.get('subject')
+        key = 'advert:facets:{}:{}:{}:{}:{}'.format(
+            data.get('min_rating') or 0, subject.pk if subject else '', bool(data.get('include_sub_subjects')),
+            data.get('min_price') if data.get('min_price') is not None else '',
+            data.get('max_price') if data.get('max_price') is not None else '')
+        adverts = Advert.objects.filter(is_active=True)
+        if data.get('min_rating') is not None:
+            adverts = adverts.filter(rating_average__gte=data['min_rating'])
+        return self.cached_facets(key, adverts, self.subject_filter(), self.price_filter())
+
+    @staticmethod
+    def cached_facets(key: str, adverts: models.QuerySet[Advert], *filters: models.Q) -> dict[str, list[dict]]:
+        facets = cache.get(key)
+        if facets is None:
+            facets = adverts.facet_counts(*filters)
+            cache.set(key, facets, FACET_CACHE_TIMEOUT)
+        return facets
@@ -0,0 +1,111 @@
+import heapq
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template.exceptions import TemplateDoesNotExist
+
+
+@dataclass
+class RequestMetrics:
+    """
+    Timings collected while handling one request, in seconds.
+    """
+    started: float = field(default_factory=time.perf_counter)
+    queries: int = 0
+    db_time: float = 0
+    template_time: float = 0
+    # Time of the queries run lazily while rendering a template
+    template_db_time: float = 0
+    rendering: int = 0
+    # Min-heap of (duration, sql), holding only the slowest statements
+    slowest_queries: list[tuple[float, str]] = field(default_factory=list)
+
+    def add_query(self, sql: str, duration: float) -> None:
+        self.queries += 1
+        self.db_time += duration
+        if self.rendering:
+            self.template_db_time += duration
+
+        entry = (duration, sql)
+        if len(self.slowest_queries) < settings.SLOW_REQUEST_LOGGED_QUERIES:
+            heapq.heappush(self.slowest_queries, entry)
+        elif self.slowest_queries and entry > self.slowest_queries[0]:
+            heapq.heapreplace(self.slowest_queries, entry)
+
+    def python_time(self, total: float) -> float:
+        """
+        Returns the part of the total time spent outside of SQL and template
+        rendering.
+        """
+        return max(total - self.db_time - (self.template_time - self.template_db_time), 0)
+
+
+# Context variables follow a request into sync_to_async threads, unlike thread locals
+current_metrics: ContextVar[RequestMetrics | None] = ContextVar('current_metrics', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper adding every statement to the metrics of the
+    current request.
+    """
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, time.perf_counter() - start)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs) -> None:
+    """
+    Installs the query recorder on every new database connection. Connections
+    are reopened after CONN_MAX_AGE, so the recorder is only added once.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+# ------------------------------ Templates -------------------------------------
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None) -> str:
+        metrics = current_metrics.get()
+        if metrics is None:
+            return super().render(context, request)
+
+        start = time.perf_counter()
+        metrics.rendering += 1
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.rendering -= 1
+            # Templates rendered by other templates are already timed by their parent
+            if not metrics.rendering:
+                metrics.template_time += time.perf_counter() - start
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """
+    Django template backend that adds the render time of templates to the
+    metrics of the current request.
+    """
+
+    def from_string(self, template_code: str) -> InstrumentedTemplate:
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name: str) -> InstrumentedTemplate:
+        try:
+            return InstrumentedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
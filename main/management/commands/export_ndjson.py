@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.ndjson import EXPORT_MODELS, export_lines, get_model
+
+
+class Command(BaseCommand):
+    help = 'Streams the application data to a newline delimited JSON file, one row per line.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output',
+            nargs='?',
+            default='-',
+            help='The file to write, standard output if omitted.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rows fetched per query.',
+        )
+
+    def handle(self, *args, **options):
+        to_stdout = options['output'] == '-'
+        output = self.stdout if to_stdout else open(options['output'], 'w', encoding='utf-8')
+        # Progress goes to stderr when the data itself is written to stdout
+        report = self.stderr if to_stdout else self.stdout
+
+        total, started = 0, time.perf_counter()
+        try:
+            for label in EXPORT_MODELS:
+                rows, model_started = 0, time.perf_counter()
+                for line in export_lines(get_model(label), options['batch_size']):
+                    output.write(line)
+                    rows += 1
+                elapsed = time.perf_counter() - model_started
+                report.write(f'{label}: {rows} rows ({rows / elapsed if elapsed else 0:.0f} rows/s)')
+                total += rows
+        finally:
+            if not to_stdout:
+                output.close()
+
+        elapsed = time.perf_counter() - started
+        report.write(self.style.SUCCESS(
+            f'Exported {total} rows in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f} rows/s).'))
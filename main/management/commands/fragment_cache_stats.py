@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from main.templatetags.fragment_cache import get_stats, reset_stats
+
+FRAGMENTS = ['advert_list_row', 'subject_advert_row', 'profile_advert_row']
+
+
+class Command(BaseCommand):
+    help = 'Shows the hit and miss counters of the cached template fragments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'fragments',
+            nargs='*',
+            default=FRAGMENTS,
+            help='Fragment names, defaults to the advert row fragments.',
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Reset the counters after showing them.',
+        )
+
+    def handle(self, *args, **options):
+        for name in options['fragments']:
+            stats = get_stats(name)
+            total = stats['hits'] + stats['misses']
+            ratio = stats['hits'] / total if total else 0
+            self.stdout.write(
+                f'{name}: {stats["hits"]} hits, {stats["misses"]} misses ({ratio:.1%} hit rate)')
+            if options['reset']:
+                reset_stats(name)
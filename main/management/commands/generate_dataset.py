@@ -0,0 +1,140 @@
+import multiprocessing
+import os
+import time
+from collections import Counter, deque
+from typing import Callable, Iterator
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+
+from main import datagen
+from main.models import Profile, Advert, Application, Subject
+from main.ndjson import REBUILD_COMMANDS, get_model, reset_sequences
+
+
+class Command(BaseCommand):
+    help = 'Generates a deterministic synthetic dataset of users, subjects, adverts, applications, ' \
+           'reviews and chats.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of users to generate.')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random generators.')
+        parser.add_argument('--teacher-ratio', type=float, default=0.2, help='Share of users who are teachers.')
+        parser.add_argument('--subjects', type=int, help='Number of subjects, users / 50 by default.')
+        parser.add_argument('--adverts-per-teacher', type=int, default=3)
+        parser.add_argument('--applications-per-student', type=int, default=3)
+        parser.add_argument('--max-messages', type=int, default=20,
+                            help='Maximum number of chat messages per ongoing or finished application.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of processes generating rows.')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Number of users, teachers or students generated per task.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Number of rows inserted per query.')
+        parser.add_argument('--skip-rebuild', action='store_true',
+                            help='Do not rebuild the denormalized data after generating.')
+
+    def handle(self, *args, **options):
+        spec = self.build_spec(options)
+        self.batch_size = options['batch_size']
+        self.counts = Counter()
+        started = time.perf_counter()
+
+        self.write_rows(datagen.generate_subjects(spec))
+        phases = [
+            (datagen.generate_users, spec.users),
+            (datagen.generate_adverts, spec.teachers),
+            (datagen.generate_activity, spec.students),
+        ]
+        if options['workers'] > 1:
+            with multiprocessing.Pool(options['workers']) as pool:
+                for generate, total in phases:
+                    for rows in self.run_parallel(pool, generate, spec, total, options):
+                        self.write_rows(rows)
+        else:
+            for generate, total in phases:
+                for start in range(0, total, options['chunk_size']):
+                    self.write_rows(generate(spec, start, min(start + options['chunk_size'], total)))
+
+        reset_sequences(get_model(label) for label in datagen.COLUMNS)
+
+        elapsed = time.perf_counter() - started
+        total = sum(self.counts.values())
+        for label, rows in self.counts.items():
+            self.stdout.write(f'{label}: {rows} rows')
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {total} rows in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f} rows/s).'))
+
+        if not options['skip_rebuild']:
+            for command in REBUILD_COMMANDS:
+                call_command(command, stdout=self.stdout, verbosity=0)
+
+    def build_spec(self, options: dict) -> datagen.DatasetSpec:
+        users = options['users']
+        teachers = max(1, round(users * options['teacher_ratio']))
+        subjects = options['subjects'] or max(20, users // 50)
+        if users < 2 or teachers >= users:
+            raise CommandError('The dataset needs at least one teacher and one student.')
+        if options['adverts_per_teacher'] > subjects:
+            raise CommandError('A teacher cannot have more adverts than there are subjects.')
+        if options['applications_per_student'] > teachers * options['adverts_per_teacher']:
+            raise CommandError('A student cannot have more applications than there are adverts.')
+
+        def next_id(model) -> int:
+            return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+        return datagen.DatasetSpec(
+            seed=options['seed'],
+            users=users,
+            teachers=teachers,
+            subjects=subjects,
+            adverts_per_teacher=options['adverts_per_teacher'],
+            applications_per_student=options['applications_per_student'],
+            max_messages=options['max_messages'],
+            # Hashed once, every generated user logs in with the password "password"
+            password=make_password('password'),
+            teacher_group_id=Group.objects.get_or_create(name=Profile.Role.TEACHER)[0].pk,
+            user_base=next_id(get_model('auth.user')),
+            profile_base=next_id(Profile),
+            subject_base=next_id(Subject),
+            advert_base=next_id(Advert),
+            application_base=next_id(Application),
+        )
+
+    def run_parallel(self, pool, generate: Callable, spec: datagen.DatasetSpec, total: int,
+                     options: dict) -> Iterator[dict[str, list[tuple]]]:
+        """
+        Yields the generated chunks in order, keeping at most two chunks per
+        worker in flight so memory stays flat when inserting is the bottleneck.
+        """
+        chunks = iter(range(0, total, options['chunk_size']))
+        pending = deque()
+        for start in chunks:
+            stop = min(start + options['chunk_size'], total)
+            pending.append(pool.apply_async(generate, (spec, start, stop)))
+            if len(pending) >= options['workers'] * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+    def write_rows(self, rows: dict[str, list[tuple]]) -> None:
+        """
+        Inserts generated rows with executemany batches, one transaction per
+        chunk. Raw inserts skip model signals, the denormalized data is rebuilt
+        once at the end.
+        """
+        quote = connection.ops.quote_name
+        with transaction.atomic(), connection.cursor() as cursor:
+            for label, table_rows in rows.items():
+                columns = datagen.COLUMNS[label]
+                sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+                    quote(get_model(label)._meta.db_table),
+                    ', '.join(quote(column) for column in columns),
+                    ', '.join(['%s'] * len(columns)),
+                )
+                for start in range(0, len(table_rows), self.batch_size):
+                    cursor.executemany(sql, table_rows[start:start + self.batch_size])
+                self.counts[label] += len(table_rows)
@@ -0,0 +1,58 @@
+import sys
+import time
+from collections import Counter
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from main.ndjson import EXPORT_MODELS, REBUILD_COMMANDS, get_model, import_batch, preserve_timestamps, \
+    read_batches, reset_sequences
+
+
+class Command(BaseCommand):
+    help = 'Loads a newline delimited JSON file written by export_ndjson and rebuilds the denormalized data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'input',
+            nargs='?',
+            default='-',
+            help='The file to read, standard input if omitted.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rows saved per transaction.',
+        )
+        parser.add_argument(
+            '--skip-rebuild',
+            action='store_true',
+            help='Do not rebuild the denormalized data after importing.',
+        )
+
+    def handle(self, *args, **options):
+        model_list = [get_model(label) for label in EXPORT_MODELS]
+        source = sys.stdin if options['input'] == '-' else open(options['input'], encoding='utf-8')
+
+        counts, started = Counter(), time.perf_counter()
+        try:
+            with preserve_timestamps(model_list):
+                for label, rows in read_batches(source, options['batch_size']):
+                    import_batch(get_model(label), rows)
+                    counts[label] += len(rows)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        reset_sequences(model_list)
+
+        elapsed = time.perf_counter() - started
+        total = sum(counts.values())
+        for label, rows in counts.items():
+            self.stdout.write(f'{label}: {rows} rows')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {total} rows in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f} rows/s).'))
+
+        if not options['skip_rebuild']:
+            for command in REBUILD_COMMANDS:
+                call_command(command, stdout=self.stdout, verbosity=0)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from main.models import AdvertRanking
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the ranking scores of every advert, aging the reviews they are based on.'
+
+    def handle(self, *args, **options):
+        rows = AdvertRanking.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Stored {rows} advert rankings.'))
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.functions import Greatest, Least
+
+from main.models import Profile, Chat, Conversation, Application
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the conversation table from the chat messages and ongoing '
+            'applications, keeping the existing unread counters.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of conversations written per query.',
+        )
+
+    def handle(self, *args, **options):
+        chats = Chat.objects.annotate(
+            first=Least('sender', 'receiver'), second=Greatest('sender', 'receiver'))
+        last_ids = chats.values('first', 'second').annotate(
+            last_id=Max('id')).order_by().values('last_id')
+        last_messages = {
+            (first, second): (chat_id, created_at)
+            for chat_id, first, second, created_at in chats.filter(id__in=last_ids).values_list(
+                'id', 'first', 'second', 'created_at').iterator()
+        }
+
+        pairs = set(last_messages)
+        ongoing = Application.objects.filter(status=Application.Status.ONGOING).values_list(
+            'applicant', 'advert__owner')
+        for applicant_id, owner_id in ongoing.iterator():
+            if applicant_id != owner_id:
+                pairs.add(tuple(sorted((applicant_id, owner_id))))
+
+        existing = {
+            (conversation.first_user_id, conversation.second_user_id): conversation
+            for conversation in Conversation.objects.iterator()
+        }
+
+        created, updated = [], []
+        for pair in pairs:
+            message_id, activity_at = last_messages.get(pair, (None, None))
+            conversation = existing.pop(pair, None)
+            if conversation is None:
+                conversation = Conversation(first_user_id=pair[0], second_user_id=pair[1])
+                created.append(conversation)
+            elif conversation.last_message_id != message_id or (
+                    activity_at and conversation.last_activity_at != activity_at):
+                updated.append(conversation)
+            conversation.last_message_id = message_id
+            if activity_at:
+                conversation.last_activity_at = activity_at
+
+        with transaction.atomic():
+            Conversation.objects.bulk_create(created, batch_size=options['batch_size'])
+            Conversation.objects.bulk_update(
+                updated, ['last_message', 'last_activity_at'], batch_size=options['batch_size'])
+            Conversation.objects.filter(pk__in=[c.pk for c in existing.values()]).delete()
+        # bulk_create skips the signals that drop the cached relations of the users
+        Profile.invalidate_relations(*{user_id for conversation in created
+                                        for user_id in (conversation.first_user_id, conversation.second_user_id)})
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(created)}, updated {len(updated)} and removed {len(existing)} conversations.'))
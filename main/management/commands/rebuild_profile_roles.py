@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from main.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the stored profile roles from group membership.'
+
+    def handle(self, *args, **options):
+        updated = Profile.refresh_roles()
+        teachers = Profile.objects.filter(role=Profile.Role.TEACHER).count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed {updated} profile roles, {teachers} teachers.'))
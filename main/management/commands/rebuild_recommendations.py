@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the advert and subject recommendations from the applications.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=recommendations.TOP_K,
+                            help='Number of recommendations stored per advert and subject.')
+        parser.add_argument('--chunk-pairs', type=int, default=recommendations.CHUNK_PAIRS,
+                            help='Number of co-application pairs computed at a time, bounding the memory use.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Number of rows inserted per query.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        counts = recommendations.rebuild(options['top_k'], options['chunk_pairs'], options['batch_size'])
+        elapsed = time.perf_counter() - started
+        for label, rows in counts.items():
+            self.stdout.write(f'{label}: {rows} rows')
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the recommendations in {elapsed:.2f}s.'))
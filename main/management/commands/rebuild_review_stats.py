@@ -0,0 +1,63 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from main.models import Advert, Review, RATING_MIN, empty_rating_histogram
+
+STAT_FIELDS = ['review_count', 'rating_sum', 'rating_average', 'rating_histogram']
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the stored review aggregates of every advert and reports drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report drifted adverts without saving the rebuilt values.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of adverts updated per query.',
+        )
+
+    def handle(self, *args, **options):
+        histograms = defaultdict(empty_rating_histogram)
+        rows = Review.objects.values('advert', 'rating').annotate(
+            count=Count('id')).order_by()
+        for row in rows.iterator():
+            histograms[row['advert']][row['rating'] - RATING_MIN] = row['count']
+
+        checked = 0
+        drifted = []
+        adverts = Advert.objects.only('id', 'review_version', *STAT_FIELDS).order_by('id')
+        for advert in adverts.iterator(chunk_size=options['batch_size']):
+            checked += 1
+            stats = Advert.rating_stats_from_histogram(
+                histograms.get(advert.id) or empty_rating_histogram())
+
+            if all(getattr(advert, name) == value for name, value in stats.items()):
+                continue
+
+            if options['verbosity'] > 0:
+                self.stdout.write(
+                    f'Advert {advert.id}: count {advert.review_count} -> {stats["review_count"]}, '
+                    f'sum {advert.rating_sum} -> {stats["rating_sum"]}'
+                )
+            for name, value in stats.items():
+                setattr(advert, name, value)
+            advert.review_version += 1
+            drifted.append(advert)
+
+        if drifted and not options['dry_run']:
+            with transaction.atomic():
+                Advert.objects.bulk_update(
+                    drifted, [*STAT_FIELDS, 'review_version'], batch_size=options['batch_size'])
+
+        action = 'found' if options['dry_run'] else 'fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} adverts, {action} {len(drifted)} with drift.'))
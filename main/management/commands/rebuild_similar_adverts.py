@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import similar
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the similar adverts index from the descriptions of the active adverts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Number of rows fetched per query.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        counts = similar.rebuild(options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {counts["adverts"]} adverts ({counts["replayed"]} changed while building) '
+            f'in {elapsed:.2f}s.'))
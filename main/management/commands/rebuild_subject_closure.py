@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from main.models import SubjectClosure
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the transitive closure of the subject prerequisite graph.'
+
+    def handle(self, *args, **options):
+        rows = SubjectClosure.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Stored {rows} subject closure rows.'))
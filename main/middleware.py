@@ -0,0 +1,131 @@
+import json
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+
+from main.instrumentation import RequestMetrics, current_metrics
+from main.routers import read_from_replica
+
+logger = logging.getLogger('main.performance')
+
+
+class PerformanceMiddleware:
+    """
+    Measures the query count, SQL time, template render time and total time
+    of each request. The timings are sent in a `Server-Timing` header and
+    requests slower than `SLOW_REQUEST_THRESHOLD_MS` are logged as JSON with
+    their slowest SQL statements.
+
+    Template time includes the queries run lazily while rendering, the python
+    time is what remains after SQL and template rendering. Place the
+    middleware first, so that the other middleware is included in the total.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request: HttpRequest, response: HttpResponse, metrics: RequestMetrics) -> HttpResponse:
+        total = time.perf_counter() - metrics.started
+
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+                f'template;dur={metrics.template_time * 1000:.1f}',
+                f'python;dur={metrics.python_time(total) * 1000:.1f}',
+                f'view;dur={total * 1000:.1f}',
+            ])
+
+        match = request.resolver_match
+        if (total * 1000 >= settings.SLOW_REQUEST_THRESHOLD_MS
+                and not (match and match.url_name in settings.SLOW_REQUEST_IGNORED_URLS)):
+            logger.warning(json.dumps({
+                'event': 'slow_request',
+                'method': request.method,
+                'path': request.path,
+                'url_name': match.url_name if match else None,
+                'status': response.status_code,
+                'duration_ms': round(total * 1000, 1),
+                'db_ms': round(metrics.db_time * 1000, 1),
+                'queries': metrics.queries,
+                'template_ms': round(metrics.template_time * 1000, 1),
+                'python_ms': round(metrics.python_time(total) * 1000, 1),
+                'slowest_queries': [
+                    {'duration_ms': round(duration * 1000, 2), 'sql': sql}
+                    for duration, sql in sorted(metrics.slowest_queries, reverse=True)
+                ],
+            }))
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets the reads of safe requests go to the read replicas. After an unsafe
+    request, a cookie keeps the user's reads on the primary for
+    `REPLICA_STICKY_SECONDS`, so they see their own writes despite the
+    replication lag.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        token = read_from_replica.set(self.use_replica(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            read_from_replica.reset(token)
+        return self.finish(request, response)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        token = read_from_replica.set(self.use_replica(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_from_replica.reset(token)
+        return self.finish(request, response)
+
+    def use_replica(self, request: HttpRequest) -> bool:
+        return (bool(settings.DATABASE_REPLICAS)
+                and request.method in ('GET', 'HEAD', 'OPTIONS')
+                and settings.REPLICA_STICKY_COOKIE not in request.COOKIES)
+
+    def finish(self, request: HttpRequest, response: HttpResponse) -> HttpResponse:
+        if settings.DATABASE_REPLICAS and request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            response.set_cookie(settings.REPLICA_STICKY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
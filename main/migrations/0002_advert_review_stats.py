@@ -0,0 +1,51 @@
+# Generated by Django 5.0 on 2026-10-18 01:01
+
+import main.models
+from django.db import migrations, models
+
+
+def populate_review_stats(apps, schema_editor):
+    Advert = apps.get_model('main', 'Advert')
+    Review = apps.get_model('main', 'Review')
+
+    histograms = {}
+    rows = Review.objects.values('advert', 'rating').annotate(
+        count=models.Count('id')).order_by()
+    for row in rows:
+        histogram = histograms.setdefault(
+            row['advert'], main.models.empty_rating_histogram())
+        histogram[row['rating'] - main.models.RATING_MIN] = row['count']
+
+    for advert_id, histogram in histograms.items():
+        Advert.objects.filter(pk=advert_id).update(
+            review_count=sum(histogram),
+            rating_sum=sum((i + main.models.RATING_MIN) * count
+                           for i, count in enumerate(histogram)),
+            rating_histogram=histogram,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advert',
+            name='rating_histogram',
+            field=models.JSONField(default=main.models.empty_rating_histogram, editable=False),
+        ),
+        migrations.AddField(
+            model_name='advert',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='advert',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_review_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0 on 2026-10-18 01:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_advert_review_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='advert',
+            index=models.Index(fields=['is_active', 'created_at', 'id'], name='main_advert_is_acti_a0a4d3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['sender', 'receiver', 'created_at', 'id'], name='main_chat_sender__8a4f9d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subject',
+            index=models.Index(fields=['created_at', 'id'], name='main_subjec_created_d98ed9_idx'),
+        ),
+    ]
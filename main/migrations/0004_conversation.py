@@ -0,0 +1,62 @@
+# Generated by Django 5.0 on 2026-10-18 01:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_conversations(apps, schema_editor):
+    Chat = apps.get_model('main', 'Chat')
+    Conversation = apps.get_model('main', 'Conversation')
+    Application = apps.get_model('main', 'Application')
+
+    # Messages users sent to themselves make a conversation with the same user on both sides
+    conversations = {}
+    for chat in Chat.objects.order_by('id'):
+        pair = tuple(sorted((chat.sender_id, chat.receiver_id)))
+        conversations[pair] = Conversation(
+            first_user_id=pair[0], second_user_id=pair[1],
+            last_message_id=chat.id, last_activity_at=chat.created_at)
+
+    for application in Application.objects.filter(status='ONGOING').select_related('advert'):
+        pair = tuple(sorted((application.applicant_id, application.advert.owner_id)))
+        if pair[0] != pair[1] and pair not in conversations:
+            conversations[pair] = Conversation(first_user_id=pair[0], second_user_id=pair[1])
+
+    Conversation.objects.bulk_create(conversations.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_keyset_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_activity_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('first_user_unread', models.PositiveIntegerField(default=0)),
+                ('second_user_unread', models.PositiveIntegerField(default=0)),
+                ('first_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='main.chat')),
+                ('second_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['first_user', '-last_activity_at'], name='main_conver_first_u_63f5fd_idx'), models.Index(fields=['second_user', '-last_activity_at'], name='main_conver_second__a1aa95_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(fields=('first_user', 'second_user'), name='unique_conversation_pair'),
+        ),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.CheckConstraint(check=models.Q(('first_user__lte', models.F('second_user'))), name='ordered_conversation_pair'),
+        ),
+        migrations.RunPython(populate_conversations, migrations.RunPython.noop),
+    ]
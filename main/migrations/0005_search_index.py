@@ -0,0 +1,69 @@
+from django.db import migrations
+
+# Frozen copies of the search index layout in main/search.py: a document's row
+# id is its object id * 2 plus 0 for subjects and 1 for adverts
+SEARCH_TABLE = 'main_searchindex'
+SUBJECT = 0
+ADVERT = 1
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    Subject = apps.get_model('main', 'Subject')
+    Advert = apps.get_model('main', 'Advert')
+    subject_table = schema_editor.quote_name(Subject._meta.db_table)
+    advert_table = schema_editor.quote_name(Advert._meta.db_table)
+    subject_column = schema_editor.quote_name(Advert._meta.get_field('subject').column)
+
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5('
+            'title, body, subject_id UNINDEXED, '
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, title, body, subject_id) '
+            f'SELECT id * 2 + {SUBJECT}, title, description, id FROM {subject_table}'
+        )
+        schema_editor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, title, body, subject_id) '
+            f"SELECT id * 2 + {ADVERT}, '', description, {subject_column} FROM {advert_table} "
+            'WHERE is_active = %s',
+            [True],
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE TABLE {SEARCH_TABLE} ('
+            'id bigint PRIMARY KEY, subject_id bigint NOT NULL, document tsvector NOT NULL)'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX {SEARCH_TABLE}_document_idx ON {SEARCH_TABLE} USING GIN (document)')
+        schema_editor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (id, subject_id, document) '
+            f'SELECT id * 2 + {SUBJECT}, id, '
+            "setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', description), 'B') "
+            f'FROM {subject_table}'
+        )
+        schema_editor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (id, subject_id, document) '
+            f"SELECT id * 2 + {ADVERT}, {subject_column}, "
+            "setweight(to_tsvector('simple', ''), 'A') || setweight(to_tsvector('simple', description), 'B') "
+            f'FROM {advert_table} WHERE is_active = %s',
+            [True],
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_conversation'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
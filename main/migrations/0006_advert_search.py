@@ -0,0 +1,51 @@
+# Generated by Django 5.0 on 2026-10-18 01:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_rating_average(apps, schema_editor):
+    Advert = apps.get_model('main', 'Advert')
+    Advert.objects.filter(review_count__gt=0).update(
+        rating_average=models.F('rating_sum') * 1.0 / models.F('review_count'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='advert',
+            name='main_advert_is_acti_a0a4d3_idx',
+        ),
+        migrations.AddField(
+            model_name='advert',
+            name='rating_average',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_rating_average, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='advert',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['created_at', 'id'], name='advert_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='advert',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['price', 'id'], name='advert_active_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='advert',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['rating_average', 'id'], name='advert_active_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='advert',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['subject', 'price', 'id'], name='advert_active_subj_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='advert',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['subject', 'created_at', 'id'], name='advert_active_subj_created_idx'),
+        ),
+    ]
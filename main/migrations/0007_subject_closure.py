@@ -0,0 +1,53 @@
+# Generated by Django 5.0 on 2026-10-18 01:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_subject_closure(apps, schema_editor):
+    Subject = apps.get_model('main', 'Subject')
+    SubjectClosure = apps.get_model('main', 'SubjectClosure')
+
+    edges = {}
+    for parent_id, child_id in Subject.sub_subjects.through.objects.values_list('from_subject', 'to_subject'):
+        edges.setdefault(parent_id, []).append(child_id)
+
+    rows = []
+    for subject_id in Subject.objects.values_list('id', flat=True):
+        depths = {subject_id: 0}
+        frontier = [subject_id]
+        while frontier:
+            next_frontier = []
+            for node in frontier:
+                for child_id in edges.get(node, ()):
+                    if child_id not in depths:
+                        depths[child_id] = depths[node] + 1
+                        next_frontier.append(child_id)
+            frontier = next_frontier
+        rows.extend(SubjectClosure(ancestor_id=subject_id, descendant_id=descendant_id, depth=depth)
+                    for descendant_id, depth in depths.items())
+    SubjectClosure.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_advert_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubjectClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='main.subject')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='main.subject')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='main_subjec_descend_e43132_idx')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(populate_subject_closure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-18 01:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_subject_closure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advert',
+            name='review_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0 on 2026-10-18 01:18
+
+from django.db import migrations, models
+
+
+def populate_roles(apps, schema_editor):
+    Profile = apps.get_model('main', 'Profile')
+    User = apps.get_model('auth', 'User')
+
+    teacher_ids = User.groups.through.objects.filter(
+        group__name='teacher').values('user_id')
+    Profile.objects.filter(user_id__in=teacher_ids).update(role='teacher')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('main', '0008_advert_review_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='role',
+            field=models.CharField(choices=[('student', 'Student'), ('teacher', 'Teacher')], default='student', editable=False, max_length=10),
+        ),
+        migrations.RunPython(populate_roles, migrations.RunPython.noop),
+    ]
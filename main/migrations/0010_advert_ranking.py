@@ -0,0 +1,55 @@
+# Generated by Django 5.0 on 2026-10-18 02:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+PRIOR_WEIGHT = 5
+HALF_LIFE_DAYS = 365
+
+
+def populate_advert_rankings(apps, schema_editor):
+    Advert = apps.get_model('main', 'Advert')
+    AdvertRanking = apps.get_model('main', 'AdvertRanking')
+    Review = apps.get_model('main', 'Review')
+
+    totals = Advert.objects.aggregate(count=models.Sum('review_count'), sum=models.Sum('rating_sum'))
+    prior = totals['sum'] / totals['count'] if totals['count'] else 5.5
+
+    now = timezone.now()
+    weights = {}
+    for advert_id, rating, updated_at in Review.objects.values_list('advert', 'rating', 'updated_at').iterator():
+        weight = 0.5 ** (max((now - updated_at).total_seconds(), 0) / (24 * 60 * 60) / HALF_LIFE_DAYS)
+        weight_sum, rating_sum = weights.get(advert_id, (PRIOR_WEIGHT, PRIOR_WEIGHT * prior))
+        weights[advert_id] = (weight_sum + weight, rating_sum + weight * rating)
+
+    rows = []
+    for advert_id, subject_id, is_active in Advert.objects.values_list('id', 'subject', 'is_active').iterator():
+        weight_sum, rating_sum = weights.get(advert_id, (PRIOR_WEIGHT, PRIOR_WEIGHT * prior))
+        rows.append(AdvertRanking(advert_id=advert_id, subject_id=subject_id, is_active=is_active,
+                                  score=rating_sum / weight_sum))
+    AdvertRanking.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_profile_role'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdvertRanking',
+            fields=[
+                ('advert', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='main.advert')),
+                ('is_active', models.BooleanField()),
+                ('score', models.FloatField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rankings', to='main.subject')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('is_active', True)), fields=['score', 'advert'], name='ranking_active_score_idx'), models.Index(condition=models.Q(('is_active', True)), fields=['subject', 'score', 'advert'], name='ranking_active_subj_score_idx')],
+            },
+        ),
+        migrations.RunPython(populate_advert_rankings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0 on 2026-10-18 02:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_advert_ranking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdvertRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('advert', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='main.advert')),
+                ('recommended', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.advert')),
+            ],
+            options={
+                'unique_together': {('advert', 'rank')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SubjectRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('recommended', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.subject')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='main.subject')),
+            ],
+            options={
+                'unique_together': {('subject', 'rank')},
+            },
+        ),
+    ]
@@ -1,47 +1,189 @@
-from django.db import models
+import heapq
+from datetime import datetime
+
+from django.core.cache import cache
+from django.db import models, transaction
+from django.utils import timezone
+from django.db.models.functions import NullIf
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+from main.page_cache import purge_pages
+
+RATING_MIN = 1
+RATING_MAX = 10
+
+RELATIONS_CACHE_TIMEOUT = 60 * 60
+
+# Number of average reviews every advert's ranking starts with
+RANKING_PRIOR_WEIGHT = 5
+# Age in days at which a review counts half as much in the ranking
+RANKING_HALF_LIFE_DAYS = 365
+RANKING_PRIOR_CACHE_TIMEOUT = 60 * 60
+# Keyset ordering of adverts annotated by `AdvertQuerySet.ranked`
+RANKING_ORDERING = ('-score', '-ranked_id')
+
+
+def empty_rating_histogram() -> list[int]:
+    """
+    Returns a zeroed histogram with one bucket per possible review rating.
+
+    Returns:
+        list[int]: A list of zeros, index 0 corresponding to rating 1.
+    """
+    return [0] * (RATING_MAX - RATING_MIN + 1)
+
 
 class Profile(models.Model):
+    class Role(models.TextChoices):
+        STUDENT = 'student'
+        TEACHER = 'teacher'
+
     full_name = models.CharField(max_length=100, blank=True)
     description = models.TextField(blank=True)
+    # Mirrors membership of the teacher group, kept in sync by signals
+    role = models.CharField(
+        max_length=10,
+        choices=Role.choices,
+        default=Role.STUDENT,
+        editable=False
+    )
 
     user = models.OneToOneField(User, on_delete=models.CASCADE)
 
+    @staticmethod
+    def role_expression() -> models.Case:
+        """
+        Returns an expression resolving the role of a profile's user from the
+        user's groups.
+        """
+        return models.Case(
+            models.When(
+                models.Exists(User.groups.through.objects.filter(
+                    user=models.OuterRef('user_id'), group__name=Profile.Role.TEACHER)),
+                then=models.Value(Profile.Role.TEACHER),
+            ),
+            default=models.Value(Profile.Role.STUDENT),
+        )
+
+    @classmethod
+    def refresh_roles(cls, user_ids: list[int] | None = None) -> int:
+        """
+        Recomputes the stored roles from group membership with a single query.
+        The cached profile pages of the given users are purged.
+
+        Args:
+            user_ids (list[int] | None): The users to refresh, all if None.
+
+        Returns:
+            int: The number of updated profiles.
+        """
+        profiles = cls.objects.all()
+        if user_ids is not None:
+            user_ids = list(user_ids)
+            profiles = profiles.filter(user_id__in=user_ids)
+        updated = profiles.update(role=cls.role_expression())
+        if user_ids:
+            purge_pages(*(f'user:{user_id}' for user_id in user_ids))
+        return updated
+
+    @property
+    def is_teacher(self) -> bool:
+        return self.role == self.Role.TEACHER
+
+    @staticmethod
+    def relations_cache_key(user_id: int) -> str:
+        return f'profile:relations:{user_id}'
+
+    @classmethod
+    def get_relations(cls, user_id: int) -> dict[str, frozenset[int]]:
+        """
+        Returns the ids of the users related to a user, read from the cache or
+        computed with a single query and cached.
+
+        The reachable users include the user themselves, the teachers who have
+        ongoing applications from the user and the students who have ongoing
+        applications to the adverts owned by the user. The viewable users are
+        the reachable users and every user the user has a conversation with.
+
+        Args:
+            user_id (int): The primary key of the user.
+
+        Returns:
+            dict[str, frozenset[int]]: The 'reachable' and 'viewable' user ids.
+        """
+        key = cls.relations_cache_key(user_id)
+        relations = cache.get(key)
+        if relations is not None:
+            return relations
+
+        def partner(user_field: str, partner_field: str) -> models.Case:
+            return models.Case(
+                models.When(**{user_field: user_id}, then=models.F(partner_field)),
+                default=models.F(user_field),
+            )
+
+        applications = Application.objects.filter(status=Application.Status.ONGOING).filter(
+            models.Q(applicant=user_id) | models.Q(advert__owner=user_id)
+        ).annotate(
+            partner=partner('applicant', 'advert__owner'),
+            reachable=models.Value(True),
+        ).values_list('partner', 'reachable')
+        conversations = Conversation.objects.filter(
+            models.Q(first_user=user_id) | models.Q(second_user=user_id)
+        ).annotate(
+            partner=partner('first_user', 'second_user'),
+            reachable=models.Value(False),
+        ).values_list('partner', 'reachable')
+
+        reachable, viewable = {user_id}, {user_id}
+        for partner_id, is_reachable in applications.union(conversations, all=True):
+            viewable.add(partner_id)
+            if is_reachable:
+                reachable.add(partner_id)
+
+        relations = {'reachable': frozenset(reachable), 'viewable': frozenset(viewable)}
+        cache.set(key, relations, RELATIONS_CACHE_TIMEOUT)
+        return relations
+
+    @classmethod
+    def invalidate_relations(cls, *user_ids: int) -> None:
+        """
+        Drops the cached relations of the given users.
+        """
+        cache.delete_many([cls.relations_cache_key(user_id) for user_id in user_ids])
+
+    @classmethod
+    def can_message(cls, user_id: int, other_id: int) -> bool:
+        """
+        Returns whether a user may send messages to another user.
+        """
+        return other_id in cls.get_relations(user_id)['reachable']
+
+    @classmethod
+    def can_view(cls, user_id: int, other_id: int) -> bool:
+        """
+        Returns whether a user may view the chat with another user.
+        """
+        return other_id in cls.get_relations(user_id)['viewable']
+
     def reachable_users(self) -> models.QuerySet[User]:
         """
         Returns a queryset of users who are reachable by the current user.
 
-        The reachable users include both the teachers who have ongoing applications
-        from the current user and the students who have ongoing applications to the
-        advertisements owned by the current user.
-
         Returns:
             A queryset of User objects representing the reachable users.
         """
-        teachers = set(Application.objects.filter(
-            applicant=self.user, status='ONGOING').values_list('advert__owner', flat=True))
-        students = set(Application.objects.filter(
-            advert__owner=self.user, status='ONGOING').values_list('applicant', flat=True))
-        return User.objects.filter(id__in=teachers | students | {self.user.id})
+        return User.objects.filter(id__in=self.get_relations(self.user_id)['reachable'])
 
     def viewable_users(self) -> models.QuerySet[User]:
         """
         Returns a queryset of users that can be viewed by the current user.
 
-        This method retrieves the set of reachable users and existing chats
-        involving the current user. It then filters the User queryset based on
-        the union of these sets.
-
         Returns:
             A queryset of User objects that can be viewed by the current user.
         """
-        application_relations = set(
-            self.reachable_users().values_list('id', flat=True))
-        existing_chats = set(Chat.objects.filter(sender=self.user).values_list('receiver', flat=True)) | set(
-            Chat.objects.filter(receiver=self.user).values_list('sender', flat=True))
-        return User.objects.filter(id__in=application_relations | existing_chats)
+        return User.objects.filter(id__in=self.get_relations(self.user_id)['viewable'])
 
     def __str__(self) -> str:
         return self.user.username
@@ -63,10 +205,251 @@ class Chat(models.Model):
         related_name='receiver'
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['sender', 'receiver', 'created_at', 'id']),
+        ]
+
     def __str__(self) -> str:
         return f'{self.sender} -> {self.receiver}'
 
 
+class ConversationQuerySet(models.QuerySet):
+    def between(self, user_id: int, other_id: int) -> 'ConversationQuerySet':
+        """
+        Filters the conversation between two users, in either order.
+        """
+        first, second = sorted((user_id, other_id))
+        return self.filter(first_user=first, second_user=second)
+
+    def for_user(self, user: User) -> list['Conversation']:
+        """
+        Returns the conversations of a user, most recently active first, each
+        annotated with the other participant and the user's unread count. The
+        conversations where the user is the first and the second participant
+        are read in order from their `(participant, -last_activity_at)`
+        indexes and merged, as an OR over both columns has to be sorted.
+        """
+        def side(mine: str, partner: str) -> 'ConversationQuerySet':
+            return self.filter(**{mine: user}).annotate(
+                partner_id=models.F(partner),
+                partner_username=models.F(f'{partner}__username'),
+                unread=models.F(f'{mine}_unread'),
+            ).select_related('last_message').order_by('-last_activity_at', 'id')
+
+        # A conversation with oneself is on the first side only
+        sides = [side('first_user', 'second_user'), side('second_user', 'first_user').exclude(first_user=user)]
+        return list(heapq.merge(*sides, key=lambda conversation: (
+            conversation.last_activity_at, -conversation.id), reverse=True))
+
+    def unread_total(self, user: User) -> int:
+        """
+        Returns the number of unread messages of a user across all
+        conversations using a single aggregate query.
+        """
+        return self.filter(models.Q(first_user=user) | models.Q(second_user=user)).aggregate(
+            total=self._unread_sum(user))['total'] or 0
+
+    async def aunread_total(self, user: User) -> int:
+        """
+        Asynchronous version of `unread_total`.
+        """
+        totals = await self.filter(models.Q(first_user=user) | models.Q(second_user=user)).aaggregate(
+            total=self._unread_sum(user))
+        return totals['total'] or 0
+
+    @staticmethod
+    def _unread_sum(user: User) -> models.Sum:
+        return models.Sum(models.Case(
+            models.When(first_user=user, then=models.F('first_user_unread')),
+            default=models.F('second_user_unread'),
+        ))
+
+
+class Conversation(models.Model):
+    """
+    Summary of the chat between two users, keyed by the unordered user pair
+    (first_user always has the lower id). Users may message themselves, that
+    conversation has the same user on both sides. Maintained by the Chat and
+    Application signals.
+    """
+    last_activity_at = models.DateTimeField(default=timezone.now)
+    first_user_unread = models.PositiveIntegerField(default=0)
+    second_user_unread = models.PositiveIntegerField(default=0)
+
+    first_user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    second_user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    last_message = models.ForeignKey(
+        Chat,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='+'
+    )
+
+    objects = ConversationQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['first_user', 'second_user'], name='unique_conversation_pair'),
+            models.CheckConstraint(
+                check=models.Q(first_user__lte=models.F('second_user')), name='ordered_conversation_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['first_user', '-last_activity_at']),
+            models.Index(fields=['second_user', '-last_activity_at']),
+        ]
+
+    @classmethod
+    def open(cls, user_id: int, other_id: int) -> 'Conversation':
+        """
+        Returns the conversation between two users, creating it if needed.
+        """
+        first, second = sorted((user_id, other_id))
+        conversation, _ = cls.objects.get_or_create(first_user_id=first, second_user_id=second)
+        return conversation
+
+    @classmethod
+    def record_message(cls, chat: Chat) -> None:
+        """
+        Moves the last message pointer of the conversation to the given message
+        and increments the receiver's unread counter.
+
+        Args:
+            chat (Chat): The newly created message.
+        """
+        conversation = cls.open(chat.sender_id, chat.receiver_id)
+        changes = {'last_message': chat, 'last_activity_at': chat.created_at}
+        # Messages to oneself are read as they are sent
+        if chat.sender_id != chat.receiver_id:
+            unread_field = ('first_user_unread' if chat.receiver_id == conversation.first_user_id
+                            else 'second_user_unread')
+            changes[unread_field] = models.F(unread_field) + 1
+        cls.objects.filter(pk=conversation.pk).update(**changes)
+
+    @classmethod
+    def mark_read(cls, user_id: int, other_id: int) -> None:
+        """
+        Resets the unread counter of a user in the conversation with another user.
+        """
+        unread_field = 'first_user_unread' if user_id < other_id else 'second_user_unread'
+        cls.objects.between(user_id, other_id).exclude(
+            **{unread_field: 0}).update(**{unread_field: 0})
+
+    @classmethod
+    async def amark_read(cls, user_id: int, other_id: int) -> None:
+        """
+        Asynchronous version of `mark_read`.
+        """
+        unread_field = 'first_user_unread' if user_id < other_id else 'second_user_unread'
+        await cls.objects.between(user_id, other_id).exclude(
+            **{unread_field: 0}).aupdate(**{unread_field: 0})
+
+    def __str__(self) -> str:
+        return f'{self.first_user} <-> {self.second_user}'
+
+
+# Inclusive price ranges of the advert price facet
+PRICE_BUCKETS = [(0, 4), (5, 9), (10, 19), (20, 49), (50, None)]
+
+
+class AdvertQuerySet(models.QuerySet):
+    def facet_counts(self, subject_filter: models.Q | None = None,
+                     price_filter: models.Q | None = None) -> dict[str, list[dict]]:
+        """
+        Counts the adverts per subject and per price bucket using a single
+        query grouped by subject and bucket. Each facet is counted with the
+        other facet's filter applied but not its own, so the counts match the
+        results of picking another subject or price range.
+
+        Args:
+            subject_filter (Q | None): The filter of the selected subject.
+            price_filter (Q | None): The filter of the selected price range.
+
+        Returns:
+            dict[str, list[dict]]: The 'subjects' facet (id, title, count) ordered
+                by title and the 'prices' facet (min, max, count) in bucket order.
+        """
+        def matches(condition: models.Q | None) -> models.Expression:
+            if not condition:
+                return models.Value(True)
+            return models.Case(models.When(condition, then=models.Value(True)), default=models.Value(False),
+                               output_field=models.BooleanField())
+
+        bucket = models.Case(
+            *[models.When(price__gte=low, then=models.Value(i)) if high is None else
+              models.When(price__gte=low, price__lte=high, then=models.Value(i))
+              for i, (low, high) in enumerate(PRICE_BUCKETS)],
+            default=models.Value(0),
+        )
+        rows = self.annotate(bucket=bucket, in_subject=matches(subject_filter), in_price=matches(price_filter)).values(
+            'subject', 'subject__title', 'bucket', 'in_subject', 'in_price').annotate(
+            count=models.Count('id')).order_by()
+
+        subjects = {}
+        prices = [0] * len(PRICE_BUCKETS)
+        for row in rows:
+            # Subjects outside the price range stay listed, with no adverts
+            subject = subjects.setdefault(
+                row['subject'], {'id': row['subject'], 'title': row['subject__title'], 'count': 0})
+            if row['in_price']:
+                subject['count'] += row['count']
+            if row['in_subject']:
+                prices[row['bucket']] += row['count']
+
+        return {
+            'subjects': sorted(subjects.values(), key=lambda subject: subject['title']),
+            'prices': [{'min': low, 'max': high, 'count': count}
+                       for (low, high), count in zip(PRICE_BUCKETS, prices)],
+        }
+
+    def ranked(self, subject: 'Subject | None' = None) -> 'AdvertQuerySet':
+        """
+        Restricts the queryset to active adverts and annotates the `score` of
+        their stored ranking, for ordering by `RANKING_ORDERING`. Filtering by
+        subject through the ranking and breaking ties by the ranking's advert
+        column lets the database read a subject's best adverts in order from
+        the ranking index, without sorting them. Every advert gets its ranking
+        when it is saved, adverts loaded from fixtures once the
+        `rebuild_advert_rankings` command runs.
+
+        Args:
+            subject (Subject | None): Only rank the adverts of this subject.
+
+        Returns:
+            AdvertQuerySet: The annotated queryset.
+        """
+        queryset = self.filter(ranking__is_active=True)
+        if subject is not None:
+            queryset = queryset.filter(ranking__subject=subject)
+        return queryset.annotate(score=models.F('ranking__score'), ranked_id=models.F('ranking__advert'))
+
+    def with_listing_data(self) -> 'AdvertQuerySet':
+        """
+        Joins the owner and subject and annotates the average rating, so that
+        listing adverts does not issue any per-row queries.
+
+        Returns:
+            AdvertQuerySet: The annotated queryset.
+        """
+        return self.select_related('owner', 'subject').annotate(
+            average_rating=models.ExpressionWrapper(
+                models.F('rating_sum') * 1.0 /
+                NullIf('review_count', 0),
+                output_field=models.FloatField()
+            )
+        )
+
+
 class Advert(models.Model):
     description = models.TextField(blank=True)
     price = models.IntegerField()
@@ -74,6 +457,16 @@ class Advert(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Denormalized review aggregates, kept in sync by the Review signals
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_histogram = models.JSONField(
+        default=empty_rating_histogram, editable=False)
+    # Average rating with 0 for adverts without reviews, for indexed filtering and sorting
+    rating_average = models.FloatField(default=0, editable=False)
+    # Incremented whenever the reviews change, used in the cache keys of rendered adverts
+    review_version = models.PositiveIntegerField(default=0, editable=False)
+
     owner = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -85,20 +478,91 @@ class Advert(models.Model):
         related_name='adverts'
     )
 
-    def get_average_rating(self) -> float:
+    objects = AdvertQuerySet.as_manager()
+
+    def get_average_rating(self) -> float | None:
         """
-        Calculates and returns the average rating of the reviews for this object.
+        Returns the average rating of the reviews for this object, calculated
+        from the stored review aggregates.
 
         Returns:
-            float: The average rating.
+            float | None: The average rating or None if there are no reviews.
+        """
+        if not self.review_count:
+            return None
+        return self.rating_sum / self.review_count
+
+    @staticmethod
+    def compute_rating_stats(advert_id: int) -> dict:
         """
-        return self.reviews.aggregate(models.Avg('rating'))['rating__avg']
+        Computes the review aggregates of an advert from its reviews using a
+        single grouped query.
+
+        Args:
+            advert_id (int): The primary key of the advert.
+
+        Returns:
+            dict: The review_count, rating_sum and rating_histogram values.
+        """
+        histogram = empty_rating_histogram()
+        rows = Review.objects.filter(advert_id=advert_id).values(
+            'rating').annotate(count=models.Count('id')).order_by()
+        for row in rows:
+            histogram[row['rating'] - RATING_MIN] = row['count']
+        return Advert.rating_stats_from_histogram(histogram)
+
+    @staticmethod
+    def rating_stats_from_histogram(histogram: list[int]) -> dict:
+        """
+        Derives the stored review aggregates from a rating histogram.
+
+        Args:
+            histogram (list[int]): The number of reviews per rating.
+
+        Returns:
+            dict: The review_count, rating_sum, rating_average and
+                rating_histogram values.
+        """
+        review_count = sum(histogram)
+        rating_sum = sum((i + RATING_MIN) * count for i, count in enumerate(histogram))
+        return {
+            'review_count': review_count,
+            'rating_sum': rating_sum,
+            'rating_average': rating_sum / review_count if review_count else 0,
+            'rating_histogram': histogram,
+        }
+
+    @classmethod
+    def refresh_rating_stats(cls, advert_id: int) -> None:
+        """
+        Recomputes and stores the review aggregates of an advert. Does nothing
+        if the advert no longer exists.
+
+        Args:
+            advert_id (int): The primary key of the advert.
+        """
+        cls.objects.filter(pk=advert_id).update(
+            review_version=models.F('review_version') + 1,
+            **cls.compute_rating_stats(advert_id)
+        )
 
     def __str__(self) -> str:
         return f'{self.owner} - {self.subject}'
 
     class Meta:
         unique_together = [['owner', 'subject']]
+        # Partial indexes over the active adverts, SQLite can't seek a
+        # composite index on a bare boolean column condition
+        indexes = [
+            models.Index(fields=[*columns, 'id'], condition=models.Q(is_active=True), name=name)
+            for name, columns in [
+                ('advert_active_created_idx', ['created_at']),
+                ('advert_active_price_idx', ['price']),
+                ('advert_active_rating_idx', ['rating_average']),
+                ('advert_active_subj_price_idx', ['subject', 'price']),
+                ('advert_active_subj_created_idx', ['subject', 'created_at']),
+            ]
+        ]
 
 
 class Application(models.Model):
@@ -173,5 +637,397 @@ class Subject(models.Model):
         related_name='sup_subjects'
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+        ]
+
     def __str__(self):
         return self.title
+
+
+class SubjectClosure(models.Model):
+    """
+    Transitive closure of the sub_subjects graph. Every subject reachable from
+    `ancestor` through sub_subjects is stored as a `descendant` together with
+    the length of the shortest path, including a depth 0 row for the subject
+    itself. Maintained by the Subject signals.
+    """
+    depth = models.PositiveIntegerField()
+
+    ancestor = models.ForeignKey(
+        Subject,
+        on_delete=models.CASCADE,
+        related_name='descendant_links'
+    )
+    descendant = models.ForeignKey(
+        Subject,
+        on_delete=models.CASCADE,
+        related_name='ancestor_links'
+    )
+
+    class Meta:
+        unique_together = [['ancestor', 'descendant']]
+        indexes = [
+            models.Index(fields=['descendant', 'depth']),
+        ]
+
+    @staticmethod
+    def shortest_paths(root_id: int, edges: dict[int, list[int]]) -> dict[int, int]:
+        """
+        Returns the depth of every subject reachable from a root subject.
+
+        Args:
+            root_id (int): The primary key of the root subject.
+            edges (dict[int, list[int]]): The sub-subject ids of each subject.
+
+        Returns:
+            dict[int, int]: The shortest path length per reachable subject id.
+        """
+        depths = {root_id: 0}
+        frontier = [root_id]
+        while frontier:
+            next_frontier = []
+            for subject_id in frontier:
+                for child_id in edges.get(subject_id, ()):
+                    if child_id not in depths:
+                        depths[child_id] = depths[subject_id] + 1
+                        next_frontier.append(child_id)
+            frontier = next_frontier
+        return depths
+
+    @classmethod
+    def subject_links(cls, subject_id: int) -> models.QuerySet['SubjectClosure']:
+        """
+        Returns the rows shown on the page of a subject: its prerequisites and
+        the subjects building on it, plus the direct sub-subject links between
+        its prerequisites, which place them in the prerequisite tree.
+        """
+        tree = cls.objects.filter(ancestor=subject_id).values('descendant')
+        return cls.objects.filter(
+            models.Q(ancestor=subject_id, depth__gt=0) | models.Q(descendant=subject_id, depth__gt=0)
+            | models.Q(ancestor__in=tree, depth=1))
+
+    @staticmethod
+    def prerequisite_tree(subject_id: int, links) -> list[dict]:
+        """
+        Arranges the prerequisites of a subject as a tree. Every prerequisite
+        is listed once, under the first subject a level closer to the root
+        that has it as a direct sub-subject.
+
+        Args:
+            subject_id (int): The primary key of the root subject.
+            links: The rows of `subject_links` with their subjects selected.
+
+        Returns:
+            list[dict]: The direct prerequisites, each with its `subject` and
+                the same structure for its `children`.
+        """
+        depths = {subject_id: 0}
+        subjects = {}
+        for link in links:
+            if link.ancestor_id == subject_id and link.depth > 0:
+                depths[link.descendant_id] = link.depth
+                subjects[link.descendant_id] = link.descendant
+
+        children = {}
+        placed = set()
+        for link in links:
+            parent_id, child_id = link.ancestor_id, link.descendant_id
+            if (link.depth == 1 and child_id not in placed and parent_id in depths
+                    and depths.get(child_id) == depths[parent_id] + 1):
+                children.setdefault(parent_id, []).append(child_id)
+                placed.add(child_id)
+
+        def branch(parent_id: int) -> list[dict]:
+            return [{'subject': subjects[child_id], 'children': branch(child_id)}
+                    for child_id in children.get(parent_id, ())]
+
+        return branch(subject_id)
+
+    @staticmethod
+    def load_edges(subject_ids=None) -> dict[int, list[int]]:
+        """
+        Loads the sub_subjects edges, optionally only those leaving the given
+        subjects, as an adjacency list.
+        """
+        edges = {}
+        links = Subject.sub_subjects.through.objects.all()
+        if subject_ids is not None:
+            links = links.filter(from_subject__in=subject_ids)
+        for parent_id, child_id in links.values_list('from_subject', 'to_subject').iterator():
+            edges.setdefault(parent_id, []).append(child_id)
+        return edges
+
+    @classmethod
+    def creates_cycle(cls, parent_id: int, child_ids) -> bool:
+        """
+        Returns whether adding the given sub-subjects to a subject would make
+        the subject its own (transitive) prerequisite.
+        """
+        return parent_id in child_ids or cls.objects.filter(
+            ancestor__in=child_ids, descendant=parent_id).exists()
+
+    @classmethod
+    def add_edges(cls, parent_id: int, child_ids) -> None:
+        """
+        Adds the paths created by new sub-subjects of a subject: every ancestor
+        of the subject now reaches every descendant of the new sub-subjects.
+        """
+        ancestors = list(cls.objects.filter(descendant=parent_id).values_list('ancestor', 'depth'))
+        descendants = list(cls.objects.filter(ancestor__in=child_ids).values_list('descendant', 'depth'))
+
+        candidates = {}
+        for ancestor_id, up in ancestors:
+            for descendant_id, down in descendants:
+                depth = up + 1 + down
+                pair = (ancestor_id, descendant_id)
+                if depth < candidates.get(pair, depth + 1):
+                    candidates[pair] = depth
+
+        existing = cls.objects.filter(
+            ancestor__in={ancestor_id for ancestor_id, _ in ancestors},
+            descendant__in={descendant_id for descendant_id, _ in descendants},
+        )
+        shortened = []
+        for row in existing:
+            depth = candidates.pop((row.ancestor_id, row.descendant_id), None)
+            if depth is not None and depth < row.depth:
+                row.depth = depth
+                shortened.append(row)
+
+        cls.objects.bulk_create([
+            cls(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth)
+            for (ancestor_id, descendant_id), depth in candidates.items()
+        ])
+        cls.objects.bulk_update(shortened, ['depth'])
+
+    @classmethod
+    def rebuild_from(cls, ancestor_ids) -> None:
+        """
+        Recomputes the closure rows of the given subjects, used after edges
+        are removed. Pass every ancestor of the changed subjects.
+        """
+        ancestor_ids = set(ancestor_ids)
+        reachable = set(cls.objects.filter(ancestor__in=ancestor_ids).values_list(
+            'descendant', flat=True)) | ancestor_ids
+        edges = cls.load_edges(reachable)
+
+        rows = [
+            cls(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth)
+            for ancestor_id in ancestor_ids
+            for descendant_id, depth in cls.shortest_paths(ancestor_id, edges).items()
+        ]
+        with transaction.atomic():
+            cls.objects.filter(ancestor__in=ancestor_ids).delete()
+            cls.objects.bulk_create(rows, batch_size=1000)
+
+    @classmethod
+    def rebuild(cls) -> int:
+        """
+        Recomputes the whole closure table.
+
+        Returns:
+            int: The number of stored rows.
+        """
+        edges = cls.load_edges()
+        rows = [
+            cls(ancestor_id=subject_id, descendant_id=descendant_id, depth=depth)
+            for subject_id in Subject.objects.values_list('id', flat=True).iterator()
+            for descendant_id, depth in cls.shortest_paths(subject_id, edges).items()
+        ]
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(rows, batch_size=1000)
+        return len(rows)
+
+    def __str__(self) -> str:
+        return f'{self.ancestor} -> {self.descendant} ({self.depth})'
+
+
+class AdvertRanking(models.Model):
+    """
+    Materialised ranking score of every advert, stored next to a copy of its
+    subject and active flag so the best adverts of a subject are one range of
+    the ranking index. Maintained by the Review and Advert signals.
+
+    The score is a Bayesian average: every advert starts with
+    `RANKING_PRIOR_WEIGHT` reviews at the average rating of all reviews, so a
+    single 10/10 review barely moves it while many good reviews do. Reviews
+    lose half their weight every `RANKING_HALF_LIFE_DAYS`, so scores drift as
+    reviews age and the `rebuild_advert_rankings` command should run
+    periodically, e.g. daily.
+    """
+    advert = models.OneToOneField(
+        Advert,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='ranking'
+    )
+    subject = models.ForeignKey(
+        Subject,
+        on_delete=models.CASCADE,
+        related_name='rankings'
+    )
+    is_active = models.BooleanField()
+    score = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=[*columns, 'advert'], condition=models.Q(is_active=True), name=name)
+            for name, columns in [
+                ('ranking_active_score_idx', ['score']),
+                ('ranking_active_subj_score_idx', ['subject', 'score']),
+            ]
+        ]
+
+    @staticmethod
+    def prior_rating() -> float:
+        """
+        Returns the average rating of all reviews, cached as it scans every
+        advert. Without reviews the middle of the rating scale is used.
+        """
+        prior = cache.get('ranking:prior')
+        if prior is None:
+            totals = Advert.objects.aggregate(
+                count=models.Sum('review_count'), sum=models.Sum('rating_sum'))
+            prior = totals['sum'] / totals['count'] if totals['count'] else (RATING_MIN + RATING_MAX) / 2
+            cache.set('ranking:prior', prior, RANKING_PRIOR_CACHE_TIMEOUT)
+        return prior
+
+    @staticmethod
+    def compute_score(reviews: list[tuple[int, datetime]], prior: float, now: datetime) -> float:
+        """
+        Computes the Bayesian average of recency weighted reviews.
+
+        Args:
+            reviews (list[tuple[int, datetime]]): The rating and last update
+                time of each review.
+            prior (float): The rating adverts start with.
+            now (datetime): The time the review ages are measured at.
+
+        Returns:
+            float: The ranking score.
+        """
+        weight_sum = RANKING_PRIOR_WEIGHT
+        rating_sum = RANKING_PRIOR_WEIGHT * prior
+        for rating, updated_at in reviews:
+            age = max((now - updated_at).total_seconds(), 0) / (24 * 60 * 60)
+            weight = 0.5 ** (age / RANKING_HALF_LIFE_DAYS)
+            weight_sum += weight
+            rating_sum += weight * rating
+        return rating_sum / weight_sum
+
+    @classmethod
+    def build(cls, adverts, reviews, prior: float) -> list['AdvertRanking']:
+        """
+        Builds the rankings of adverts from their reviews.
+
+        Args:
+            adverts: The id, subject_id and is_active values of the adverts.
+            reviews: The advert_id, rating and updated_at values of their reviews.
+            prior (float): The rating adverts start with.
+
+        Returns:
+            list[AdvertRanking]: The unsaved rankings.
+        """
+        ratings = {}
+        for advert_id, rating, updated_at in reviews:
+            ratings.setdefault(advert_id, []).append((rating, updated_at))
+
+        now = timezone.now()
+        return [
+            cls(advert_id=advert_id, subject_id=subject_id, is_active=is_active,
+                score=cls.compute_score(ratings.get(advert_id, []), prior, now))
+            for advert_id, subject_id, is_active in adverts
+        ]
+
+    @classmethod
+    def refresh(cls, advert_ids) -> None:
+        """
+        Recomputes and stores the rankings of the given adverts, skipping the
+        adverts that no longer exist.
+        """
+        adverts = Advert.objects.filter(pk__in=advert_ids).values_list('id', 'subject', 'is_active')
+        reviews = Review.objects.filter(advert__in=advert_ids).values_list('advert', 'rating', 'updated_at')
+        cls.objects.bulk_create(
+            cls.build(adverts, reviews, cls.prior_rating()), update_conflicts=True,
+            unique_fields=['advert'], update_fields=['subject', 'is_active', 'score', 'updated_at'])
+
+    @classmethod
+    def rebuild(cls) -> int:
+        """
+        Recomputes the rankings of every advert with a fresh prior rating.
+
+        Returns:
+            int: The number of stored rows.
+        """
+        cache.delete('ranking:prior')
+        rows = cls.build(
+            Advert.objects.values_list('id', 'subject', 'is_active').iterator(),
+            Review.objects.values_list('advert', 'rating', 'updated_at').iterator(),
+            cls.prior_rating())
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(rows, batch_size=1000)
+        purge_pages('advert_list', *{f'subject:{row.subject_id}' for row in rows})
+        return len(rows)
+
+    def __str__(self) -> str:
+        return f'{self.advert} ({self.score:.2f})'
+
+
+class AdvertRecommendation(models.Model):
+    """
+    The adverts most often applied to by the applicants of an advert, ranked
+    from 0. Rebuilt offline by the `rebuild_recommendations` command.
+    """
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    advert = models.ForeignKey(
+        Advert,
+        on_delete=models.CASCADE,
+        related_name='recommendations'
+    )
+    recommended = models.ForeignKey(
+        Advert,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+
+    class Meta:
+        unique_together = [['advert', 'rank']]
+
+    def __str__(self) -> str:
+        return f'{self.advert} -> {self.recommended} ({self.rank})'
+
+
+class SubjectRecommendation(models.Model):
+    """
+    The subjects most often applied to by the applicants of a subject's
+    adverts, ranked from 0. Rebuilt offline by the `rebuild_recommendations`
+    command.
+    """
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    subject = models.ForeignKey(
+        Subject,
+        on_delete=models.CASCADE,
+        related_name='recommendations'
+    )
+    recommended = models.ForeignKey(
+        Subject,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+
+    class Meta:
+        unique_together = [['subject', 'rank']]
+
+    def __str__(self) -> str:
+        return f'{self.subject} -> {self.recommended} ({self.rank})'
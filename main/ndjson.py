@@ -0,0 +1,151 @@
+import datetime
+import json
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+from django.apps import apps
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, models, transaction
+
+# Exported in dependency order, so every line only references rows written
+# before it. Denormalized tables (conversations, search index, subject
+# closure, advert rankings, recommendations, similar adverts) are left out and
+# rebuilt after importing.
+EXPORT_MODELS = [
+    'auth.group',
+    'auth.user',
+    'auth.user_groups',
+    'main.profile',
+    'main.subject',
+    'main.subject_sub_subjects',
+    'main.advert',
+    'main.application',
+    'main.review',
+    'main.chat',
+]
+
+REBUILD_COMMANDS = [
+    'rebuild_review_stats',
+    'rebuild_advert_rankings',
+    'rebuild_conversations',
+    'rebuild_search_index',
+    'rebuild_subject_closure',
+    'rebuild_profile_roles',
+    'rebuild_recommendations',
+    'rebuild_similar_adverts',
+]
+
+
+class NdjsonEncoder(DjangoJSONEncoder):
+    """
+    Encodes datetimes with full microsecond precision, unlike the ECMA-262
+    format of DjangoJSONEncoder, so exported timestamps survive a round trip.
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def get_model(label: str) -> type[models.Model]:
+    app_label, model_name = label.split('.')
+    return apps.get_model(app_label, model_name)
+
+
+def export_lines(model: type[models.Model], batch_size: int = 1000) -> Iterator[str]:
+    """
+    Yields one JSON line per row of a model, streaming the rows from the
+    database in chunks.
+
+    Args:
+        model (type[models.Model]): The model to export.
+        batch_size (int): The number of rows fetched per query.
+
+    Yields:
+        str: A JSON object with the model label and the row's column values.
+    """
+    label = model._meta.label_lower
+    columns = [field.attname for field in model._meta.concrete_fields]
+    rows = model.objects.order_by('pk').values(*columns)
+    for row in rows.iterator(chunk_size=batch_size):
+        yield json.dumps({'model': label, 'fields': row}, cls=NdjsonEncoder) + '\n'
+
+
+def read_batches(lines: Iterable[str], batch_size: int) -> Iterator[tuple[str, list[dict]]]:
+    """
+    Groups consecutive lines of the same model into batches, keeping at most
+    one batch in memory.
+
+    Args:
+        lines (Iterable[str]): The NDJSON lines.
+        batch_size (int): The maximum number of rows per batch.
+
+    Yields:
+        tuple[str, list[dict]]: The model label and the column values of the rows.
+    """
+    label, batch = None, []
+    for line in lines:
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        if batch and (item['model'] != label or len(batch) >= batch_size):
+            yield label, batch
+            batch = []
+        label = item['model']
+        batch.append(item['fields'])
+    if batch:
+        yield label, batch
+
+
+def import_batch(model: type[models.Model], rows: list[dict]) -> None:
+    """
+    Saves a batch of rows in one transaction, updating the rows whose primary
+    keys already exist and inserting the rest. Bulk queries don't send model
+    signals, so no per-object denormalization work runs.
+
+    Args:
+        model (type[models.Model]): The model of the rows.
+        rows (list[dict]): The column values of the rows.
+    """
+    pk_name = model._meta.pk.attname
+    objects = [model(**row) for row in rows]
+    with transaction.atomic():
+        existing = set(model.objects.filter(
+            pk__in=[row[pk_name] for row in rows]).values_list('pk', flat=True))
+        model.objects.bulk_create([obj for obj in objects if obj.pk not in existing])
+        if existing:
+            fields = [field.name for field in model._meta.concrete_fields if not field.primary_key]
+            model.objects.bulk_update([obj for obj in objects if obj.pk in existing], fields)
+
+
+@contextmanager
+def preserve_timestamps(model_list: Iterable[type[models.Model]]) -> Iterator[None]:
+    """
+    Temporarily disables auto_now and auto_now_add, so that imported rows keep
+    their exported timestamps.
+    """
+    changed = []
+    for model in model_list:
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                changed.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in changed:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def reset_sequences(model_list: Iterable[type[models.Model]]) -> None:
+    """
+    Moves the primary key sequences past the imported ids on databases that
+    use sequences.
+    """
+    statements = connection.ops.sequence_reset_sql(no_style(), list(model_list))
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
@@ -0,0 +1,224 @@
+"""
+Full-page cache for anonymous visitors.
+
+Pages are cached per path and query string. While rendering, a view tags the
+page with the objects it shows (`tag_page('advert:5')`). Saving a model
+stores the current time as the version of its tags (see the Page Cache
+signals), and a cached page is outdated once any of its tags changed after it
+started rendering, so only the pages showing the model are rendered again.
+
+When a page is missing, the first request renders it while the others wait
+for the result instead of rendering it too. When a page is outdated and
+another request is already rendering it, the outdated page is served.
+"""
+import asyncio
+import hashlib
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+PAGE_KEY = 'page:{digest}'
+LOCK_KEY = 'page:lock:{digest}'
+TAG_KEY = 'page:tag:{tag}'
+
+# Seconds between checks for a page rendered by another request, doubled
+# after every check up to the maximum
+WAIT_INTERVAL = 0.05
+MAX_WAIT_INTERVAL = 1.0
+
+# Tags of the page being rendered, None outside of cached views
+current_page_tags: ContextVar[set[str] | None] = ContextVar('current_page_tags', default=None)
+
+
+def tag_page(*tags: str) -> None:
+    """
+    Marks the page being rendered as showing the given tags.
+    """
+    page_tags = current_page_tags.get()
+    if page_tags is not None:
+        page_tags.update(tags)
+
+
+def purge_pages(*tags: str) -> None:
+    """
+    Outdates the cached pages tagged with any of the given tags.
+    """
+    def bump() -> None:
+        cache.set_many({TAG_KEY.format(tag=tag): time.time() for tag in tags}, timeout=None)
+
+    bump()
+    # Pages rendered before the write is committed still show the old data
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(bump)
+
+
+def is_cacheable(request: HttpRequest) -> bool:
+    # Anonymous visitors have no session, and pages with pending messages are personal
+    return (settings.PAGE_CACHE_TIMEOUT > 0
+            and request.method in ('GET', 'HEAD')
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES
+            and 'messages' not in request.COOKIES)
+
+
+def page_digest(request: HttpRequest) -> str:
+    return hashlib.md5(request.get_full_path().encode()).hexdigest()
+
+
+def tag_keys(entry: dict | None) -> list[str]:
+    return [TAG_KEY.format(tag=tag) for tag in entry['tags']] if entry else []
+
+
+def is_fresh(entry: dict, versions: dict[str, float]) -> bool:
+    # Tag versions missing from the cache may have been evicted after a change
+    return all(key in versions and versions[key] < entry['started'] for key in tag_keys(entry))
+
+
+def build_response(request: HttpRequest, entry: dict, outcome: str) -> HttpResponse:
+    response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    for header, value in entry.get('validators', {}).items():
+        response[header] = value
+    # Revalidating visitors get 304 Not Modified for cached pages too
+    response = get_conditional_response(
+        request, etag=response.get('ETag'), last_modified=parse_http_date_safe(response.get('Last-Modified', '')),
+        response=response)
+    response['X-Page-Cache'] = outcome
+    return response
+
+
+def build_entry(response: HttpResponse, tags: set[str], started: float) -> dict | None:
+    # Responses setting cookies (CSRF tokens, messages) belong to a single visitor
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return None
+    return {
+        'content': response.content,
+        'content_type': response['Content-Type'],
+        'validators': {header: response[header] for header in ('ETag', 'Last-Modified') if response.has_header(header)},
+        'tags': sorted(tags),
+        'started': started,
+    }
+
+
+def find_page(request: HttpRequest, digest: str):
+    """
+    Looks up the cached page of a request. A generator yielding the seconds to
+    wait while another request renders the missing page, backing off between
+    checks. Returns the cached response, or None with whether this request
+    took the lock to render and store the page. Requests stop waiting and
+    render the page uncached after PAGE_CACHE_LOCK_TIMEOUT seconds.
+    """
+    deadline = time.monotonic() + settings.PAGE_CACHE_LOCK_TIMEOUT
+    interval = WAIT_INTERVAL
+    while True:
+        entry = cache.get(PAGE_KEY.format(digest=digest))
+        if entry and is_fresh(entry, cache.get_many(tag_keys(entry))):
+            return build_response(request, entry, 'hit'), False
+        if cache.add(LOCK_KEY.format(digest=digest), 1, settings.PAGE_CACHE_LOCK_TIMEOUT):
+            return None, True
+        if entry:
+            return build_response(request, entry, 'stale'), False
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None, False
+        yield min(interval, remaining)
+        interval = min(interval * 2, MAX_WAIT_INTERVAL)
+
+
+def next_step(steps) -> tuple[float | None, tuple | None]:
+    """
+    Advances `find_page`, returning either the seconds to wait or its result.
+    """
+    try:
+        return next(steps), None
+    except StopIteration as stop:
+        return None, stop.value
+
+
+def store_page(digest: str, response: HttpResponse | None, tags: set[str], started: float) -> None:
+    """
+    Stores a rendered page, unless rendering failed, and releases the lock.
+    """
+    try:
+        entry = build_entry(response, tags, started) if response is not None else None
+        if entry:
+            # Untouched tags get a version older than any page, add doesn't
+            # overwrite changes made while rendering
+            versions = cache.get_many(tag_keys(entry))
+            for key in set(tag_keys(entry)) - set(versions):
+                cache.add(key, 0, timeout=None)
+            cache.set(PAGE_KEY.format(digest=digest), entry, settings.PAGE_CACHE_TIMEOUT)
+    finally:
+        cache.delete(LOCK_KEY.format(digest=digest))
+
+
+def cache_anonymous_page(view):
+    """
+    Caches the pages of a view for anonymous visitors. Works with both sync
+    and async views, the view tags the pages with `tag_page`. Async views
+    access the cache from a worker thread.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request: HttpRequest, *args, **kwargs) -> HttpResponse:
+            if not is_cacheable(request):
+                return await view(request, *args, **kwargs)
+
+            digest = page_digest(request)
+            steps = find_page(request, digest)
+            delay, result = await sync_to_async(next_step)(steps)
+            while result is None:
+                await asyncio.sleep(delay)
+                delay, result = await sync_to_async(next_step)(steps)
+            cached, locked = result
+            if cached is not None:
+                return cached
+            if not locked:
+                return await view(request, *args, **kwargs)
+
+            started, tags = time.time(), set()
+            token = current_page_tags.set(tags)
+            response = None
+            try:
+                response = await view(request, *args, **kwargs)
+            finally:
+                current_page_tags.reset(token)
+                await sync_to_async(store_page)(digest, response, tags, started)
+            response['X-Page-Cache'] = 'miss'
+            return response
+    else:
+        @wraps(view)
+        def wrapper(request: HttpRequest, *args, **kwargs) -> HttpResponse:
+            if not is_cacheable(request):
+                return view(request, *args, **kwargs)
+
+            digest = page_digest(request)
+            steps = find_page(request, digest)
+            delay, result = next_step(steps)
+            while result is None:
+                time.sleep(delay)
+                delay, result = next_step(steps)
+            cached, locked = result
+            if cached is not None:
+                return cached
+            if not locked:
+                return view(request, *args, **kwargs)
+
+            started, tags = time.time(), set()
+            token = current_page_tags.set(tags)
+            response = None
+            try:
+                response = view(request, *args, **kwargs)
+            finally:
+                current_page_tags.reset(token)
+                store_page(digest, response, tags, started)
+            response['X-Page-Cache'] = 'miss'
+            return response
+
+    return wrapper
@@ -0,0 +1,210 @@
+import base64
+import binascii
+import json
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import models
+
+DEFAULT_PAGE_SIZE = 25
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+@dataclass
+class KeysetPage:
+    object_list: list
+    next_cursor: str | None = None
+    previous_cursor: str | None = None
+    ordering: tuple[str, ...] = field(default=())
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _row_value(row: Any, name: str) -> Any:
+    if isinstance(row, dict):
+        return row[name]
+    return getattr(row, name)
+
+
+def encode_cursor(row: Any, ordering: tuple[str, ...], direction: str) -> str:
+    """
+    Encodes the ordering values of a row into an opaque cursor.
+
+    Args:
+        row (Any): A model instance or a values() dictionary.
+        ordering (tuple[str, ...]): The ordering of the paginated queryset.
+        direction (str): 'next' to continue after the row, 'previous' before it.
+
+    Returns:
+        str: The URL safe cursor.
+    """
+    payload = {
+        'd': direction[0],
+        'v': [_encode_value(_row_value(row, name.lstrip('-'))) for name in ordering],
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(cursor: str, queryset: models.QuerySet,
+                  ordering: tuple[str, ...]) -> tuple[str, list]:
+    """
+    Decodes a cursor produced by encode_cursor for the given ordering.
+
+    Args:
+        cursor (str): The cursor to decode.
+        queryset (models.QuerySet): The paginated queryset, used to convert
+            the stored values back to their field types.
+        ordering (tuple[str, ...]): The ordering of the paginated queryset.
+
+    Raises:
+        InvalidCursor: If the cursor is malformed or does not match the ordering.
+
+    Returns:
+        tuple[str, list]: The direction and the decoded ordering values.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        direction = {'n': 'next', 'p': 'previous'}[payload['d']]
+        raw_values = payload['v']
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(cursor) from e
+
+    if not isinstance(raw_values, list) or len(raw_values) != len(ordering):
+        raise InvalidCursor(cursor)
+
+    values = []
+    for name, raw_value in zip(ordering, raw_values):
+        # The ordering columns are never null, and cursors only hold scalars
+        if not isinstance(raw_value, (str, int, float)):
+            raise InvalidCursor(cursor)
+        try:
+            model_field = queryset.model._meta.get_field(name.lstrip('-'))
+            value = model_field.to_python(raw_value)
+        except FieldDoesNotExist:
+            value = raw_value
+        except (ValidationError, TypeError, ValueError) as e:
+            raise InvalidCursor(cursor) from e
+        if value is None:
+            raise InvalidCursor(cursor)
+        values.append(value)
+    return direction, values
+
+
+def _flip(name: str) -> str:
+    return name[1:] if name.startswith('-') else f'-{name}'
+
+
+def _seek_filter(ordering: tuple[str, ...], values: list, reverse: bool) -> models.Q:
+    """
+    Builds the row comparison `(a, b) > (x, y)` as `a > x OR (a = x AND b > y)`
+    honouring the direction of each ordering field.
+    """
+    condition = models.Q()
+    equal = models.Q()
+    for name, value in zip(ordering, values):
+        descending = name.startswith('-') != reverse
+        lookup = 'lt' if descending else 'gt'
+        column = name.lstrip('-')
+        condition |= equal & models.Q(**{f'{column}__{lookup}': value})
+        equal &= models.Q(**{column: value})
+    return condition
+
+
+def paginate_keyset(queryset: models.QuerySet, cursor: str | None,
+                    ordering: tuple[str, ...] = ('-created_at', '-id'),
+                    per_page: int = DEFAULT_PAGE_SIZE) -> KeysetPage:
+    """
+    Paginates a queryset by seeking past the ordering values of the last seen
+    row instead of using OFFSET, so deep pages cost the same as the first one.
+    The last ordering field must be unique (usually the primary key).
+
+    Args:
+        queryset (models.QuerySet): The queryset to paginate.
+        cursor (str | None): The cursor of the requested page, None for the first page.
+        ordering (tuple[str, ...], optional): The ordering fields. Defaults to
+            newest first.
+        per_page (int, optional): The number of rows per page.
+
+    Returns:
+        KeysetPage: The requested page with the cursors of its neighbours.
+    """
+    window, values, reverse = _page_window(queryset, cursor, ordering, per_page)
+    return _build_page(list(window), values, reverse, ordering, per_page)
+
+
+async def apaginate_keyset(queryset: models.QuerySet, cursor: str | None,
+                           ordering: tuple[str, ...] = ('-created_at', '-id'),
+                           per_page: int = DEFAULT_PAGE_SIZE) -> KeysetPage:
+    """
+    Asynchronous version of `paginate_keyset`, fetching the page with the
+    async ORM.
+    """
+    window, values, reverse = _page_window(queryset, cursor, ordering, per_page)
+    return _build_page([row async for row in window], values, reverse, ordering, per_page)
+
+
+def _page_window(queryset: models.QuerySet, cursor: str | None, ordering: tuple[str, ...],
+                 per_page: int) -> tuple[models.QuerySet, list | None, bool]:
+    """
+    Returns the unevaluated queryset of the requested page plus one extra row
+    that tells whether there are more rows, the decoded cursor values and
+    whether the page is fetched backwards.
+    """
+    direction = 'next'
+    values = None
+    if cursor:
+        try:
+            direction, values = decode_cursor(cursor, queryset, ordering)
+        except InvalidCursor:
+            direction, values = 'next', None
+
+    reverse = direction == 'previous'
+    order_by = [_flip(name) for name in ordering] if reverse else list(ordering)
+
+    if values is not None:
+        queryset = queryset.filter(_seek_filter(ordering, values, reverse))
+
+    return queryset.order_by(*order_by)[:per_page + 1], values, reverse
+
+
+def _build_page(rows: list, values: list | None, reverse: bool, ordering: tuple[str, ...],
+                per_page: int) -> KeysetPage:
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if reverse:
+        rows.reverse()
+
+    # Coming from a cursor means there is a page on the side we came from
+    has_next = values is not None if reverse else has_more
+    has_previous = has_more if reverse else values is not None
+
+    page = KeysetPage(rows, ordering=ordering)
+    if rows and has_next:
+        page.next_cursor = encode_cursor(rows[-1], ordering, 'next')
+    if rows and has_previous:
+        page.previous_cursor = encode_cursor(rows[0], ordering, 'previous')
+    return page
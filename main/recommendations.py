@@ -0,0 +1,194 @@
+"""
+"Students who applied here also applied to" recommendations.
+
+The applications form a sparse student x advert matrix, stored in compressed
+rows: the adverts of each student are one slice of a flat index array. Two
+adverts are similar when the same students applied to both, scored by the
+cosine similarity of their columns: the number of shared students divided by
+the geometric mean of their applicant counts. The subjects of the adverts are
+compared the same way.
+
+Co-application counts are computed for a chunk of adverts at a time, by
+expanding every applicant of the chunk into all of the applicant's adverts and
+counting the distinct pairs. Chunks are sized by the number of pairs they
+expand to, so memory stays bounded however many applications there are. Only
+the top neighbours of each advert are kept and stored by the
+`rebuild_recommendations` command.
+"""
+import itertools
+from typing import Iterator
+
+import numpy as np
+from django.db import connection, transaction
+from django.utils import timezone
+
+from main.models import Advert, AdvertRecommendation, Application, SubjectRecommendation
+from main.page_cache import purge_pages
+
+TOP_K = 10
+# Co-application pairs expanded per chunk, each takes around 50 bytes while
+# the chunk is computed
+CHUNK_PAIRS = 2_000_000
+
+
+def load_pairs(rows) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Reads (user, item) id rows into two arrays.
+
+    Args:
+        rows: The (user, item) tuples, e.g. a values_list iterator.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The user ids and the item ids.
+    """
+    flat = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.int64)
+    pairs = flat.reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def top_neighbours(users: np.ndarray, items: np.ndarray, k: int = TOP_K, candidates: np.ndarray | None = None,
+                   chunk_pairs: int = CHUNK_PAIRS) -> Iterator[tuple[np.ndarray, ...]]:
+    """
+    Finds the most similar items of every item from the users they share.
+
+    Args:
+        users (np.ndarray): The user id of every (user, item) pair. Repeated
+            pairs count once.
+        items (np.ndarray): The item id of every pair.
+        k (int): The number of neighbours kept per item.
+        candidates (np.ndarray | None): The ids of the items that may be
+            recommended, all items by default.
+        chunk_pairs (int): The number of co-occurrences expanded at a time.
+
+    Yields:
+        tuple[np.ndarray, ...]: The item ids, neighbour ids, scores and ranks
+            (0 for the most similar) of a chunk of items.
+    """
+    item_ids, item_index = np.unique(items, return_inverse=True)
+    user_ids, user_index = np.unique(users, return_inverse=True)
+    item_count = len(item_ids)
+    if not item_count:
+        return
+
+    # Distinct pairs sorted by user, giving the compressed rows of the matrix
+    keys = np.unique(user_index.astype(np.int64) * item_count + item_index)
+    row_items = keys % item_count
+    user_degree = np.bincount(keys // item_count, minlength=len(user_ids))
+    row_starts = np.concatenate(([0], np.cumsum(user_degree)[:-1]))
+
+    # The same matrix by column, the applicants of every item
+    item_degree = np.bincount(row_items, minlength=item_count)
+    column_users = (keys // item_count)[np.argsort(row_items, kind='stable')]
+    column_ends = np.cumsum(item_degree)
+
+    allowed = np.ones(item_count, dtype=bool)
+    if candidates is not None:
+        allowed = np.isin(item_ids, candidates)
+
+    # Pairs expanded by the items up to each item, for sizing the chunks
+    pair_ends = np.cumsum(user_degree[column_users])[column_ends - 1]
+
+    first = 0
+    while first < item_count:
+        done = pair_ends[first - 1] if first else 0
+        last = max(int(np.searchsorted(pair_ends, done + chunk_pairs, side='right')), first + 1)
+        yield from _chunk_neighbours(first, last, k, item_ids, item_degree, column_users, column_ends,
+                                     row_items, row_starts, user_degree, allowed)
+        first = last
+
+
+def _chunk_neighbours(first: int, last: int, k: int, item_ids: np.ndarray, item_degree: np.ndarray,
+                      column_users: np.ndarray, column_ends: np.ndarray, row_items: np.ndarray,
+                      row_starts: np.ndarray, user_degree: np.ndarray,
+                      allowed: np.ndarray) -> Iterator[tuple[np.ndarray, ...]]:
+    item_count = len(item_ids)
+    start = column_ends[first - 1] if first else 0
+    chunk_users = column_users[start:column_ends[last - 1]]
+    sources = np.repeat(np.arange(first, last), item_degree[first:last])
+
+    # Every applicant of a source item expands into all of their items
+    lengths = user_degree[chunk_users]
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    neighbours = row_items[np.repeat(row_starts[chunk_users], lengths) + offsets]
+    sources = np.repeat(sources, lengths)
+
+    keep = (sources != neighbours) & allowed[neighbours]
+    pair_keys, shared = np.unique((sources[keep] - first) * item_count + neighbours[keep], return_counts=True)
+    if not len(pair_keys):
+        return
+    sources = pair_keys // item_count + first
+    neighbours = pair_keys % item_count
+    scores = shared / np.sqrt(item_degree[sources] * item_degree[neighbours])
+
+    # Rank the neighbours of each item, the best first and ties by id
+    order = np.lexsort((neighbours, -scores, sources))
+    sources, neighbours, scores = sources[order], neighbours[order], scores[order]
+    group_starts = np.flatnonzero(np.concatenate(([True], sources[1:] != sources[:-1])))
+    ranks = np.arange(len(sources)) - np.repeat(group_starts, np.diff(np.append(group_starts, len(sources))))
+
+    top = ranks < k
+    yield item_ids[sources[top]], item_ids[neighbours[top]], scores[top], ranks[top]
+
+
+def load_applications(batch_size: int = 5000) -> dict[str, np.ndarray]:
+    """
+    Reads the applications as (student, advert) and (student, subject) pairs,
+    and the ids of the active adverts.
+
+    Args:
+        batch_size (int): The number of rows fetched per query.
+
+    Returns:
+        dict[str, np.ndarray]: The 'students', 'adverts', 'subject_students',
+            'subjects' and 'active' arrays.
+    """
+    applications = Application.objects.order_by()
+    students, adverts = load_pairs(applications.values_list('applicant', 'advert').iterator(chunk_size=batch_size))
+    subject_students, subjects = load_pairs(
+        applications.values_list('applicant', 'advert__subject').iterator(chunk_size=batch_size))
+    active = np.fromiter(Advert.objects.filter(is_active=True).values_list('id', flat=True).iterator(),
+                         dtype=np.int64)
+    return {'students': students, 'adverts': adverts, 'subject_students': subject_students,
+            'subjects': subjects, 'active': active}
+
+
+def rebuild(k: int = TOP_K, chunk_pairs: int = CHUNK_PAIRS, batch_size: int = 5000) -> dict[str, int]:
+    """
+    Recomputes the stored advert and subject recommendations from all
+    applications. Only active adverts are recommended.
+
+    Args:
+        k (int): The number of recommendations kept per advert and subject.
+        chunk_pairs (int): The number of co-occurrences expanded at a time.
+        batch_size (int): The number of rows inserted per query.
+
+    Returns:
+        dict[str, int]: The number of stored rows per table.
+    """
+    data = load_applications(batch_size)
+    created_at = connection.ops.adapt_datetimefield_value(timezone.now())
+    quote = connection.ops.quote_name
+
+    counts = {}
+    # Raw inserts, model instances would cost more than computing the rows
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model, field, users, items, candidates in [
+            (AdvertRecommendation, 'advert', data['students'], data['adverts'], data['active']),
+            (SubjectRecommendation, 'subject', data['subject_students'], data['subjects'], None),
+        ]:
+            columns = [model._meta.get_field(name).column
+                       for name in (field, 'recommended', 'score', 'rank', 'created_at')]
+            sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+                quote(model._meta.db_table), ', '.join(quote(column) for column in columns),
+                ', '.join(['%s'] * len(columns)))
+
+            model.objects.all().delete()
+            counts[model._meta.label] = 0
+            for sources, neighbours, scores, ranks in top_neighbours(users, items, k, candidates, chunk_pairs):
+                rows = list(zip(sources.tolist(), neighbours.tolist(), scores.tolist(), ranks.tolist(),
+                                itertools.repeat(created_at)))
+                for start in range(0, len(rows), batch_size):
+                    cursor.executemany(sql, rows[start:start + batch_size])
+                counts[model._meta.label] += len(rows)
+    purge_pages('recommendations')
+    return counts
@@ -0,0 +1,31 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Set by ReplicaRoutingMiddleware for safe requests of users who haven't
+# written recently. Reads outside of such requests (writes, management
+# commands, background work) stay on the primary.
+read_from_replica: ContextVar[bool] = ContextVar('read_from_replica', default=False)
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends writes to the `default` database and, when allowed for the current
+    request, reads to a random database from `DATABASE_REPLICAS`.
+    """
+
+    def db_for_read(self, model, **hints) -> str | None:
+        if settings.DATABASE_REPLICAS and read_from_replica.get():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints) -> str:
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints) -> bool | None:
+        # Replicas hold the same data as the primary
+        databases = {'default', *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
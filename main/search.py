@@ -0,0 +1,172 @@
+"""
+Full-text search over subject titles and descriptions and active advert
+descriptions.
+
+The index is a single table keyed by an encoded row id, so that a document can
+be replaced or removed with a primary key lookup. On SQLite it is an FTS5
+virtual table ranked with bm25, on PostgreSQL a tsvector column with a GIN
+index ranked with ts_rank. Other database backends fall back to an unindexed
+icontains search.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from main.models import Advert, Subject
+
+SEARCH_TABLE = 'main_searchindex'
+
+SUBJECT = 0
+ADVERT = 1
+
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def is_supported(vendor: str | None = None) -> bool:
+    return (vendor or connection.vendor) in ('sqlite', 'postgresql')
+
+
+def _row_id(kind: int, object_id: int) -> int:
+    return object_id * 2 + kind
+
+
+def _tokens(text: str) -> list[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def _write(cursor, kind: int, object_id: int, subject_id: int, title: str, body: str) -> None:
+    row_id = _row_id(kind, object_id)
+    if connection.vendor == 'sqlite':
+        # Concurrent saves of the same object would otherwise interleave and
+        # insert the row id twice
+        with transaction.atomic(savepoint=False):
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [row_id])
+            cursor.execute(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, title, body, subject_id) VALUES (%s, %s, %s, %s)',
+                [row_id, title, body, subject_id],
+            )
+    else:
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (id, subject_id, document) VALUES (%s, %s, '
+            "setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'B')) "
+            'ON CONFLICT (id) DO UPDATE SET subject_id = EXCLUDED.subject_id, document = EXCLUDED.document',
+            [row_id, subject_id, title, body],
+        )
+
+
+def _delete(cursor, kind: int, object_id: int) -> None:
+    id_column = 'rowid' if connection.vendor == 'sqlite' else 'id'
+    cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE {id_column} = %s', [_row_id(kind, object_id)])
+
+
+def index_subject(subject: Subject) -> None:
+    """
+    Adds or replaces the search document of a subject.
+    """
+    if is_supported():
+        with connection.cursor() as cursor:
+            _write(cursor, SUBJECT, subject.pk, subject.pk, subject.title, subject.description)
+
+
+def index_advert(advert: Advert) -> None:
+    """
+    Adds or replaces the search document of an advert. Inactive adverts are
+    removed from the index.
+    """
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        if advert.is_active:
+            _write(cursor, ADVERT, advert.pk, advert.subject_id, '', advert.description)
+        else:
+            _delete(cursor, ADVERT, advert.pk)
+
+
+def remove_subject(subject_id: int) -> None:
+    if is_supported():
+        with connection.cursor() as cursor:
+            _delete(cursor, SUBJECT, subject_id)
+
+
+def remove_advert(advert_id: int) -> None:
+    if is_supported():
+        with connection.cursor() as cursor:
+            _delete(cursor, ADVERT, advert_id)
+
+
+def rebuild(batch_size: int = 1000) -> dict[str, int]:
+    """
+    Recreates the search index from all subjects and active adverts.
+
+    Args:
+        batch_size (int, optional): Number of rows fetched per query.
+
+    Returns:
+        dict[str, int]: The number of indexed subjects and adverts.
+    """
+    counts = {'subjects': 0, 'adverts': 0}
+    if not is_supported():
+        return counts
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        subjects = Subject.objects.values_list('id', 'title', 'description').order_by()
+        for subject_id, title, description in subjects.iterator(chunk_size=batch_size):
+            _write(cursor, SUBJECT, subject_id, subject_id, title, description)
+            counts['subjects'] += 1
+        adverts = Advert.objects.filter(is_active=True).values_list(
+            'id', 'subject', 'description').order_by()
+        for advert_id, subject_id, description in adverts.iterator(chunk_size=batch_size):
+            _write(cursor, ADVERT, advert_id, subject_id, '', description)
+            counts['adverts'] += 1
+    return counts
+
+
+def search_subject_ids(query: str, limit: int) -> list[int]:
+    """
+    Returns the ids of the subjects matching a search query, most relevant
+    first. A subject matches through its own title and description or through
+    the description of any of its active adverts. Every word of the query must
+    match, the last one as a prefix.
+
+    Args:
+        query (str): The search query entered by the user.
+        limit (int): The maximum number of subjects to return.
+
+    Returns:
+        list[int]: The ids of the matching subjects.
+    """
+    tokens = _tokens(query)
+    if not tokens:
+        return []
+
+    if not is_supported():
+        condition = Q()
+        for token in tokens:
+            condition &= (Q(title__icontains=token) | Q(description__icontains=token)
+                          | Q(adverts__description__icontains=token, adverts__is_active=True))
+        return list(Subject.objects.filter(condition).values_list(
+            'id', flat=True).distinct()[:limit])
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            match = ' '.join(f'"{token}"' for token in tokens) + '*'
+            cursor.execute(
+                f'SELECT subject_id FROM {SEARCH_TABLE} '
+                f'WHERE {SEARCH_TABLE} MATCH %s AND rank MATCH %s '
+                'GROUP BY subject_id ORDER BY MIN(rank), subject_id LIMIT %s',
+                [match, f'bm25({TITLE_WEIGHT}, {BODY_WEIGHT})', limit],
+            )
+        else:
+            tsquery = ' & '.join(tokens[:-1] + [f'{tokens[-1]}:*'])
+            cursor.execute(
+                f"SELECT subject_id FROM {SEARCH_TABLE}, to_tsquery('simple', %s) query "
+                'WHERE document @@ query GROUP BY subject_id '
+                'ORDER BY MAX(ts_rank(document, query)) DESC, subject_id LIMIT %s',
+                [tsquery, limit],
+            )
+        return [row[0] for row in cursor.fetchall()]
@@ -0,0 +1,398 @@
+from django.contrib.auth.models import Group, User
+from django.db.models import Q
+from django.core.exceptions import ValidationError
+from django.db.models.signals import post_init, pre_save, post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from main import search, similar
+from main.conditional import bump_names_version
+from main.page_cache import purge_pages
+from main.models import Profile, Chat, Conversation, Advert, AdvertRanking, Application, Review, Subject, \
+    SubjectClosure
+
+
+# ------------------------------ Review Aggregates -----------------------------
+
+
+@receiver(post_init, sender=Review)
+def remember_review_advert(sender, instance: Review, **kwargs) -> None:
+    """
+    Remembers the advert a review was loaded with, so that both adverts can be
+    refreshed if the review is moved to another advert.
+    """
+    instance._original_advert_id = instance.advert_id
+
+
+@receiver(post_save, sender=Review)
+def update_advert_rating_stats(sender, instance: Review, raw: bool, **kwargs) -> None:
+    """
+    Refreshes the stored review aggregates and the ranking of the reviewed
+    advert. Fixture loading is skipped, run the `rebuild_review_stats` and
+    `rebuild_advert_rankings` commands afterwards.
+    """
+    if raw:
+        return
+
+    Advert.refresh_rating_stats(instance.advert_id)
+    advert_ids = [instance.advert_id]
+
+    if instance._original_advert_id not in (None, instance.advert_id):
+        Advert.refresh_rating_stats(instance._original_advert_id)
+        advert_ids.append(instance._original_advert_id)
+    AdvertRanking.refresh(advert_ids)
+    instance._original_advert_id = instance.advert_id
+
+
+@receiver(post_delete, sender=Review)
+def remove_advert_rating_stats(sender, instance: Review, **kwargs) -> None:
+    """
+    Refreshes the stored review aggregates and the ranking of the advert a
+    review was removed from.
+    """
+    Advert.refresh_rating_stats(instance.advert_id)
+    AdvertRanking.refresh([instance.advert_id])
+
+
+@receiver(post_save, sender=Advert)
+def update_advert_ranking(sender, instance: Advert, raw: bool, **kwargs) -> None:
+    """
+    Copies the subject and activity of an advert into its ranking, or stores
+    the ranking of a new advert.
+    """
+    if raw:
+        return
+    updated = AdvertRanking.objects.filter(advert=instance).update(
+        subject=instance.subject_id, is_active=instance.is_active)
+    if not updated:
+        AdvertRanking.refresh([instance.pk])
+
+
+# ------------------------------ Conversations ---------------------------------
+
+
+@receiver(post_init, sender=Application)
+def remember_application_status(sender, instance: Application, **kwargs) -> None:
+    """
+    Remembers the status an application was loaded with, so that status
+    changes can be detected after saving. New applications have no status.
+    """
+    instance._original_status = instance.status if instance.pk else None
+
+
+@receiver(post_save, sender=Chat)
+def update_conversation(sender, instance: Chat, created: bool, raw: bool, **kwargs) -> None:
+    """
+    Moves the conversation's last message pointer and the receiver's unread
+    counter when a message is sent.
+    """
+    if created and not raw:
+        Conversation.record_message(instance)
+
+
+def close_unused_conversation(user_id: int, other_id: int) -> None:
+    """
+    Removes the conversation between two users if it has no messages and there
+    is no longer an ongoing application between them.
+    """
+    ongoing = Application.objects.filter(status=Application.Status.ONGOING).filter(
+        Q(applicant=user_id, advert__owner=other_id) | Q(applicant=other_id, advert__owner=user_id))
+    if not ongoing.exists():
+        Conversation.objects.between(user_id, other_id).filter(last_message__isnull=True).delete()
+
+
+@receiver(post_save, sender=Application)
+def open_conversation(sender, instance: Application, raw: bool, **kwargs) -> None:
+    """
+    Makes sure an ongoing application is listed among both users' chats.
+    """
+    if raw or instance.status == instance._original_status:
+        return
+
+    owner_id = Advert.objects.values_list('owner', flat=True).get(pk=instance.advert_id)
+    if instance.status == Application.Status.ONGOING:
+        Conversation.open(instance.applicant_id, owner_id)
+    else:
+        close_unused_conversation(instance.applicant_id, owner_id)
+    Profile.invalidate_relations(instance.applicant_id, owner_id)
+    instance._original_status = instance.status
+
+
+@receiver(post_delete, sender=Application)
+def close_conversation(sender, instance: Application, **kwargs) -> None:
+    """
+    Removes the conversation opened by a deleted application if it is unused.
+    """
+    owner_id = Advert.objects.filter(pk=instance.advert_id).values_list('owner', flat=True).first()
+    if owner_id is not None:
+        close_unused_conversation(instance.applicant_id, owner_id)
+        Profile.invalidate_relations(instance.applicant_id, owner_id)
+
+
+@receiver(post_save, sender=Conversation)
+@receiver(post_delete, sender=Conversation)
+def invalidate_conversation_relations(sender, instance: Conversation, **kwargs) -> None:
+    """
+    Drops the cached relations of both users when a conversation between them
+    is created or removed.
+    """
+    if kwargs.get('created', True):
+        Profile.invalidate_relations(instance.first_user_id, instance.second_user_id)
+
+
+# ------------------------------ Search Index ----------------------------------
+
+
+@receiver(post_save, sender=Subject)
+def index_subject(sender, instance: Subject, raw: bool, **kwargs) -> None:
+    if not raw:
+        search.index_subject(instance)
+
+
+@receiver(post_delete, sender=Subject)
+def unindex_subject(sender, instance: Subject, **kwargs) -> None:
+    search.remove_subject(instance.pk)
+
+
+@receiver(post_save, sender=Advert)
+def index_advert(sender, instance: Advert, raw: bool, **kwargs) -> None:
+    if not raw:
+        search.index_advert(instance)
+
+
+@receiver(post_delete, sender=Advert)
+def unindex_advert(sender, instance: Advert, **kwargs) -> None:
+    search.remove_advert(instance.pk)
+
+
+# ------------------------------ Similar Adverts -------------------------------
+
+
+@receiver(post_save, sender=Advert)
+def index_similar_advert(sender, instance: Advert, raw: bool, **kwargs) -> None:
+    if not raw:
+        similar.index_advert(instance)
+
+
+@receiver(post_delete, sender=Advert)
+def unindex_similar_advert(sender, instance: Advert, **kwargs) -> None:
+    similar.remove_advert(instance.pk)
+
+
+# ------------------------------ Subject Closure -------------------------------
+
+
+@receiver(post_save, sender=Subject)
+def add_subject_closure(sender, instance: Subject, created: bool, raw: bool, **kwargs) -> None:
+    """
+    Adds the depth 0 closure row of a new subject.
+    """
+    if created and not raw:
+        SubjectClosure.objects.create(ancestor=instance, descendant=instance, depth=0)
+
+
+@receiver(pre_delete, sender=Subject)
+def remember_subject_ancestors(sender, instance: Subject, **kwargs) -> None:
+    instance._closure_ancestors = set(SubjectClosure.objects.filter(
+        descendant=instance, depth__gt=0).values_list('ancestor', flat=True))
+
+
+@receiver(post_delete, sender=Subject)
+def remove_subject_closure(sender, instance: Subject, **kwargs) -> None:
+    """
+    Recomputes the paths that led through a deleted subject.
+    """
+    ancestors = getattr(instance, '_closure_ancestors', set())
+    if ancestors:
+        SubjectClosure.rebuild_from(ancestors)
+
+
+def closure_parents(instance: Subject, reverse: bool, pk_set) -> set[int]:
+    """
+    Returns the ids of the subjects whose sub_subjects changed. The reverse
+    side of the relation changes the sup_subjects of the instance instead.
+    """
+    if not reverse:
+        return {instance.pk}
+    if pk_set is None:
+        return set(instance.sup_subjects.values_list('id', flat=True))
+    return set(pk_set)
+
+
+@receiver(m2m_changed, sender=Subject.sub_subjects.through)
+def update_subject_closure(sender, instance: Subject, action: str, reverse: bool, pk_set, **kwargs) -> None:
+    """
+    Keeps the closure table in sync with the sub_subjects relation and
+    rejects changes that would create a prerequisite cycle.
+    """
+    if action == 'pre_add':
+        edges = [(instance.pk, child_id) for child_id in pk_set] if not reverse else \
+            [(parent_id, instance.pk) for parent_id in pk_set]
+        for parent_id, child_id in edges:
+            if SubjectClosure.creates_cycle(parent_id, [child_id]):
+                raise ValidationError(
+                    'A subject cannot depend on itself, directly or through its sub-subjects.')
+
+    elif action == 'post_add':
+        if reverse:
+            for parent_id in pk_set:
+                SubjectClosure.add_edges(parent_id, [instance.pk])
+        else:
+            SubjectClosure.add_edges(instance.pk, pk_set)
+
+    elif action in ('pre_remove', 'pre_clear'):
+        parents = closure_parents(instance, reverse, pk_set)
+        instance._closure_ancestors = set(SubjectClosure.objects.filter(
+            descendant__in=parents).values_list('ancestor', flat=True))
+
+    elif action in ('post_remove', 'post_clear'):
+        SubjectClosure.rebuild_from(instance._closure_ancestors)
+
+
+# ------------------------------ Profile Roles ---------------------------------
+
+
+@receiver(pre_save, sender=Profile)
+def resolve_new_profile_role(sender, instance: Profile, raw: bool, **kwargs) -> None:
+    """
+    Resolves the role of a new profile from the groups its user already has.
+    Fixture loading is skipped, run the `rebuild_profile_roles` command
+    afterwards.
+    """
+    if raw or not instance._state.adding:
+        return
+    is_teacher = instance.user.groups.filter(name=Profile.Role.TEACHER).exists()
+    instance.role = Profile.Role.TEACHER if is_teacher else Profile.Role.STUDENT
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def update_profile_roles(sender, instance, action: str, reverse: bool, pk_set, **kwargs) -> None:
+    """
+    Refreshes the stored roles when users are added to or removed from groups,
+    from either side of the relation.
+    """
+    if action == 'pre_clear' and reverse:
+        instance._role_user_ids = list(instance.user_set.values_list('id', flat=True))
+
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            Profile.refresh_roles([instance.pk])
+        elif action == 'post_clear':
+            Profile.refresh_roles(instance._role_user_ids)
+        else:
+            Profile.refresh_roles(pk_set)
+
+
+@receiver(post_save, sender=Group)
+def refresh_renamed_group_roles(sender, instance: Group, created: bool, raw: bool, **kwargs) -> None:
+    """
+    Refreshes the roles of a group's users, as renaming a group can change
+    whether it is the teacher group.
+    """
+    if not raw and not created:
+        Profile.refresh_roles(instance.user_set.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Group)
+def remember_group_users(sender, instance: Group, **kwargs) -> None:
+    instance._role_user_ids = list(instance.user_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Group)
+def refresh_deleted_group_roles(sender, instance: Group, **kwargs) -> None:
+    Profile.refresh_roles(instance._role_user_ids)
+
+
+# ------------------------------ Conditional GET -------------------------------
+
+
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+def bump_subject_names(sender, instance: Subject, **kwargs) -> None:
+    # Subject titles are shown on advert, profile and other subject pages
+    bump_names_version()
+
+
+@receiver(post_save, sender=User)
+def bump_user_names(sender, instance: User, **kwargs) -> None:
+    # Registered before the page cache receiver, which forgets the old username
+    if instance.username != getattr(instance, '_original_username', instance.username):
+        bump_names_version()
+
+
+# ------------------------------ Page Cache ------------------------------------
+
+
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+def purge_subject_pages(sender, instance: Subject, **kwargs) -> None:
+    # The advert list shows subject titles and counts adverts per subject
+    purge_pages(f'subject:{instance.pk}', 'subject_list', 'advert_list')
+
+
+@receiver(m2m_changed, sender=Subject.sub_subjects.through)
+def purge_subject_tree_pages(sender, action: str, **kwargs) -> None:
+    # A changed prerequisite changes the trees shown by every related subject
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        purge_pages('subject_tree')
+
+
+@receiver(post_init, sender=Advert)
+def remember_advert_subject(sender, instance: Advert, **kwargs) -> None:
+    instance._original_subject_id = instance.subject_id
+
+
+@receiver(post_save, sender=Advert)
+@receiver(post_delete, sender=Advert)
+def purge_advert_pages(sender, instance: Advert, **kwargs) -> None:
+    """
+    Purges the pages showing an advert, including the subject pages it was
+    moved between. Subject lists count adverts and search their descriptions.
+    """
+    subject_ids = {instance.subject_id, instance._original_subject_id} - {None}
+    purge_pages(f'advert:{instance.pk}', *(f'subject:{subject_id}' for subject_id in subject_ids),
+                'advert_list', 'subject_list')
+    instance._original_subject_id = instance.subject_id
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_pages(sender, instance: Review, **kwargs) -> None:
+    # The original advert is forgotten once the review aggregates are refreshed
+    instance._page_advert_ids = {instance.advert_id, instance._original_advert_id} - {None}
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def purge_review_pages(sender, instance: Review, **kwargs) -> None:
+    """
+    Purges the pages of the reviewed adverts. The advert list is sorted and
+    filtered by rating and the subject pages by ranking, where the advert may
+    move onto a page that didn't show it.
+    """
+    advert_ids = getattr(instance, '_page_advert_ids', {instance.advert_id})
+    subject_ids = {instance.advert.subject_id}
+    if advert_ids != {instance.advert_id}:
+        subject_ids.update(Advert.objects.filter(pk__in=advert_ids).values_list('subject', flat=True))
+    purge_pages(*(f'advert:{advert_id}' for advert_id in advert_ids),
+                *(f'subject:{subject_id}' for subject_id in subject_ids), 'advert_list')
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def purge_profile_pages(sender, instance: Profile, **kwargs) -> None:
+    purge_pages(f'user:{instance.user_id}')
+
+
+@receiver(post_init, sender=User)
+def remember_username(sender, instance: User, **kwargs) -> None:
+    instance._original_username = instance.username
+
+
+@receiver(post_save, sender=User)
+def purge_renamed_user_pages(sender, instance: User, **kwargs) -> None:
+    """
+    Purges the pages showing a user's username. Other user changes, like the
+    last login time, aren't shown on cached pages.
+    """
+    if instance.username != instance._original_username:
+        purge_pages(f'user:{instance.pk}')
+        instance._original_username = instance.username
@@ -0,0 +1,452 @@
+"""
+"Similar adverts" from the text of the adverts.
+
+Every active advert is a TF-IDF vector of the words of its description and of
+its subject title. Words are hashed into a fixed number of buckets, so new
+adverts never need a new vocabulary. Words in more than half of the adverts
+are dropped as stop words. The vectors are normalised, so the cosine
+similarity of two adverts is the dot product of their vectors.
+
+The `rebuild_similar_adverts` command writes the index to
+`SIMILAR_ADVERTS_DIR` as plain .npy arrays, which every process memory-maps:
+
+- the columns (the adverts of each word, an inverted index) to find the
+  adverts sharing the rarest words of the queried advert in one `bincount`,
+- the rows (the words of each advert) to look up the vector of the queried
+  advert and score the best candidates with all of their words.
+
+Saved and deleted adverts are appended to the updates file of the index as
+JSON lines, vectorised with the IDF of the index. Every process reads the new
+lines before a query, the updated adverts replace their rows and are scored
+through an inverted index of their own. Subject renames are picked up by the next rebuild.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import zlib
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from main.models import Advert
+from main.page_cache import purge_pages
+from main.search import TOKEN_RE
+
+TOP_K = 10
+# Hash buckets of the words, a power of two above the expected vocabulary
+DIMENSION = 2 ** 18
+# Postings of the rarest words of the queried advert used to find candidates,
+# and the number of candidates scored with all of their words. Bound the query
+# time however many adverts share the common words
+POSTINGS_BUDGET = 50_000
+CANDIDATES = 300
+# Words in a larger share of the adverts are dropped
+MAX_DOCUMENT_FREQUENCY = 0.5
+# Subject title words count as this many description words
+TITLE_WEIGHT = 2.0
+
+CURRENT_FILE = 'CURRENT'
+UPDATES_FILE = 'updates.jsonl'
+ARRAYS = ['ids', 'idf', 'doc_starts', 'doc_terms', 'doc_weights', 'term_starts', 'term_rows', 'term_weights']
+
+Vector = tuple[np.ndarray, np.ndarray]
+
+
+def term_counts(description: str, title: str) -> Counter:
+    """
+    Counts the hashed words of an advert, title words weighted by
+    `TITLE_WEIGHT`.
+    """
+    counts = Counter()
+    for weight, text in ((1.0, description), (TITLE_WEIGHT, title)):
+        for token in TOKEN_RE.findall(text.lower()):
+            counts[zlib.crc32(token.encode()) % DIMENSION] += weight
+    return counts
+
+
+def vectorise(counts: Counter, idf: np.ndarray) -> Vector:
+    """
+    Returns the normalised TF-IDF vector of the counted words, as sorted word
+    buckets and their weights.
+    """
+    terms = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+    weights = (1 + np.log(np.fromiter(counts.values(), dtype=np.float64, count=len(counts)))) * idf[terms]
+    keep = weights > 0
+    order = np.argsort(terms[keep])
+    terms, weights = terms[keep][order], weights[keep][order]
+    norm = np.sqrt(np.dot(weights, weights))
+    return terms, (weights / norm if norm else weights).astype(np.float32)
+
+
+def write_index(directory: Path, rows: Iterable[tuple[int, str, str]]) -> str:
+    """
+    Builds the index of the given adverts into a new folder of `directory`
+    and makes it the current index. The previous indexes are kept, for their
+    updates to be replayed, until `remove_old_indexes` deletes them.
+
+    Args:
+        directory (Path): The folder of the indexes.
+        rows (Iterable[tuple[int, str, str]]): The id, description and
+            subject title of every advert, ordered by id.
+
+    Returns:
+        str: The name of the new index folder.
+    """
+    ids, doc_lengths, terms, counts = array('q'), array('q'), array('i'), array('f')
+    for advert_id, description, title in rows:
+        advert_counts = term_counts(description, title)
+        ids.append(advert_id)
+        doc_lengths.append(len(advert_counts))
+        terms.extend(advert_counts.keys())
+        counts.extend(advert_counts.values())
+
+    ids, doc_lengths = np.frombuffer(ids, dtype=np.int64), np.frombuffer(doc_lengths, dtype=np.int64)
+    terms, counts = np.frombuffer(terms, dtype=np.int32), np.frombuffer(counts, dtype=np.float32)
+    rows_of_terms = np.repeat(np.arange(len(ids), dtype=np.int32), doc_lengths)
+
+    document_frequency = np.bincount(terms, minlength=DIMENSION)
+    idf = (np.log((1 + len(ids)) / (1 + document_frequency)) + 1).astype(np.float32)
+    idf[document_frequency > MAX_DOCUMENT_FREQUENCY * len(ids)] = 0
+
+    weights = (1 + np.log(counts)) * idf[terms]
+    norms = np.sqrt(np.bincount(rows_of_terms, weights=weights.astype(np.float64) ** 2, minlength=len(ids)))
+    keep = weights > 0
+    weights = (weights[keep] / norms[rows_of_terms[keep]]).astype(np.float32)
+    terms, rows_of_terms = terms[keep], rows_of_terms[keep]
+    # The words of every advert sorted, like the vectors of the updates
+    by_row = np.lexsort((terms, rows_of_terms))
+    terms, rows_of_terms, weights = terms[by_row], rows_of_terms[by_row], weights[by_row]
+
+    doc_lengths = np.bincount(rows_of_terms, minlength=len(ids))
+    by_term = np.argsort(terms, kind='stable')
+    arrays = {
+        'ids': ids,
+        'idf': idf,
+        'doc_starts': np.concatenate(([0], np.cumsum(doc_lengths))),
+        'doc_terms': terms,
+        'doc_weights': weights,
+        'term_starts': np.concatenate(([0], np.cumsum(np.bincount(terms, minlength=DIMENSION)))),
+        'term_rows': rows_of_terms[by_term],
+        'term_weights': weights[by_term],
+    }
+
+    name = f'index-{time.time_ns()}'
+    folder = directory / name
+    folder.mkdir(parents=True)
+    for key, values in arrays.items():
+        np.save(folder / f'{key}.npy', values)
+    (folder / UPDATES_FILE).touch()
+
+    # Replacing the pointer is atomic, processes switch on their next query
+    pointer = directory / f'{CURRENT_FILE}.tmp'
+    pointer.write_text(name)
+    os.replace(pointer, directory / CURRENT_FILE)
+    return name
+
+
+def remove_old_indexes(directory: Path, name: str) -> None:
+    """
+    Deletes the index folders other than the given current one, once their
+    updates were replayed into it.
+    """
+    for old in directory.glob('index-*'):
+        if old.name != name:
+            # Processes still mapping the old arrays keep them until they switch
+            shutil.rmtree(old, ignore_errors=True)
+
+
+class SimilarIndex:
+    """
+    A memory-mapped index with the updates appended to it since it was built.
+    """
+
+    def __init__(self, folder: Path):
+        self.folder = folder
+        for key in ARRAYS:
+            # Plain arrays over the mapped files, memmap slices are slower to create
+            setattr(self, key, np.asarray(np.load(folder / f'{key}.npy', mmap_mode='r')))
+        self.idf = np.array(self.idf)
+        self.term_starts = np.array(self.term_starts)
+
+        # Rows of the adverts updated since the build
+        self.replaced = np.zeros(len(self.ids), dtype=bool)
+        # Vectors of the updated adverts, None for removed ones
+        self.updates: dict[int, Vector | None] = {}
+        self.updates_read = 0
+        self.stacked: tuple[np.ndarray, ...] | None = None
+        self.lock = threading.Lock()
+
+    def row(self, advert_id: int) -> int | None:
+        row = int(np.searchsorted(self.ids, advert_id))
+        return row if row < len(self.ids) and self.ids[row] == advert_id else None
+
+    def refresh(self) -> None:
+        """
+        Applies the updates appended by any process since the last refresh.
+        """
+        path = self.folder / UPDATES_FILE
+        try:
+            if path.stat().st_size == self.updates_read:
+                return
+        except FileNotFoundError:
+            return
+        with self.lock, open(path, 'rb') as updates:
+            updates.seek(self.updates_read)
+            data = updates.read()
+            # A line being appended is read once it is complete
+            data = data[:data.rfind(b'\n') + 1]
+            for line in data.splitlines():
+                update = json.loads(line)
+                vector = None
+                if 'terms' in update:
+                    vector = (np.array(update['terms'], dtype=np.int32),
+                              np.array(update['weights'], dtype=np.float32))
+                self.updates[update['advert']] = vector
+                row = self.row(update['advert'])
+                if row is not None:
+                    self.replaced[row] = True
+            self.updates_read += len(data)
+            self.stacked = None
+
+    def append(self, advert_id: int, vector: Vector | None) -> None:
+        update = {'advert': advert_id}
+        if vector is not None:
+            update['terms'] = vector[0].tolist()
+            update['weights'] = [round(weight, 6) for weight in vector[1].tolist()]
+        # A single write in append mode, so lines of concurrent processes don't interleave
+        with open(self.folder / UPDATES_FILE, 'a') as updates:
+            updates.write(json.dumps(update, separators=(',', ':')) + '\n')
+
+    def vector(self, advert_id: int) -> Vector | None:
+        if advert_id in self.updates:
+            return self.updates[advert_id]
+        row = self.row(advert_id)
+        if row is None:
+            return None
+        start, end = self.doc_starts[row], self.doc_starts[row + 1]
+        return self.doc_terms[start:end], self.doc_weights[start:end]
+
+    def stack_updates(self) -> tuple[np.ndarray, ...]:
+        """
+        Returns the updated adverts as an inverted index: their ids, and the
+        word, weight and advert position of every word, sorted by word.
+        """
+        if self.stacked is None:
+            vectors = [(advert_id, vector) for advert_id, vector in self.updates.items() if vector is not None]
+            terms = np.concatenate([vector[0] for _, vector in vectors] or [np.empty(0, dtype=np.int32)])
+            weights = np.concatenate([vector[1] for _, vector in vectors] or [np.empty(0, dtype=np.float32)])
+            owners = np.repeat(np.arange(len(vectors)), [len(vector[0]) for _, vector in vectors])
+            by_term = np.argsort(terms, kind='stable')
+            self.stacked = (np.array([advert_id for advert_id, _ in vectors], dtype=np.int64),
+                            terms[by_term], weights[by_term], owners[by_term])
+        return self.stacked
+
+    def score_rows(self, terms: np.ndarray, weights: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Scores the indexed adverts sharing a word with the query vector.
+
+        Common words are shared with most adverts, so candidates are first
+        found through the rarest words, up to `POSTINGS_BUDGET` postings. The
+        best `CANDIDATES` of them are then scored with all of their words.
+        """
+        starts = self.term_starts[terms]
+        lengths = self.term_starts[terms + 1] - starts
+        rarest = np.argsort(lengths, kind='stable')
+        within = np.cumsum(lengths[rarest]) <= POSTINGS_BUDGET
+        within[0] = True
+        chosen = rarest[within]
+
+        positions = _ranges(starts[chosen], lengths[chosen])
+        partial = np.bincount(self.term_rows[positions],
+                              weights=self.term_weights[positions] * np.repeat(weights[chosen], lengths[chosen]),
+                              minlength=len(self.ids))
+        partial[self.replaced] = 0
+        rows = np.flatnonzero(partial)
+        if len(rows) > CANDIDATES:
+            rows = rows[np.argpartition(-partial[rows], CANDIDATES)[:CANDIDATES]]
+
+        starts = self.doc_starts[rows]
+        lengths = self.doc_starts[rows + 1] - starts
+        positions = _ranges(starts, lengths)
+        scores = _dot(terms, weights, self.doc_terms[positions], self.doc_weights[positions],
+                      np.repeat(np.arange(len(rows)), lengths), len(rows))
+        return self.ids[rows], scores
+
+    def score_updates(self, terms: np.ndarray, weights: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        ids, update_terms, update_weights, owners = self.stack_updates()
+        starts = np.searchsorted(update_terms, terms)
+        lengths = np.searchsorted(update_terms, terms, side='right') - starts
+        positions = _ranges(starts, lengths)
+        scores = np.bincount(owners[positions], weights=update_weights[positions] * np.repeat(weights, lengths),
+                             minlength=len(ids))
+        return ids, scores
+
+    def similar(self, advert_id: int, k: int = TOP_K) -> list[tuple[int, float]]:
+        """
+        Returns the ids and cosine similarities of the adverts most similar to
+        an advert, the most similar first and ties by id.
+        """
+        self.refresh()
+        vector = self.vector(advert_id)
+        if vector is None or not len(vector[0]):
+            return []
+        terms, weights = vector
+
+        row_ids, row_scores = self.score_rows(terms, weights)
+        update_ids, update_scores = self.score_updates(terms, weights)
+        ids, scores = np.concatenate((row_ids, update_ids)), np.concatenate((row_scores, update_scores))
+        keep = (scores > 0) & (ids != advert_id)
+        ids, scores = ids[keep], scores[keep]
+        order = np.lexsort((ids, -scores))[:k]
+        return [(int(ids[index]), float(scores[index])) for index in order]
+
+
+def _ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    # The positions of the slices [start, start + length) in one array
+    return np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+
+
+def _dot(query_terms: np.ndarray, query_weights: np.ndarray, terms: np.ndarray, weights: np.ndarray,
+         owners: np.ndarray, count: int) -> np.ndarray:
+    # Dot products of the query with `count` vectors flattened into words, weights and owners
+    positions = np.minimum(np.searchsorted(query_terms, terms), len(query_terms) - 1)
+    shared = query_terms[positions] == terms
+    return np.bincount(owners[shared], weights=weights[shared] * query_weights[positions[shared]], minlength=count)
+
+
+# The index of this process, replaced when another index becomes current
+_loaded: SimilarIndex | None = None
+_load_lock = threading.Lock()
+
+
+def load_index() -> SimilarIndex | None:
+    """
+    Returns the current index, or None before the first rebuild.
+    """
+    global _loaded
+    directory = Path(settings.SIMILAR_ADVERTS_DIR)
+    try:
+        name = (directory / CURRENT_FILE).read_text()
+    except FileNotFoundError:
+        return None
+    folder = directory / name
+    if _loaded is None or _loaded.folder != folder:
+        with _load_lock:
+            if _loaded is None or _loaded.folder != folder:
+                _loaded = SimilarIndex(folder)
+    return _loaded
+
+
+def index_version() -> tuple[str, int, float] | None:
+    """
+    Returns a version of the results that changes with every rebuild and
+    every update: the name of the current index, the size of its updates and
+    the time they last changed. None before the first rebuild.
+    """
+    directory = Path(settings.SIMILAR_ADVERTS_DIR)
+    try:
+        name = (directory / CURRENT_FILE).read_text()
+        changed = (directory / CURRENT_FILE).stat().st_mtime
+    except FileNotFoundError:
+        return None
+    try:
+        updates = (directory / name / UPDATES_FILE).stat()
+    except FileNotFoundError:
+        return name, 0, changed
+    return name, updates.st_size, max(changed, updates.st_mtime)
+
+
+def similar_adverts(advert_id: int, k: int = TOP_K) -> list[tuple[int, float]]:
+    """
+    Returns the ids and scores of the active adverts most similar to an
+    advert, the most similar first.
+
+    Args:
+        advert_id (int): The primary key of the advert.
+        k (int, optional): The maximum number of adverts returned.
+
+    Returns:
+        list[tuple[int, float]]: The advert ids and cosine similarities.
+    """
+    index = load_index()
+    return index.similar(advert_id, k) if index else []
+
+
+def index_advert(advert: Advert) -> None:
+    """
+    Adds or replaces the vector of an advert once the transaction commits.
+    Inactive adverts are removed from the results.
+    """
+    def append() -> None:
+        index = load_index()
+        if index is None:
+            return
+        vector = None
+        if advert.is_active:
+            vector = vectorise(term_counts(advert.description, advert.subject.title), index.idf)
+        index.append(advert.pk, vector)
+
+    transaction.on_commit(append)
+
+
+def remove_advert(advert_id: int) -> None:
+    def append() -> None:
+        index = load_index()
+        if index is not None:
+            index.append(advert_id, None)
+
+    transaction.on_commit(append)
+
+
+def rebuild(batch_size: int = 5000) -> dict[str, int]:
+    """
+    Rebuilds the index from all active adverts. Adverts saved while it was
+    built are indexed again into the new index.
+
+    Args:
+        batch_size (int, optional): Number of rows fetched per query.
+
+    Returns:
+        dict[str, int]: The number of indexed adverts and of adverts indexed
+            again.
+    """
+    old = load_index()
+    old_updates = old.folder / UPDATES_FILE if old else None
+    replay_from = old_updates.stat().st_size if old_updates and old_updates.exists() else 0
+
+    adverts = Advert.objects.filter(is_active=True).values_list(
+        'id', 'description', 'subject__title').order_by('id')
+    directory = Path(settings.SIMILAR_ADVERTS_DIR)
+    name = write_index(directory, adverts.iterator(chunk_size=batch_size))
+    index = load_index()
+
+    changed = set()
+    if old_updates:
+        try:
+            with open(old_updates, 'rb') as updates:
+                updates.seek(replay_from)
+                changed = {json.loads(line)['advert'] for line in updates.read().splitlines()}
+        except FileNotFoundError:
+            pass
+    found = set()
+    changed_ids = sorted(changed)
+    for start in range(0, len(changed_ids), batch_size):
+        batch = changed_ids[start:start + batch_size]
+        for advert in Advert.objects.filter(pk__in=batch).select_related('subject'):
+            found.add(advert.pk)
+            vector = vectorise(term_counts(advert.description, advert.subject.title), index.idf) \
+                if advert.is_active else None
+            index.append(advert.pk, vector)
+    for advert_id in changed - found:
+        index.append(advert_id, None)
+    remove_old_indexes(directory, name)
+
+    purge_pages('similar_adverts')
+    return {'adverts': len(index.ids), 'replayed': len(changed)}
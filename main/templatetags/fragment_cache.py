@@ -0,0 +1,102 @@
+import threading
+from collections import Counter
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+register = template.Library()
+
+STATS_KEY = 'fragment:stats:{name}:{outcome}'
+OUTCOMES = ('hits', 'misses')
+
+# Renders counted in-process before the counters are added to the cache, so
+# rendering a cached fragment usually costs a single cache round trip
+STATS_FLUSH_EVERY = 1000
+
+pending_stats: Counter[str] = Counter()
+pending_lock = threading.Lock()
+
+
+def record(name: str, outcome: str) -> None:
+    with pending_lock:
+        pending_stats[STATS_KEY.format(name=name, outcome=outcome)] += 1
+        if pending_stats.total() < STATS_FLUSH_EVERY:
+            return
+    flush_stats()
+
+
+def flush_stats() -> None:
+    """
+    Adds the counters of this process to the shared counters in the cache.
+    """
+    with pending_lock:
+        counts = dict(pending_stats)
+        pending_stats.clear()
+    for key, count in counts.items():
+        if not cache.add(key, count, timeout=None):
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                cache.set(key, count, timeout=None)
+
+
+def get_stats(name: str) -> dict[str, int]:
+    """
+    Returns the hit and miss counters of a cached fragment. Counts other
+    processes haven't flushed yet are missing.
+    """
+    flush_stats()
+    keys = {outcome: STATS_KEY.format(name=name, outcome=outcome) for outcome in OUTCOMES}
+    values = cache.get_many(keys.values())
+    return {outcome: values.get(key, 0) for outcome, key in keys.items()}
+
+
+def reset_stats(name: str) -> None:
+    keys = [STATS_KEY.format(name=name, outcome=outcome) for outcome in OUTCOMES]
+    with pending_lock:
+        for key in keys:
+            pending_stats.pop(key, None)
+    cache.delete_many(keys)
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist: template.NodeList, name: str, vary_on: list):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context: template.Context) -> str:
+        key = make_template_fragment_key(
+            self.name, [var.resolve(context) for var in self.vary_on])
+        value = cache.get(key)
+        if value is None:
+            record(self.name, 'misses')
+            value = self.nodelist.render(context)
+            cache.set(key, value, settings.FRAGMENT_CACHE_TIMEOUT)
+        else:
+            record(self.name, 'hits')
+        return value
+
+
+@register.tag('cache_fragment')
+def do_cache_fragment(parser, token) -> FragmentCacheNode:
+    """
+    Caches the enclosed template fragment under a key built from the fragment
+    name and the given variables, and counts cache hits and misses per
+    fragment name in batches (see `get_stats`). The variables should identify the version of every object
+    the fragment displays, so changing any of them naturally misses the
+    cache instead of requiring explicit invalidation.
+
+    Usage:
+        {% cache_fragment advert_row advert.pk advert.updated_at %}
+            ...
+        {% endcache_fragment %}
+    """
+    nodelist = parser.parse(('endcache_fragment',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires at least a fragment name.")
+    return FragmentCacheNode(nodelist, bits[1], [parser.compile_filter(bit) for bit in bits[2:]])
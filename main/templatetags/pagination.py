@@ -0,0 +1,20 @@
+from django import template
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def query_replace(context: template.Context, **kwargs) -> str:
+    """
+    Returns the current query string with the given parameters replaced, so
+    that pagination links keep the active search and filter parameters.
+
+    Usage: <a href="?{% query_replace cursor=page.next_cursor %}">
+    """
+    query = context['request'].GET.copy()
+    for key, value in kwargs.items():
+        if value is None:
+            query.pop(key, None)
+        else:
+            query[key] = value
+    return query.urlencode()
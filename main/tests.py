@@ -1,3 +1,1599 @@
-from django.test import TestCase
+import base64
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+from dataclasses import replace
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, connections, models, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path, reverse
+
+from main.models import Profile, Chat, Conversation, Advert, AdvertRanking, AdvertRecommendation, Application, \
+    Review, Subject, SubjectClosure, SubjectRecommendation, RANKING_ORDERING
+from main import database, datagen, page_cache, recommendations, search, similar, urls as main_urls
+from main.pagination import DEFAULT_PAGE_SIZE, paginate_keyset
+from main.routers import PrimaryReplicaRouter, read_from_replica
+from main.templatetags import fragment_cache
+from main.templatetags.fragment_cache import get_stats
+
+# Folders of the similar adverts indexes used by the tests, removed at exit
+similar_index_dirs = []
+
+
+def similar_index_dir() -> str:
+    directory = tempfile.TemporaryDirectory()
+    similar_index_dirs.append(directory)
+    return directory.name
+
+
+def isolated_similar_index(test_class):
+    """
+    Gives a test class its own empty similar adverts index folder, for the
+    tests that rebuild the index.
+    """
+    return override_settings(SIMILAR_ADVERTS_DIR=similar_index_dir())(test_class)
+
+
+# The index of the development data is never read by the tests
+module_similar_index = override_settings(SIMILAR_ADVERTS_DIR=similar_index_dir())
+
+
+def setUpModule():
+    module_similar_index.enable()
+
+
+def tearDownModule():
+    module_similar_index.disable()
+
+
+class AdvertReviewStatsTests(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user('teacher', password='password')
+        self.students = [User.objects.create_user(f'student{i}', password='password')
+                         for i in range(3)]
+        self.subject = Subject.objects.create(title='Math')
+        self.advert = Advert.objects.create(
+            owner=self.teacher, subject=self.subject, price=5)
+
+    def review(self, student: User, rating: int) -> Review:
+        return Review.objects.create(advert=self.advert, reviewer=student, rating=rating)
+
+    def test_stats_follow_review_create_update_delete(self):
+        first = self.review(self.students[0], 4)
+        self.review(self.students[1], 10)
+        self.advert.refresh_from_db()
+        self.assertEqual(self.advert.review_count, 2)
+        self.assertEqual(self.advert.rating_sum, 14)
+        self.assertEqual(self.advert.rating_histogram[3], 1)
+        self.assertEqual(self.advert.get_average_rating(), 7)
+
+        first.rating = 6
+        first.save()
+        self.advert.refresh_from_db()
+        self.assertEqual(self.advert.rating_sum, 16)
+        self.assertEqual(self.advert.rating_histogram[3], 0)
+        self.assertEqual(self.advert.rating_histogram[5], 1)
+
+        first.delete()
+        self.advert.refresh_from_db()
+        self.assertEqual(self.advert.review_count, 1)
+        self.assertEqual(self.advert.get_average_rating(), 10)
+
+    def test_average_rating_without_reviews(self):
+        self.assertIsNone(self.advert.get_average_rating())
+
+    def test_rebuild_command_fixes_drift(self):
+        self.review(self.students[0], 8)
+        Advert.objects.filter(pk=self.advert.pk).update(review_count=0, rating_sum=0)
+
+        call_command('rebuild_review_stats', stdout=StringIO())
+
+        self.advert.refresh_from_db()
+        self.assertEqual(self.advert.review_count, 1)
+        self.assertEqual(self.advert.rating_sum, 8)
+
+
+class AdvertRankingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.subject = Subject.objects.create(title='Math')
+        self.students = [User.objects.create_user(f'student{i}') for i in range(10)]
+        self.adverts = [Advert.objects.create(owner=User.objects.create_user(f'teacher{i}'),
+                                              subject=self.subject, price=5)
+                        for i in range(3)]
+
+    def review(self, advert: Advert, ratings: list[int]) -> list[Review]:
+        return [Review.objects.create(advert=advert, reviewer=student, rating=rating)
+                for student, rating in zip(self.students, ratings)]
+
+    def scores(self) -> list[float]:
+        rankings = AdvertRanking.objects.in_bulk([advert.id for advert in self.adverts])
+        return [round(rankings[advert.id].score, 6) for advert in self.adverts]
+
+    def test_many_good_reviews_beat_a_single_perfect_one(self):
+        self.review(self.adverts[0], [10])
+        self.review(self.adverts[1], [9] * 10)
+        self.review(self.adverts[2], [3, 4, 5])
+        call_command('rebuild_advert_rankings', stdout=StringIO())
+        single, many, bad = self.scores()
+        self.assertGreater(many, single)
+        self.assertGreater(single, bad)
+
+    def test_recent_reviews_weigh_more(self):
+        self.review(self.adverts[2], [2, 2, 2])
+        old = self.review(self.adverts[0], [10, 10])
+        self.review(self.adverts[1], [10, 10])
+        Review.objects.filter(pk__in=[review.pk for review in old]).update(
+            updated_at=models.F('updated_at') - timedelta(days=3 * 365))
+        call_command('rebuild_advert_rankings', stdout=StringIO())
+        old_score, recent_score, _ = self.scores()
+        self.assertGreater(recent_score, old_score)
+
+    @patch.object(AdvertRanking, 'prior_rating', return_value=6)
+    def test_incremental_refresh_matches_rebuild(self, prior_rating):
+        first, second = self.review(self.adverts[0], [8, 6])
+        self.review(self.adverts[1], [7])
+        first.rating = 2
+        first.save()
+        second.advert = self.adverts[2]
+        second.save()
+        self.adverts[1].reviews.get().delete()
+        self.adverts[1].subject = Subject.objects.create(title='Physics')
+        self.adverts[1].is_active = False
+        self.adverts[1].save()
+
+        incremental = self.scores()
+        ranking = AdvertRanking.objects.get(advert=self.adverts[1])
+        self.assertEqual((ranking.subject, ranking.is_active), (self.adverts[1].subject, False))
+        call_command('rebuild_advert_rankings', stdout=StringIO())
+        for refreshed, rebuilt in zip(incremental, self.scores()):
+            self.assertAlmostEqual(refreshed, rebuilt, places=4)
+
+    @override_settings(PAGE_CACHE_TIMEOUT=0)
+    def test_top_teachers_pages(self):
+        self.review(self.adverts[1], [9] * 5)
+        self.review(self.adverts[2], [2] * 5)
+        self.adverts[0].is_active = False
+        self.adverts[0].save()
+        expected = [self.adverts[1], self.adverts[2]]
+
+        response = self.client.get(reverse('subject_detail', args=[self.subject.id]))
+        self.assertEqual(list(response.context['adverts']), expected)
+        response = self.client.get(reverse('advert_list'), {'sort': 'top', 'subject': self.subject.id})
+        self.assertEqual(list(response.context['advert_list']), expected)
+
+        with self.assertNumQueries(1):
+            adverts = paginate_keyset(Advert.objects.ranked(self.subject), None,
+                                      ordering=RANKING_ORDERING, per_page=1)
+        self.assertEqual(list(adverts), expected[:1])
+        adverts = paginate_keyset(Advert.objects.ranked(self.subject), adverts.next_cursor,
+                                  ordering=RANKING_ORDERING, per_page=1)
+        self.assertEqual(list(adverts), expected[1:])
+        self.assertFalse(adverts.has_next)
+
+    def test_new_adverts_are_ranked(self):
+        advert = Advert.objects.create(owner=User.objects.create_user('teacher'), subject=self.subject, price=5)
+        self.assertIn(advert, Advert.objects.ranked(self.subject))
+
+    @skipUnless(connection.vendor == 'sqlite', 'The query plan is read from SQLite')
+    def test_top_adverts_are_read_from_the_ranking_index(self):
+        for subject, index in [(self.subject, 'ranking_active_subj_score_idx'), (None, 'ranking_active_score_idx')]:
+            # A page after a cursor, as read by the subject page and the top sort
+            plan = Advert.objects.ranked(subject).with_listing_data().filter(
+                models.Q(score__lt=8) | models.Q(score=8, ranked_id__lt=100)
+            ).order_by(*RANKING_ORDERING)[:26].explain()
+            with self.subTest(subject=subject):
+                self.assertIn(f'main_advertranking USING INDEX {index}', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        self.math, self.physics, self.art = [Subject.objects.create(title=title)
+                                             for title in ('Math', 'Physics', 'Art')]
+        teachers = [User.objects.create_user(f'teacher{i}') for i in range(4)]
+        self.algebra, self.mechanics, self.painting, self.geometry = [
+            Advert.objects.create(owner=teacher, subject=subject, price=5)
+            for teacher, subject in zip(teachers, (self.math, self.physics, self.art, self.physics))]
+        # Students of algebra mostly also applied to mechanics
+        for i, adverts in enumerate([
+            [self.algebra, self.mechanics],
+            [self.algebra, self.mechanics, self.geometry],
+            [self.algebra, self.painting],
+            [self.mechanics],
+        ]):
+            student = User.objects.create_user(f'student{i}')
+            for advert in adverts:
+                Application.objects.create(advert=advert, applicant=student, description='Hi')
+
+    def test_top_neighbours_match_in_any_chunk_size(self):
+        rng = random.Random(0)
+        users = np.array([rng.randrange(50) for _ in range(400)])
+        items = np.array([rng.randrange(30) * 3 for _ in range(400)])
+        results = []
+        for chunk_pairs in (1, 100, 10 ** 6):
+            chunks = list(recommendations.top_neighbours(users, items, k=4, chunk_pairs=chunk_pairs))
+            results.append([np.concatenate(column).tolist() for column in zip(*chunks)])
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0], results[2])
+
+        sources, neighbours, scores, ranks = results[0]
+        self.assertTrue(set(neighbours) <= set(items.tolist()))
+        self.assertNotIn(True, [source == neighbour for source, neighbour in zip(sources, neighbours)])
+        self.assertLessEqual(max(ranks), 3)
+
+    def test_rebuild_and_detail_pages(self):
+        self.geometry.is_active = False
+        self.geometry.save()
+        call_command('rebuild_recommendations', stdout=StringIO())
+
+        recommended = AdvertRecommendation.objects.filter(advert=self.algebra).order_by('rank')
+        self.assertEqual([row.recommended for row in recommended], [self.mechanics, self.painting])
+        # 2 shared students out of 3 applicants each
+        self.assertAlmostEqual(recommended[0].score, 2 / 3)
+        self.assertEqual([row.recommended for row in SubjectRecommendation.objects.filter(
+            subject=self.math).order_by('rank')], [self.physics, self.art])
+
+        # Deactivated adverts are hidden until the next rebuild
+        self.painting.is_active = False
+        self.painting.save()
+        with override_settings(PAGE_CACHE_TIMEOUT=0):
+            response = self.client.get(reverse('advert_detail', args=[self.algebra.id]))
+            self.assertEqual([row.recommended for row in response.context['recommendations']], [self.mechanics])
+            self.assertContains(response, "teacher1's Physics advert")
+            response = self.client.get(reverse('subject_detail', args=[self.math.id]))
+            self.assertEqual([row.recommended for row in response.context['recommendations']],
+                             [self.physics, self.art])
+
+
+class SimilarAdvertTests(TestCase):
+    def setUp(self):
+        self.enterContext(override_settings(SIMILAR_ADVERTS_DIR=similar_index_dir()))
+        self.math, self.art = Subject.objects.create(title='Math'), Subject.objects.create(title='Art')
+        teachers = [User.objects.create_user(f'teacher{i}') for i in range(5)]
+        self.algebra, self.geometry, self.painting, self.sculpture, self.drawing = [
+            Advert.objects.create(owner=teacher, subject=subject, price=5, description=description)
+            for teacher, subject, description in zip(teachers, (self.math, self.math, self.art, self.art, self.art), (
+                'Equations, proofs and exam preparation.',
+                'Triangles, circles and proofs for the exam.',
+                'Oil painting and colour theory.',
+                'Clay modelling and colour.',
+                'Sketching with pencils.',
+            ))]
+
+    def brute_force(self, advert: Advert) -> list[tuple[int, float]]:
+        index = similar.load_index()
+        vectors = {other.id: dict(zip(*[values.tolist() for values in similar.vectorise(
+            similar.term_counts(other.description, other.subject.title), index.idf)]))
+            for other in Advert.objects.filter(is_active=True).select_related('subject')}
+        scores = [(other_id, sum(weight * vectors[advert.id].get(term, 0) for term, weight in vector.items()))
+                  for other_id, vector in vectors.items() if other_id != advert.id]
+        return sorted([score for score in scores if score[1] > 0], key=lambda score: (-score[1], score[0]))
+
+    def assertSimilar(self, advert: Advert) -> None:
+        expected = self.brute_force(advert)
+        results = similar.similar_adverts(advert.id)
+        self.assertEqual([advert_id for advert_id, _ in results], [advert_id for advert_id, _ in expected])
+        for (_, score), (_, expected_score) in zip(results, expected):
+            self.assertAlmostEqual(score, expected_score, places=5)
+
+    def test_rebuild_ranks_by_cosine_similarity(self):
+        self.assertEqual(similar.similar_adverts(self.algebra.id), [])
+        call_command('rebuild_similar_adverts', stdout=StringIO())
+
+        results = similar.similar_adverts(self.algebra.id)
+        self.assertEqual(results[0][0], self.geometry.id)
+        self.assertSimilar(self.algebra)
+        self.assertSimilar(self.painting)
+        self.assertEqual(similar.similar_adverts(self.algebra.id, k=1), results[:1])
+
+    def test_saved_adverts_are_indexed_without_rebuild(self):
+        self.drawing.is_active = False
+        self.drawing.save()
+        call_command('rebuild_similar_adverts', stdout=StringIO())
+        index = similar.load_index()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            statistics = Advert.objects.create(owner=self.algebra.owner, subject=self.art, price=5,
+                                               description='Exam preparation with proofs.')
+            self.painting.description = 'Sketching and colour.'
+            self.painting.save()
+            self.drawing.is_active = True
+            self.drawing.save()
+            self.sculpture.is_active = False
+            self.sculpture.save()
+        self.assertEqual(similar.load_index(), index)
+        for advert in (self.algebra, self.painting, statistics, self.drawing):
+            self.assertSimilar(advert)
+        self.assertNotIn(self.sculpture.id, [advert_id for advert_id, _ in similar.similar_adverts(self.painting.id)])
+
+        # Other processes read the appended updates
+        other_process = similar.SimilarIndex(index.folder)
+        self.assertEqual(other_process.similar(self.algebra.id), similar.similar_adverts(self.algebra.id))
+
+        # Rebuilding folds the updates into the new index
+        call_command('rebuild_similar_adverts', stdout=StringIO())
+        self.assertNotEqual(similar.load_index().folder, index.folder)
+        self.assertFalse(index.folder.exists())
+        self.assertSimilar(statistics)
+
+    def test_adverts_saved_during_a_rebuild_are_replayed(self):
+        call_command('rebuild_similar_adverts', stdout=StringIO())
+        old = similar.load_index()
+        write_index = similar.write_index
+
+        def save_while_building(directory, rows):
+            rows = list(rows)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.painting.description = 'Equations and proofs for the exam.'
+                self.painting.save()
+            return write_index(directory, rows)
+
+        with patch.object(similar, 'write_index', side_effect=save_while_building):
+            counts = similar.rebuild()
+        self.assertEqual(counts['replayed'], 1)
+        self.assertFalse(old.folder.exists())
+        self.assertIn(self.painting.id, [advert_id for advert_id, _ in similar.similar_adverts(self.algebra.id)])
+        self.assertSimilar(self.painting)
+
+    def test_detail_page_lists_similar_adverts(self):
+        call_command('rebuild_similar_adverts', stdout=StringIO())
+        with override_settings(PAGE_CACHE_TIMEOUT=0):
+            response = self.client.get(reverse('advert_detail', args=[self.algebra.id]))
+            self.assertEqual(response.context['similar_adverts'][0], self.geometry)
+            self.assertContains(response, "teacher1's Math advert")
+
+            # A changed similar advert changes the ETag of the page
+            with self.captureOnCommitCallbacks(execute=True):
+                self.geometry.description = 'Triangles and circles.'
+                self.geometry.save()
+            etag = response['ETag']
+            response = self.client.get(reverse('advert_detail', args=[self.algebra.id]), HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        self.math = Subject.objects.create(title='Math')
+        self.teachers = [User.objects.create_user(f'teacher{i}') for i in range(3)]
+        self.adverts = [Advert.objects.create(owner=teacher, subject=self.math, price=10 + i)
+                        for i, teacher in enumerate(self.teachers)]
+        self.student = User.objects.create_user('student')
+        Profile.objects.create(user=self.student, full_name='Student')
+        Review.objects.create(advert=self.adverts[0], reviewer=self.student, rating=8)
+
+    def get(self, name: str, *args, **params):
+        return self.client.get(reverse(name, args=args), params)
+
+    def test_list_pages_by_cursor_with_selected_fields(self):
+        self.adverts[1].is_active = False
+        self.adverts[1].save()
+
+        with self.assertNumQueries(1):
+            response = self.get('api_list', 'adverts', fields='subject_title,average_rating,review_count',
+                                page_size=1)
+        self.assertEqual(response.json()['results'], [
+            {'subject_title': 'Math', 'average_rating': 8.0, 'review_count': 1}])
+        self.assertIsNone(response.json()['previous_cursor'])
+
+        response = self.get('api_list', 'adverts', fields='id,owner_username', page_size=1,
+                            cursor=response.json()['next_cursor'])
+        self.assertEqual(response.json()['results'], [{'id': self.adverts[2].id, 'owner_username': 'teacher2'}])
+        self.assertIsNone(response.json()['next_cursor'])
+
+        response = self.get('api_list', 'reviews', advert=self.adverts[0].id)
+        self.assertEqual(response.json()['results'][0]['reviewer_username'], 'student')
+        self.assertEqual(self.get('api_list', 'reviews', advert=self.adverts[2].id).json()['results'], [])
+
+    def test_detail_and_bulk(self):
+        response = self.get('api_detail', 'profiles', self.student.profile.id)
+        self.assertEqual(response.json(), {'id': self.student.profile.id, 'user': self.student.id,
+                                           'username': 'student', 'full_name': 'Student', 'description': '',
+                                           'role': 'student'})
+        self.assertEqual(self.get('api_detail', 'subjects', self.math.id + 1).status_code, 404)
+
+        ids = [self.adverts[2].id, 0, self.adverts[0].id, self.adverts[2].id]
+        with self.assertNumQueries(1):
+            response = self.get('api_bulk', 'adverts', ids=','.join(map(str, ids)), fields='price')
+        self.assertEqual(response.json(), {'results': [{'price': 12}, {'price': 10}], 'missing': [0]})
+
+    def test_invalid_requests(self):
+        for response, status in [
+            (self.get('api_list', 'users'), 404),
+            (self.get('api_list', 'subjects', fields='id,password'), 400),
+            (self.get('api_list', 'subjects', page_size=0), 400),
+            (self.get('api_list', 'subjects', page_size='many'), 400),
+            (self.get('api_list', 'adverts', subject='math'), 400),
+            (self.get('api_bulk', 'subjects'), 400),
+            (self.get('api_bulk', 'subjects', ids='1,x'), 400),
+            (self.client.post(reverse('api_list', args=['subjects'])), 405),
+        ]:
+            self.assertEqual(response.status_code, status)
+        self.assertEqual(self.get('api_list', 'subjects', fields='id,password').json(),
+                         {'error': 'Unknown fields: password'})
+
+    def test_unsafe_methods_are_answered_as_json(self):
+        for method in ('post', 'put', 'delete'):
+            with self.subTest(method=method):
+                response = getattr(self.client, method)(reverse('api_detail', args=['subjects', self.math.id]))
+                self.assertEqual(response.status_code, 405)
+                self.assertEqual(response['Allow'], 'GET, HEAD')
+                self.assertEqual(response.json(), {'error': f'Method not allowed: {method.upper()}'})
+        self.assertEqual(self.client.head(reverse('api_list', args=['subjects'])).status_code, 200)
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=0)
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        fragment_cache.pending_stats.clear()
+        self.teacher = User.objects.create_user('teacher')
+        self.student = User.objects.create_user('student')
+        self.subject = Subject.objects.create(title='Math')
+        self.advert = Advert.objects.create(
+            owner=self.teacher, subject=self.subject, price=5, description='Algebra')
+
+    def test_rows_are_cached_until_a_version_changes(self):
+        url = reverse('advert_list')
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(get_stats('advert_list_row'), {'hits': 1, 'misses': 1})
+
+        Review.objects.create(advert=self.advert, reviewer=self.student, rating=7)
+        self.assertContains(self.client.get(url), '<td class="py-2 px-4 border">7.0</td>')
+
+        self.teacher.username = 'renamed'
+        self.teacher.save()
+        self.assertContains(self.client.get(url), 'renamed')
+
+        self.advert.description = 'Geometry'
+        self.advert.save()
+        self.assertContains(self.client.get(url), 'Geometry')
+        self.assertEqual(get_stats('advert_list_row'), {'hits': 1, 'misses': 4})
+
+    def test_counters_are_flushed_in_batches(self):
+        url = reverse('advert_list')
+        with patch.object(cache, 'add', wraps=cache.add) as add, \
+                patch.object(fragment_cache, 'STATS_FLUSH_EVERY', 3):
+            self.client.get(url)
+            self.client.get(url)
+            self.assertFalse([call for call in add.call_args_list if call.args[0].startswith('fragment:stats')])
+            self.client.get(url)
+            self.assertTrue([call for call in add.call_args_list if call.args[0].startswith('fragment:stats')])
+        self.assertEqual(get_stats('advert_list_row'), {'hits': 2, 'misses': 1})
+
+    def test_stats_command(self):
+        self.client.get(reverse('subject_detail', args=[self.subject.pk]))
+        out = StringIO()
+        call_command('fragment_cache_stats', 'subject_advert_row', '--reset', stdout=out)
+        self.assertIn('subject_advert_row: 0 hits, 1 misses', out.getvalue())
+        self.assertEqual(get_stats('subject_advert_row'), {'hits': 0, 'misses': 0})
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher')
+        self.student = User.objects.create_user('student')
+        self.math = Subject.objects.create(title='Math')
+        self.physics = Subject.objects.create(title='Physics')
+        self.math_advert = Advert.objects.create(owner=self.teacher, subject=self.math, price=5)
+        self.physics_advert = Advert.objects.create(owner=self.teacher, subject=self.physics, price=5)
+
+    def get(self, url: str) -> str | None:
+        return self.client.get(url).headers.get('X-Page-Cache')
+
+    def page_key(self, url: str) -> str:
+        return page_cache.PAGE_KEY.format(digest=hashlib.md5(url.encode()).hexdigest())
+
+    def lock_key(self, url: str) -> str:
+        return page_cache.LOCK_KEY.format(digest=hashlib.md5(url.encode()).hexdigest())
+
+    def test_anonymous_pages_are_cached_per_query_string(self):
+        url = reverse('subject_list')
+        self.assertEqual(self.get(url), 'miss')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(url), 'hit')
+        self.assertEqual(self.get(f'{url}?query=math'), 'miss')
+        self.assertEqual(self.get(f'{url}?query=math'), 'hit')
+
+    def test_purges_only_pages_showing_the_changed_object(self):
+        urls = {
+            'math': reverse('advert_detail', args=[self.math_advert.id]),
+            'physics': reverse('advert_detail', args=[self.physics_advert.id]),
+            'math_subject': reverse('subject_detail', args=[self.math.id]),
+            'subjects': reverse('subject_list'),
+        }
+        for url in urls.values():
+            self.get(url)
+
+        Review.objects.create(advert=self.math_advert, reviewer=self.student, rating=7)
+        self.assertEqual({name: self.get(url) for name, url in urls.items()},
+                         {'math': 'miss', 'physics': 'hit', 'math_subject': 'miss', 'subjects': 'hit'})
+        self.assertContains(self.client.get(urls['math']), '7.0')
+
+        self.physics.title = 'Astrophysics'
+        self.physics.save()
+        self.assertEqual({name: self.get(url) for name, url in urls.items()},
+                         {'math': 'hit', 'physics': 'miss', 'math_subject': 'hit', 'subjects': 'miss'})
+
+    def test_reviews_purge_the_ranked_subject_pages(self):
+        adverts = {Advert.objects.create(owner=User.objects.create_user(f'teacher{i}'), subject=self.math, price=5)
+                   for i in range(DEFAULT_PAGE_SIZE)} | {self.math_advert}
+        url = reverse('subject_detail', args=[self.math.id])
+        first_page = set(self.client.get(url).context['adverts'])
+        self.assertEqual(self.get(url), 'hit')
+
+        # The best review moves the advert missing from the first page onto it
+        [unlisted] = adverts - first_page
+        Review.objects.create(advert=unlisted, reviewer=self.student, rating=10)
+        response = self.client.get(url)
+        self.assertEqual(response.headers.get('X-Page-Cache'), 'miss')
+        self.assertEqual(list(response.context['adverts'])[0], unlisted)
+
+    def test_async_views(self):
+        url = reverse('advert_detail', args=[self.math_advert.id])
+        with override_settings(ROOT_URLCONF=__name__):
+            self.assertEqual(self.get(url), 'miss')
+            self.assertEqual(self.get(url), 'hit')
+            self.math_advert.save()
+            self.assertEqual(self.get(url), 'miss')
+
+    def test_skips_logged_in_users_and_pending_messages(self):
+        url = reverse('subject_list')
+        self.client.cookies['messages'] = 'pending'
+        self.assertIsNone(self.get(url))
+        del self.client.cookies['messages']
+
+        self.client.force_login(self.student)
+        self.assertIsNone(self.get(url))
+
+    def test_waits_for_a_page_rendered_by_another_request(self):
+        url = reverse('subject_detail', args=[self.math.id])
+        self.get(url)
+        entry = cache.get(self.page_key(url))
+        cache.delete(self.page_key(url))
+
+        cache.add(self.lock_key(url), 1)
+        timer = threading.Timer(0.2, cache.set, [self.page_key(url), entry])
+        timer.start()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(url), 'hit')
+        timer.join()
+
+    def test_backs_off_while_waiting_and_gives_up(self):
+        url = reverse('subject_detail', args=[self.math.id])
+        cache.add(self.lock_key(url), 1)
+        request = RequestFactory().get(url)
+        steps = page_cache.find_page(request, page_cache.page_digest(request))
+        self.assertEqual([next(steps) for _ in range(6)], [0.05, 0.1, 0.2, 0.4, 0.8, 1.0])
+
+        with override_settings(PAGE_CACHE_LOCK_TIMEOUT=0.1):
+            response = self.client.get(url)
+        self.assertIsNone(response.headers.get('X-Page-Cache'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_serves_outdated_page_while_another_request_renders_it(self):
+        url = reverse('subject_detail', args=[self.math.id])
+        self.get(url)
+        self.math.save()
+        cache.add(self.lock_key(url), 1)
+        self.assertEqual(self.get(url), 'stale')
+        cache.delete(self.lock_key(url))
+        self.assertEqual(self.get(url), 'miss')
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=0)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher')
+        self.student = User.objects.create_user('student')
+        Profile.objects.create(user=self.teacher, role=Profile.Role.TEACHER)
+        Profile.objects.create(user=self.student)
+        self.subject = Subject.objects.create(title='Math')
+        self.advert = Advert.objects.create(owner=self.teacher, subject=self.subject, price=5)
+        self.url = reverse('advert_detail', args=[self.advert.id])
+
+    def etag(self, url: str) -> str:
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_not_modified_without_rendering(self):
+        for url in (self.url, reverse('subject_detail', args=[self.subject.id])):
+            etag = self.etag(url)
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=self.client.get(self.url)['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_of_dependents(self):
+        etags = {self.etag(self.url)}
+        review = Review.objects.create(advert=self.advert, reviewer=self.student, rating=7)
+        etags.add(self.etag(self.url))
+        self.student.username = 'pupil'
+        self.student.save()
+        etags.add(self.etag(self.url))
+        review.delete()
+        etags.add(self.etag(self.url))
+        self.subject.title = 'Algebra'
+        self.subject.save()
+        etags.add(self.etag(self.url))
+        self.assertEqual(len(etags), 5)
+
+        subject_url = reverse('subject_detail', args=[self.subject.id])
+        etag = self.etag(subject_url)
+        Review.objects.create(advert=self.advert, reviewer=self.student, rating=7)
+        self.assertNotEqual(self.etag(subject_url), etag)
+
+    def test_validators_depend_on_the_viewer(self):
+        anonymous = self.client.get(self.url)
+        self.assertTrue(anonymous.has_header('Last-Modified'))
+
+        self.client.force_login(self.student)
+        student = self.client.get(self.url)
+        self.assertFalse(student.has_header('Last-Modified'))
+        self.client.force_login(self.teacher)
+        teacher = self.client.get(self.url)
+        self.assertEqual(len({anonymous['ETag'], student['ETag'], teacher['ETag']}), 3)
+
+        # Only the owner sees the applications
+        Application.objects.create(advert=self.advert, applicant=self.student)
+        self.assertNotEqual(self.etag(self.url), teacher['ETag'])
+        self.client.force_login(self.student)
+        self.assertEqual(self.etag(self.url), student['ETag'])
+
+    def test_pages_with_pending_messages_are_rendered(self):
+        etag = self.etag(self.url)
+        self.client.cookies['messages'] = 'pending'
+        with patch('django.contrib.messages.storage.cookie.CookieStorage._decode', return_value=['Saved']):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_async_views(self):
+        with override_settings(ROOT_URLCONF=__name__):
+            etag = self.etag(self.url)
+            self.client.force_login(self.teacher)
+            self.assertNotEqual(self.etag(self.url), etag)
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.etag(self.url))
+        self.assertEqual(response.status_code, 304)
+
+    def test_cached_pages(self):
+        with override_settings(PAGE_CACHE_TIMEOUT=600):
+            etag = self.etag(self.url)
+            with self.assertNumQueries(0):
+                response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertEqual(response['ETag'], etag)
+
+
+class ListingQueryCountTests(TestCase):
+    """
+    The listing pages must run a fixed number of queries regardless of how
+    many adverts they show. The expected counts are:
+
+    - advertList: 2 queries (adverts joined with owner and subject, facet
+      counts when they are not cached)
+    - subjectDetail: 4 queries (subject, dependencies, adverts,
+      recommendations)
+    - profileDetail of a teacher: 2 queries (profile with user, adverts)
+    - profileDetail of a student: 3 queries (profile with user, reviews,
+      applications)
+
+    The detail pages add the single validator query of their conditional GET
+    support.
+
+    A logged in viewer adds the session, user and unread message count
+    queries, plus one query for the viewer's profile on pages that check the
+    viewer's role.
+    """
+
+    def setUp(self):
+        self.teacher_group = Group.objects.create(name='teacher')
+        self.student = User.objects.create_user('student')
+        Profile.objects.create(user=self.student)
+        self.subjects = [Subject.objects.create(title=f'Subject {i}') for i in range(2)]
+        self.subjects[0].sub_subjects.add(self.subjects[1])
+        self.teachers = []
+
+    def add_adverts(self, count: int) -> None:
+        for _ in range(count):
+            teacher = User.objects.create_user(
+                f'teacher{len(self.teachers)}')
+            teacher.groups.add(self.teacher_group)
+            Profile.objects.create(user=teacher)
+            self.teachers.append(teacher)
+            advert = Advert.objects.create(
+                owner=teacher, subject=self.subjects[0], price=5)
+            Application.objects.create(
+                advert=advert, applicant=self.student, description='Hi')
+            Review.objects.create(advert=advert, reviewer=self.student, rating=7)
+
+    def assertConstantQueries(self, url: str, expected: int) -> None:
+        for count in (1, 5):
+            self.add_adverts(count)
+            cache.clear()
+            with self.assertNumQueries(expected):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_advert_list(self):
+        self.assertConstantQueries(reverse('advert_list'), 2)
+
+    def test_advert_list_logged_in(self):
+        self.client.force_login(self.student)
+        self.assertConstantQueries(reverse('advert_list'), 6)
+
+    def test_subject_detail(self):
+        self.assertConstantQueries(
+            reverse('subject_detail', args=[self.subjects[0].id]), 5)
+
+    def test_student_profile_detail(self):
+        self.client.force_login(self.student)
+        self.assertConstantQueries(
+            reverse('profile_detail', args=[self.student.profile.id]), 7)
+
+    def test_teacher_profile_detail(self):
+        self.add_adverts(1)
+        teacher = self.teachers[0]
+        self.client.force_login(teacher)
+        self.assertConstantQueries(
+            reverse('profile_detail', args=[teacher.profile.id]), 6)
+
+
+@isolated_similar_index
+class ViewQueryCountTests(TestCase):
+    """
+    Upper bounds on the number of queries of every view, for each role that
+    can use it, against a generated dataset. The bounds are fixed numbers, so
+    a query per displayed row makes the views exceed them. The cache is
+    cleared before every request, so the bounds hold with a cold cache.
+
+    Logged in requests include the session and user queries, and usually the
+    unread message count and the viewer's profile for the navigation bar. The
+    detail pages include the validator queries of their conditional GET
+    support.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('generate_dataset', '--users', '150', '--subjects', '20', '--max-messages', '60',
+                     '--workers', '1', stdout=StringIO())
+        # A reviewed ongoing application, so that the student and the teacher can chat
+        cls.review = Review.objects.select_related('advert__owner', 'reviewer').filter(
+            advert__applications__applicant=models.F('reviewer'),
+            advert__applications__status=Application.Status.ONGOING,
+        ).first()
+        cls.advert = cls.review.advert
+        cls.student, cls.teacher = cls.review.reviewer, cls.advert.owner
+        cls.application = Application.objects.get(advert=cls.advert, applicant=cls.student)
+        # The subject with the most adverts
+        cls.subject = Subject.objects.annotate(
+            count=models.Count('adverts')).order_by('-count').first()
+
+    def assertMaxQueries(self, bound: int, method: str, url: str, data: dict | None = None) -> None:
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, data)
+        self.assertLess(response.status_code, 400)
+        if len(context) > bound:
+            queries = '\n'.join(f'{number}. {query["sql"]}'
+                                 for number, query in enumerate(context.captured_queries, start=1))
+            self.fail(f'{method.upper()} {url} ran {len(context)} queries, more than {bound}:\n{queries}')
+
+    def check(self, role: str, cases: list[tuple]) -> None:
+        if role != 'anonymous':
+            self.client.force_login(getattr(self, role))
+        for bound, method, url, *data in cases:
+            with self.subTest(role=role, method=method, url=url):
+                self.assertMaxQueries(bound, method, url, *data)
+
+    def test_anonymous(self):
+        self.check('anonymous', [
+            (1, 'get', reverse('home')),
+            (1, 'get', reverse('subject_list')),
+            (2, 'get', reverse('subject_list') + '?query=algebra'),
+            (5, 'get', reverse('subject_detail', args=[self.subject.id])),
+            (2, 'get', reverse('advert_list')),
+            (3, 'get', reverse('advert_list') + f'?subject={self.subject.id}&include_sub_subjects=on'),
+            (5, 'get', reverse('advert_detail', args=[self.advert.id])),
+            (2, 'get', reverse('profile_detail', args=[self.teacher.profile.id])),
+            (2, 'get', reverse('profile_detail', args=[self.student.profile.id])),
+            (2, 'get', reverse('review_detail', args=[self.review.id])),
+            (1, 'get', reverse('api_list', args=['adverts']) + '?page_size=500'),
+            (1, 'get', reverse('api_list', args=['reviews']) + f'?advert={self.advert.id}'),
+            (1, 'get', reverse('api_detail', args=['profiles', self.teacher.profile.id])),
+            (1, 'get', reverse('api_bulk', args=['subjects']) + '?ids=' + ','.join(map(str, range(1, 501)))),
+            (0, 'get', reverse('login')),
+            (0, 'get', reverse('register')),
+            (0, 'get', reverse('logout')),
+            (0, 'get', reverse('chat_list')),
+            (0, 'get', reverse('advert_create')),
+        ])
+
+    def test_student(self):
+        teacher_id, advert_id = self.teacher.id, self.advert.id
+        self.check('student', [
+            (4, 'get', reverse('home')),
+            (6, 'get', reverse('advert_list')),
+            (9, 'get', reverse('advert_detail', args=[advert_id])),
+            (7, 'get', reverse('profile_detail', args=[self.student.profile.id])),
+            (6, 'get', reverse('profile_update', args=[self.student.profile.id])),
+            (8, 'post', reverse('profile_update', args=[self.student.profile.id]),
+             {'username': self.student.username, 'full_name': 'Student', 'description': ''}),
+            (5, 'get', reverse('chat_list')),
+            (8, 'get', reverse('chat_detail', args=[teacher_id])),
+            (10, 'post', reverse('chat_detail', args=[teacher_id]), {'message': 'Hello'}),
+            (5, 'get', reverse('chat_poll', args=[teacher_id])),
+            (3, 'get', reverse('application_create', args=[advert_id])),
+            (4, 'get', reverse('application_detail', args=[self.application.id])),
+            (4, 'get', reverse('application_update', args=[self.application.id])),
+            (4, 'post', reverse('application_update', args=[self.application.id]), {'description': 'Hi'}),
+            (4, 'get', reverse('review_create', args=[advert_id])),
+            (4, 'get', reverse('review_update', args=[self.review.id])),
+            (10, 'post', reverse('review_update', args=[self.review.id]), {'rating': 8, 'review': 'Good'}),
+        ])
+
+    def test_teacher(self):
+        advert_id = self.advert.id
+        advert_form = {'subject': self.advert.subject_id, 'description': 'Lessons', 'price': 10,
+                       'is_active': 'on'}
+        self.check('teacher', [
+            (6, 'get', reverse('advert_list')),
+            (10, 'get', reverse('advert_detail', args=[advert_id])),
+            (6, 'get', reverse('profile_detail', args=[self.teacher.profile.id])),
+            (5, 'get', reverse('chat_list')),
+            (8, 'get', reverse('chat_detail', args=[self.student.id])),
+            (5, 'get', reverse('advert_create')),
+            (4, 'get', reverse('advert_create', args=[self.subject.id])),
+            (7, 'post', reverse('advert_create'), advert_form),
+            (6, 'get', reverse('advert_update', args=[advert_id])),
+            (10, 'post', reverse('advert_update', args=[advert_id]), advert_form),
+            (4, 'get', reverse('application_detail', args=[self.application.id])),
+            (4, 'post', reverse('application_detail', args=[self.application.id]),
+             {'status': Application.Status.ONGOING}),
+        ])
+
+
+# Routes of the main app with the async versions of the read-heavy views
+urlpatterns = [
+    path(str(pattern.pattern), main_urls.ASYNC_VIEWS.get(pattern.callback, pattern.callback), name=pattern.name)
+    for pattern in main_urls.urlpatterns
+]
+
+
+@isolated_similar_index
+class AsyncViewTests(TestCase):
+    """
+    The async views must render the same pages as the views they replace.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('generate_dataset', '--users', '60', '--subjects', '20', '--workers', '1',
+                     stdout=StringIO())
+        cls.review = Review.objects.select_related('advert__owner', 'reviewer').filter(
+            advert__applications__applicant=models.F('reviewer'),
+            advert__applications__status=Application.Status.ONGOING,
+        ).first()
+
+    def get_both(self, url: str) -> tuple[str, str]:
+        pages = []
+        for urlconf in ('main.urls', __name__):
+            cache.clear()
+            with override_settings(ROOT_URLCONF=urlconf):
+                response = self.client.get(url)
+            self.assertIn(response.status_code, (200, 302))
+            pages.append(re.sub(r'name="csrfmiddlewaretoken" value="[^"]+"', '', response.content.decode()))
+        return pages[0], pages[1]
+
+    def test_pages_match(self):
+        advert, student, teacher = self.review.advert, self.review.reviewer, self.review.advert.owner
+        for viewer in (None, student, teacher):
+            if viewer:
+                self.client.force_login(viewer)
+            for url in (reverse('home'), reverse('subject_list') + '?query=algebra',
+                        reverse('subject_detail', args=[advert.subject_id]),
+                        reverse('advert_list'), reverse('advert_list') + '?sort=rating',
+                        reverse('advert_detail', args=[advert.id]),
+                        reverse('profile_detail', args=[student.profile.id]),
+                        reverse('profile_detail', args=[teacher.profile.id]),
+                        reverse('chat_detail', args=[teacher.id if viewer == student else student.id])):
+                with self.subTest(viewer=str(viewer), url=url):
+                    sync_page, async_page = self.get_both(url)
+                    self.assertEqual(sync_page, async_page)
+
+    def test_detail_pages_query_through_the_async_orm(self):
+        advert, student = self.review.advert, self.review.reviewer
+        self.client.force_login(student)
+        with override_settings(ROOT_URLCONF=__name__), \
+                patch('main.views.sync_to_async', side_effect=AssertionError('sync_to_async')):
+            for url in (reverse('subject_detail', args=[advert.subject_id]),
+                        reverse('subject_list'),
+                        reverse('advert_detail', args=[advert.id]),
+                        reverse('profile_detail', args=[student.profile.id])):
+                with self.subTest(url=url):
+                    cache.clear()
+                    self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_chat_detail_requires_login(self):
+        with override_settings(ROOT_URLCONF=__name__):
+            response = self.client.get(reverse('chat_detail', args=[self.review.reviewer_id]))
+        self.assertRedirects(response, f"{reverse('login')}?next={reverse('chat_detail', args=[self.review.reviewer_id])}",
+                             fetch_redirect_response=False)
+
+
+class ProfileRoleTests(TestCase):
+    def setUp(self):
+        self.group = Group.objects.create(name='teacher')
+        self.user = User.objects.create_user('user')
+        self.profile = Profile.objects.create(user=self.user)
+
+    def role(self) -> str:
+        return Profile.objects.get(pk=self.profile.pk).role
+
+    def test_role_follows_group_changes(self):
+        self.assertEqual(self.role(), Profile.Role.STUDENT)
+        self.user.groups.add(self.group)
+        self.assertEqual(self.role(), Profile.Role.TEACHER)
+        self.group.user_set.clear()
+        self.assertEqual(self.role(), Profile.Role.STUDENT)
+        self.group.user_set.add(self.user)
+        self.assertEqual(self.role(), Profile.Role.TEACHER)
+        self.group.name = 'former teacher'
+        self.group.save()
+        self.assertEqual(self.role(), Profile.Role.STUDENT)
+
+    def test_new_profile_uses_existing_groups(self):
+        teacher = User.objects.create_user('teacher')
+        teacher.groups.add(self.group)
+        self.assertTrue(Profile.objects.create(user=teacher).is_teacher)
+
+    def test_viewer_role_in_templates(self):
+        self.client.force_login(self.user)
+        self.assertNotContains(self.client.get(reverse('advert_list')), 'Create advert')
+        self.user.groups.add(self.group)
+        self.assertContains(self.client.get(reverse('advert_list')), 'Create advert')
+
+
+@override_settings(SERVER_TIMING=True)
+class PerformanceMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.subject = Subject.objects.create(title='Math')
+
+    def server_timing(self, response) -> dict[str, str]:
+        return {entry.split(';')[0]: entry for entry in response['Server-Timing'].split(', ')}
+
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('subject_detail', args=[self.subject.id]))
+        timing = self.server_timing(response)
+        self.assertEqual(set(timing), {'db', 'template', 'python', 'view'})
+        self.assertIn(f'desc="{len(queries)} queries"', timing['db'])
+
+    @override_settings(SERVER_TIMING=False)
+    def test_server_timing_can_be_disabled(self):
+        response = self.client.get(reverse('subject_detail', args=[self.subject.id]))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_counts_queries_of_async_views(self):
+        student = User.objects.create_user('student')
+        self.client.force_login(student)
+        response = self.client.get(reverse('chat_poll', args=[student.id]))
+        self.assertNotIn('desc="0 queries"', self.server_timing(response)['db'])
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=0)
+    def test_logs_slow_requests(self):
+        with self.assertLogs('main.performance', 'WARNING') as logs:
+            self.client.get(reverse('subject_detail', args=[self.subject.id]))
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry['url_name'], 'subject_detail')
+        self.assertTrue(entry['slowest_queries'])
+        self.assertLessEqual(len(entry['slowest_queries']), 5)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'],
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ReplicaRoutingTests(TestCase):
+    """
+    Uses a second SQLite file as the replica. Nothing replicates to it, so the
+    rows written in the tests are only found when reading from the primary.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Added after the test case setup, which only allows the databases
+        # known to the test runner
+        cls.directory = tempfile.TemporaryDirectory()
+        connections.settings['replica'] = {
+            **connections['default'].settings_dict,
+            'NAME': os.path.join(cls.directory.name, 'replica.sqlite3'),
+        }
+        call_command('migrate', database='replica', verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.subject = Subject.objects.create(title='Math')
+        self.user = User.objects.create_user('student', password='password')
+
+    def test_router(self):
+        router = PrimaryReplicaRouter()
+        self.assertIsNone(router.db_for_read(Subject))
+        token = read_from_replica.set(True)
+        try:
+            self.assertEqual(router.db_for_read(Subject), 'replica')
+            self.assertEqual(router.db_for_write(Subject), 'default')
+        finally:
+            read_from_replica.reset(token)
+
+    def test_safe_requests_read_from_replica(self):
+        response = self.client.get(reverse('subject_detail', args=[self.subject.id]))
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('read_primary', response.cookies)
+
+    def test_reads_stick_to_primary_after_writes(self):
+        response = self.client.post(reverse('login'), {'username': 'student', 'password': 'password'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.cookies['read_primary']['max-age'], 10)
+
+        response = self.client.get(reverse('subject_detail', args=[self.subject.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['user'], self.user)
+
+        del self.client.cookies['read_primary']
+        response = self.client.get(reverse('subject_detail', args=[self.subject.id]))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        response = self.client.get(reverse('subject_detail', args=[self.subject.id]))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(reverse('login'), {'username': 'student', 'password': 'password'})
+        self.assertNotIn('read_primary', response.cookies)
+
+
+class SqliteProfileTests(TestCase):
+    """
+    Runs against a SQLite file, the in-memory test database doesn't use WAL.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        connections.settings['sqlite_file'] = {
+            **connections['default'].settings_dict,
+            'NAME': os.path.join(cls.directory.name, 'db.sqlite3'),
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['sqlite_file'].close()
+        del connections['sqlite_file']
+        del connections.settings['sqlite_file']
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def test_logs_effective_settings_once(self):
+        database.logged_aliases.discard('sqlite_file')
+        connections['sqlite_file'].close()
+        with self.assertLogs('main.database', 'INFO') as logs:
+            connections['sqlite_file'].ensure_connection()
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual((entry['journal_mode'], entry['synchronous'], entry['busy_timeout']), ('wal', 1, 5000))
+
+        connections['sqlite_file'].close()
+        with self.assertNoLogs('main.database', 'INFO'):
+            connections['sqlite_file'].ensure_connection()
+
+    def test_concurrent_read_then_write_transactions(self):
+        with connections['sqlite_file'].cursor() as cursor:
+            cursor.execute('CREATE TABLE counter (value INTEGER)')
+            cursor.execute('INSERT INTO counter VALUES (0)')
+        errors = []
+
+        def increment():
+            try:
+                for _ in range(20):
+                    with transaction.atomic(using='sqlite_file'), connections['sqlite_file'].cursor() as cursor:
+                        cursor.execute('SELECT value FROM counter')
+                        value = cursor.fetchone()[0]
+                        cursor.execute('UPDATE counter SET value = %s', [value + 1])
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections['sqlite_file'].close()
+
+        threads = [threading.Thread(target=increment) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        with connections['sqlite_file'].cursor() as cursor:
+            cursor.execute('SELECT value FROM counter')
+            self.assertEqual(cursor.fetchone()[0], 160)
+
+
+@isolated_similar_index
+class NdjsonTests(TestCase):
+    def test_export_import_round_trip(self):
+        teacher = User.objects.create_user('teacher')
+        teacher.groups.add(Group.objects.create(name='teacher'))
+        Profile.objects.create(user=teacher)
+        student = User.objects.create_user('student')
+        subjects = [Subject.objects.create(title=f'Subject {i}') for i in range(2)]
+        subjects[0].sub_subjects.add(subjects[1])
+        advert = Advert.objects.create(owner=teacher, subject=subjects[0], price=5)
+        Review.objects.create(advert=advert, reviewer=student, rating=9)
+        Chat.objects.create(sender=student, receiver=teacher, message='Hi')
+
+        dump = StringIO()
+        call_command('export_ndjson', stdout=dump, stderr=StringIO())
+        created_at = Subject.objects.values_list('created_at', flat=True).get(pk=subjects[0].pk)
+        User.objects.all().delete()
+        Subject.objects.all().delete()
+
+        with patch('sys.stdin', StringIO(dump.getvalue())):
+            call_command('import_ndjson', '--batch-size', '2', stdout=StringIO())
+
+        advert.refresh_from_db()
+        self.assertEqual((advert.review_count, advert.rating_sum), (1, 9))
+        self.assertEqual(Subject.objects.get(pk=subjects[0].pk).created_at, created_at)
+        self.assertTrue(Profile.objects.get(user=teacher).is_teacher)
+        self.assertTrue(SubjectClosure.objects.filter(
+            ancestor=subjects[0], descendant=subjects[1]).exists())
+        self.assertTrue(Conversation.objects.between(student.pk, teacher.pk).exists())
+
+
+@isolated_similar_index
+class GenerateDatasetTests(TestCase):
+    def test_generates_consistent_dataset(self):
+        call_command('generate_dataset', '--users', '40', '--workers', '1', '--chunk-size', '7',
+                     stdout=StringIO())
+
+        self.assertEqual(User.objects.count(), 40)
+        self.assertEqual(Profile.objects.filter(role=Profile.Role.TEACHER).count(), 8)
+        self.assertEqual(Advert.objects.count(), 24)
+        self.assertEqual(set(Application.objects.values_list('status', flat=True)),
+                         set(Application.Status.values))
+        self.assertTrue(Review.objects.exists())
+        self.assertTrue(Chat.objects.exists())
+        self.assertFalse(SubjectClosure.objects.filter(
+            ancestor=models.F('descendant'), depth__gt=0).exists())
+        advert = Advert.objects.filter(review_count__gt=0).first()
+        self.assertEqual(advert.review_count, advert.reviews.count())
+
+    def test_generation_is_deterministic(self):
+        spec = datagen.DatasetSpec(
+            seed=1, users=100, teachers=20, subjects=20, adverts_per_teacher=3,
+            applications_per_student=3, max_messages=5, password='', teacher_group_id=1,
+            user_base=1, profile_base=1, subject_base=1, advert_base=1, application_base=1)
+        for generate, total in ((datagen.generate_users, 100), (datagen.generate_activity, 80)):
+            self.assertEqual(generate(spec, 0, total), generate(spec, 0, total))
+        self.assertNotEqual(datagen.generate_activity(spec, 0, 80),
+                            datagen.generate_activity(replace(spec, seed=2), 0, 80))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.subjects = [Subject.objects.create(title=f'Subject {i}') for i in range(7)]
+        # Identical timestamps must still paginate deterministically by id
+        Subject.objects.filter(pk__in=[s.pk for s in self.subjects[2:5]]).update(
+            created_at=self.subjects[2].created_at)
+
+    def test_walks_forward_and_back(self):
+        queryset = Subject.objects.all()
+        expected = list(queryset.order_by('-created_at', '-id'))
+
+        first = paginate_keyset(queryset, None, per_page=3)
+        second = paginate_keyset(queryset, first.next_cursor, per_page=3)
+        third = paginate_keyset(queryset, second.next_cursor, per_page=3)
+        self.assertEqual(list(first) + list(second) + list(third), expected)
+        self.assertFalse(first.has_previous)
+        self.assertFalse(third.has_next)
+
+        back = paginate_keyset(queryset, third.previous_cursor, per_page=3)
+        self.assertEqual(list(back), list(second))
+        self.assertTrue(back.has_next)
+        self.assertTrue(back.has_previous)
+
+    def test_invalid_cursor_returns_first_page(self):
+        page = paginate_keyset(Subject.objects.all(), 'not-a-cursor', per_page=3)
+        self.assertEqual(len(page), 3)
+        self.assertFalse(page.has_previous)
+
+    def test_tampered_cursor_values_return_first_page(self):
+        def cursor(values) -> str:
+            return base64.urlsafe_b64encode(json.dumps({'d': 'n', 'v': values}).encode()).decode()
+
+        first = list(Subject.objects.order_by('-created_at', '-id')[:3])
+        for values in ([1, 1], [[1], 1], [None, None], ['2024-01-01T00:00:00', None], [1], [1, 2, 3], {}):
+            with self.subTest(values=values):
+                page = paginate_keyset(Subject.objects.all(), cursor(values), per_page=3)
+                self.assertEqual(list(page), first)
+                self.assertFalse(page.has_previous)
+                for url in (reverse('advert_list'), reverse('subject_list')):
+                    self.assertEqual(self.client.get(url, {'cursor': cursor(values)}).status_code, 200)
+
+
+class ChatPollTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher')
+        self.student = User.objects.create_user('student')
+        self.stranger = User.objects.create_user('stranger')
+        for user in (self.teacher, self.student, self.stranger):
+            Profile.objects.create(user=user)
+        advert = Advert.objects.create(
+            owner=self.teacher, subject=Subject.objects.create(title='Math'), price=5)
+        Application.objects.create(advert=advert, applicant=self.student,
+                                   description='Hi', status=Application.Status.ONGOING)
+        self.first = Chat.objects.create(sender=self.student, receiver=self.teacher, message='Hello')
+        self.second = Chat.objects.create(sender=self.teacher, receiver=self.student, message='Hi!')
+
+    def test_returns_only_newer_messages(self):
+        self.client.force_login(self.student)
+        response = self.client.get(
+            reverse('chat_poll', args=[self.teacher.id]), {'after': self.first.id})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([m['id'] for m in data['messages']], [self.second.id])
+        self.assertEqual(data['messages'][0]['sender'], 'teacher')
+        self.assertEqual(data['last_id'], self.second.id)
+
+    def test_times_out_without_new_messages(self):
+        self.client.force_login(self.student)
+        response = self.client.get(
+            reverse('chat_poll', args=[self.teacher.id]), {'after': self.second.id})
+        self.assertEqual(response.json(), {'messages': [], 'last_id': self.second.id})
+
+    def test_rejects_invalid_timeouts(self):
+        self.client.force_login(self.student)
+        for timeout in ('nan', 'inf', '-inf', 'soon'):
+            with self.subTest(timeout=timeout):
+                response = self.client.get(reverse('chat_poll', args=[self.teacher.id]),
+                                           {'after': self.second.id, 'timeout': timeout})
+                self.assertEqual(response.status_code, 400)
+
+    @patch('main.views.CHAT_POLL_INTERVAL', 0.01)
+    @patch('main.views.CHAT_POLL_MAX_TIMEOUT', 0.05)
+    def test_clamps_timeout(self):
+        self.client.force_login(self.student)
+        for timeout in ('-5', '1e300'):
+            with self.subTest(timeout=timeout):
+                response = self.client.get(reverse('chat_poll', args=[self.teacher.id]),
+                                           {'after': self.second.id, 'timeout': timeout})
+                self.assertEqual(response.json(), {'messages': [], 'last_id': self.second.id})
+
+    def test_rejects_unrelated_users(self):
+        self.client.force_login(self.stranger)
+        response = self.client.get(reverse('chat_poll', args=[self.teacher.id]))
+        self.assertEqual(response.status_code, 403)
+
+    def test_requires_login(self):
+        response = self.client.get(reverse('chat_poll', args=[self.teacher.id]))
+        self.assertEqual(response.status_code, 401)
+
+
+class ConversationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher')
+        self.student = User.objects.create_user('student')
+        for user in (self.teacher, self.student):
+            Profile.objects.create(user=user)
+        advert = Advert.objects.create(
+            owner=self.teacher, subject=Subject.objects.create(title='Math'), price=5)
+        self.application = Application.objects.create(
+            advert=advert, applicant=self.student, description='Hi')
+
+    def test_ongoing_application_opens_conversation(self):
+        self.assertFalse(Conversation.objects.exists())
+        self.application.status = Application.Status.ONGOING
+        self.application.save()
+        self.assertEqual(Conversation.objects.count(), 1)
+
+        self.application.status = Application.Status.FINISHED
+        self.application.save()
+        self.assertFalse(Conversation.objects.exists())
+
+    def test_messages_move_pointer_and_unread_counters(self):
+        self.application.status = Application.Status.ONGOING
+        self.application.save()
+        self.client.force_login(self.student)
+        for message in ('Hello', 'Are you there?'):
+            self.client.post(reverse('chat_detail', args=[self.teacher.id]), {'message': message})
+
+        [conversation] = Conversation.objects.for_user(self.teacher)
+        self.assertEqual(conversation.partner_id, self.student.id)
+        self.assertEqual(conversation.unread, 2)
+        self.assertEqual(conversation.last_message.message, 'Are you there?')
+        self.assertEqual(Conversation.objects.unread_total(self.teacher), 2)
+        self.assertEqual(Conversation.objects.unread_total(self.student), 0)
+
+        self.client.force_login(self.teacher)
+        self.client.get(reverse('chat_detail', args=[self.student.id]))
+        self.assertEqual(Conversation.objects.unread_total(self.teacher), 0)
+
+        # Finishing the application keeps a conversation that has messages
+        self.application.status = Application.Status.FINISHED
+        self.application.save()
+        self.assertEqual(Conversation.objects.count(), 1)
+
+    def test_messages_to_oneself(self):
+        self.client.force_login(self.student)
+        response = self.client.post(reverse('chat_detail', args=[self.student.id]), {'message': 'Note'})
+        self.assertRedirects(response, reverse('chat_detail', args=[self.student.id]))
+
+        [conversation] = Conversation.objects.for_user(self.student)
+        self.assertEqual(conversation.partner_id, self.student.id)
+        self.assertEqual(conversation.last_message.message, 'Note')
+        self.assertEqual(Conversation.objects.unread_total(self.student), 0)
+
+    def test_chat_list(self):
+        self.application.status = Application.Status.ONGOING
+        self.application.save()
+        Chat.objects.create(sender=self.student, receiver=self.teacher, message='Hello')
+        self.client.force_login(self.teacher)
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('chat_list'))
+        self.assertContains(response, 'student')
+        self.assertContains(response, 'Hello')
+
+    def test_chat_list_is_read_from_the_participant_indexes(self):
+        others = [User.objects.create_user(f'user{i}') for i in range(3)]
+        Chat.objects.create(sender=others[0], receiver=self.student, message='First')
+        Chat.objects.create(sender=self.student, receiver=others[2], message='Second')
+        Chat.objects.create(sender=self.student, receiver=self.student, message='Note')
+        Chat.objects.create(sender=others[1], receiver=self.student, message='Last')
+
+        conversations = Conversation.objects.for_user(self.student)
+        self.assertEqual([(conversation.partner_username, conversation.last_message.message, conversation.unread)
+                          for conversation in conversations],
+                         [('user1', 'Last', 1), ('student', 'Note', 0), ('user2', 'Second', 0),
+                          ('user0', 'First', 1)])
+        if connection.vendor == 'sqlite':
+            with CaptureQueriesContext(connection) as context:
+                Conversation.objects.for_user(self.student)
+            for query in context.captured_queries:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'EXPLAIN QUERY PLAN {query["sql"]}')
+                    plan = ' '.join(row[-1] for row in cursor.fetchall())
+                self.assertIn('USING INDEX main_conver_', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_rebuild_drops_the_cached_relations(self):
+        Chat.objects.create(sender=self.student, receiver=self.teacher, message='Hello')
+        Conversation.objects.all().delete()
+        self.assertFalse(Profile.can_view(self.teacher.id, self.student.id))
+
+        call_command('rebuild_conversations', stdout=StringIO())
+        self.assertTrue(Profile.can_view(self.teacher.id, self.student.id))
+
+
+class RelationCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher')
+        self.student = User.objects.create_user('student')
+        advert = Advert.objects.create(
+            owner=self.teacher, subject=Subject.objects.create(title='Math'), price=5)
+        self.application = Application.objects.create(
+            advert=advert, applicant=self.student, description='Hi')
+
+    def test_relations_are_cached_and_invalidated(self):
+        self.assertFalse(Profile.can_message(self.student.id, self.teacher.id))
+        with self.assertNumQueries(0):
+            self.assertFalse(Profile.can_view(self.student.id, self.teacher.id))
+
+        self.application.status = Application.Status.ONGOING
+        self.application.save()
+        self.assertTrue(Profile.can_message(self.student.id, self.teacher.id))
+        self.assertTrue(Profile.can_message(self.teacher.id, self.student.id))
+
+        Chat.objects.create(sender=self.student, receiver=self.teacher, message='Hello')
+        self.application.status = Application.Status.FINISHED
+        self.application.save()
+        self.assertFalse(Profile.can_message(self.student.id, self.teacher.id))
+        self.assertTrue(Profile.can_view(self.student.id, self.teacher.id))
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.algebra = Subject.objects.create(
+            title='Linear Algebra', description='Vectors and matrices')
+        self.chemistry = Subject.objects.create(
+            title='Chemistry', description='Reactions and the periodic table')
+        self.teacher = User.objects.create_user('teacher')
+        self.advert = Advert.objects.create(
+            owner=self.teacher, subject=self.chemistry, price=5,
+            description='Finding the right formula for every student')
+
+    def test_matches_titles_descriptions_and_adverts(self):
+        self.assertEqual(search.search_subject_ids('algebra', 10), [self.algebra.id])
+        self.assertEqual(search.search_subject_ids('matri', 10), [self.algebra.id])
+        self.assertEqual(search.search_subject_ids('formula', 10), [self.chemistry.id])
+
+    def test_title_matches_rank_first(self):
+        Subject.objects.create(title='Geometry', description='Linear shapes in space')
+        self.assertEqual(search.search_subject_ids('linear', 10)[0], self.algebra.id)
+
+    def test_index_follows_saves_and_deletes(self):
+        self.advert.is_active = False
+        self.advert.save()
+        self.assertEqual(search.search_subject_ids('formula', 10), [])
+
+        self.algebra.title = 'Calculus'
+        self.algebra.save()
+        self.assertEqual(search.search_subject_ids('calculus', 10), [self.algebra.id])
+        self.assertEqual(search.search_subject_ids('algebra', 10), [])
+
+        self.algebra.delete()
+        self.assertEqual(search.search_subject_ids('calculus', 10), [])
+
+    def test_subject_list_search(self):
+        response = self.client.get(reverse('subject_list'), {'query': 'formula'})
+        self.assertEqual(list(response.context['subject_list']), [self.chemistry])
+
+
+class AdvertSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.math = Subject.objects.create(title='Math')
+        self.algebra = Subject.objects.create(title='Algebra')
+        self.math.sub_subjects.add(self.algebra)
+        self.student = User.objects.create_user('student')
+
+        def advert(subject, price, rating=None):
+            owner = User.objects.create_user(f'teacher{Advert.objects.count()}')
+            advert = Advert.objects.create(owner=owner, subject=subject, price=price)
+            if rating:
+                Review.objects.create(advert=advert, reviewer=self.student, rating=rating)
+            return advert
+
+        self.cheap = advert(self.math, 3, rating=6)
+        self.expensive = advert(self.math, 30, rating=9)
+        self.unrated = advert(self.algebra, 12)
+
+    def search(self, **params) -> list[Advert]:
+        response = self.client.get(reverse('advert_list'), params)
+        self.assertEqual(response.status_code, 200)
+        return list(response.context['advert_list'])
+
+    def test_filters(self):
+        self.assertEqual(self.search(subject=self.math.id, sort='price'), [self.cheap, self.expensive])
+        self.assertEqual(self.search(subject=self.math.id, include_sub_subjects='on', sort='price'),
+                         [self.cheap, self.unrated, self.expensive])
+        self.assertEqual(self.search(min_price=10, max_price=20), [self.unrated])
+        self.assertEqual(self.search(min_rating=7), [self.expensive])
+
+    def test_sorting(self):
+        self.assertEqual(self.search(sort='-price'), [self.expensive, self.unrated, self.cheap])
+        self.assertEqual(self.search(sort='rating'), [self.expensive, self.cheap, self.unrated])
+        self.assertEqual(self.search(), [self.unrated, self.expensive, self.cheap])
+
+    @override_settings(PAGE_CACHE_TIMEOUT=0)
+    def test_facets(self):
+        response = self.client.get(reverse('advert_list'))
+        facets = response.context['facets']
+        self.assertEqual([(s['title'], s['count']) for s in facets['subjects']],
+                         [('Algebra', 1), ('Math', 2)])
+        self.assertEqual([bucket['count'] for bucket in facets['prices']], [1, 0, 1, 1, 0])
+
+        with self.assertNumQueries(1):
+            self.client.get(reverse('advert_list'))
+
+    @override_settings(PAGE_CACHE_TIMEOUT=0)
+    def test_facets_follow_the_other_filters(self):
+        def facets(**params) -> tuple[list, list]:
+            facets = self.client.get(reverse('advert_list'), params).context['facets']
+            return ([(s['title'], s['count']) for s in facets['subjects']],
+                    [bucket['count'] for bucket in facets['prices']])
+
+        # The subject filter narrows the prices, the price filter the subjects
+        self.assertEqual(facets(subject=self.math.id), ([('Algebra', 1), ('Math', 2)], [1, 0, 0, 1, 0]))
+        self.assertEqual(facets(subject=self.math.id, include_sub_subjects='on'),
+                         ([('Algebra', 1), ('Math', 2)], [1, 0, 1, 1, 0]))
+        self.assertEqual(facets(min_price=10, max_price=40), ([('Algebra', 1), ('Math', 1)], [1, 0, 1, 1, 0]))
+        self.assertEqual(facets(subject=self.math.id, max_price=5), ([('Algebra', 0), ('Math', 1)], [1, 0, 0, 1, 0]))
+        self.assertEqual(facets(min_rating=7), ([('Math', 1)], [0, 0, 0, 1, 0]))
+
+
+class SubjectClosureTests(TestCase):
+    def setUp(self):
+        # calculus -> algebra -> arithmetic, calculus -> arithmetic is implied
+        self.arithmetic = Subject.objects.create(title='Arithmetic')
+        self.algebra = Subject.objects.create(title='Algebra')
+        self.calculus = Subject.objects.create(title='Calculus')
+        self.algebra.sub_subjects.add(self.arithmetic)
+        self.calculus.sub_subjects.add(self.algebra)
+
+    def closure(self) -> set[tuple[str, str, int]]:
+        return {(link.ancestor.title, link.descendant.title, link.depth)
+                for link in SubjectClosure.objects.filter(depth__gt=0).select_related(
+                    'ancestor', 'descendant')}
+
+    def test_incremental_updates_match_rebuild(self):
+        self.assertEqual(self.closure(), {
+            ('Algebra', 'Arithmetic', 1),
+            ('Calculus', 'Algebra', 1),
+            ('Calculus', 'Arithmetic', 2),
+        })
+
+        self.calculus.sub_subjects.add(self.arithmetic)
+        self.assertIn(('Calculus', 'Arithmetic', 1), self.closure())
+
+        self.arithmetic.sup_subjects.remove(self.calculus)
+        self.algebra.sub_subjects.clear()
+        self.assertEqual(self.closure(), {('Calculus', 'Algebra', 1)})
+
+        incremental = self.closure()
+        SubjectClosure.rebuild()
+        self.assertEqual(self.closure(), incremental)
+
+    def test_deleting_intermediate_subject(self):
+        self.algebra.delete()
+        self.assertEqual(self.closure(), set())
+
+    def test_rejects_cycles(self):
+        with self.assertRaises(ValidationError), transaction.atomic():
+            self.arithmetic.sub_subjects.add(self.calculus)
+        with self.assertRaises(ValidationError), transaction.atomic():
+            self.algebra.sub_subjects.add(self.algebra)
+        self.assertFalse(self.arithmetic.sub_subjects.exists())
+
+    def test_subject_detail_shows_tree(self):
+        cache.clear()
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('subject_detail', args=[self.algebra.id]))
+        self.assertEqual([link.descendant for link in response.context['prerequisites']],
+                         [self.arithmetic])
+        self.assertEqual([link.ancestor for link in response.context['dependents']],
+                         [self.calculus])
+
+    def test_subject_detail_nests_prerequisites_by_parent(self):
+        # calculus -> algebra -> arithmetic, calculus -> geometry -> {trigonometry, arithmetic}
+        geometry = Subject.objects.create(title='Geometry')
+        trigonometry = Subject.objects.create(title='Trigonometry')
+        geometry.sub_subjects.add(trigonometry, self.arithmetic)
+        self.calculus.sub_subjects.add(geometry)
+
+        response = self.client.get(reverse('subject_detail', args=[self.calculus.id]))
+
+        def titles(nodes):
+            return [(node['subject'].title, titles(node['children'])) for node in nodes]
+
+        self.assertEqual(titles(response.context['prerequisite_tree']), [
+            ('Algebra', [('Arithmetic', [])]),
+            ('Geometry', [('Trigonometry', [])]),
+        ])
+        self.assertContains(response, 'Trigonometry', count=1)
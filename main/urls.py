@@ -1,25 +1,42 @@
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import api, views
+
+# Read-heavy views with async versions, served when ASYNC_VIEWS is enabled
+ASYNC_VIEWS = {
+    views.profileDetail: views.profileDetailAsync,
+    views.chatDetail: views.chatDetailAsync,
+    views.advertList: views.advertListAsync,
+    views.advertDetail: views.advertDetailAsync,
+    views.subjectList: views.subjectListAsync,
+    views.subjectDetail: views.subjectDetailAsync,
+}
+
+
+def read_view(view):
+    return ASYNC_VIEWS[view] if settings.ASYNC_VIEWS else view
+
 
 urlpatterns = [
-    path("", views.subjectList, name="home"),
+    path("", read_view(views.subjectList), name="home"),
 
     path('login/', views.userLogin, name="login"),
     path('register/', views.userRegister, name="register"),
     path('logout/', views.userLogout, name="logout"),
 
-    path("profile/<int:pk>", views.profileDetail, name="profile_detail"),
+    path("profile/<int:pk>", read_view(views.profileDetail), name="profile_detail"),
     path("profile/<int:pk>/update", views.profileUpdate, name="profile_update"),
 
     path("chat/", views.chatList, name="chat_list"),
-    path("chat/<int:pk>", views.chatDetail, name="chat_detail"),
+    path("chat/<int:pk>", read_view(views.chatDetail), name="chat_detail"),
+    path("chat/<int:pk>/poll", views.chatPoll, name="chat_poll"),
 
-    path("advert/", views.advertList, name="advert_list"),
+    path("advert/", read_view(views.advertList), name="advert_list"),
     path("advert/create", views.advertCreate, name="advert_create"),
     path("advert/create/<int:pk>",
          views.advertCreate, name="advert_create"),
-    path("advert/<int:pk>", views.advertDetail, name="advert_detail"),
+    path("advert/<int:pk>", read_view(views.advertDetail), name="advert_detail"),
     path("advert/<int:pk>/update",
          views.advertUpdate, name="advert_update"),
 
@@ -33,6 +50,10 @@ urlpatterns = [
     path("review/<int:pk>", views.viewReview, name="review_detail"),
     path("review/<int:pk>/update", views.updateReview, name="review_update"),
 
-    path("subject/", views.subjectList, name="subject_list"),
-    path("subject/<int:pk>", views.subjectDetail, name="subject_detail"),
+    path("subject/", read_view(views.subjectList), name="subject_list"),
+    path("subject/<int:pk>", read_view(views.subjectDetail), name="subject_detail"),
+
+    path("api/<str:resource>/", api.apiList, name="api_list"),
+    path("api/<str:resource>/bulk", api.apiBulk, name="api_bulk"),
+    path("api/<str:resource>/<int:pk>", api.apiDetail, name="api_detail"),
 ]
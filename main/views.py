@@ -1,14 +1,33 @@
+import asyncio
+import math
+
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
-from django.http import HttpRequest, HttpResponse, Http404
-from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib.auth.views import redirect_to_login
+from django.db.models import Count, QuerySet
+from django.http import HttpRequest, HttpResponse, Http404, JsonResponse
+from django.shortcuts import render, redirect, aget_object_or_404, get_object_or_404
 from django.urls import reverse
+from django.utils.formats import date_format
+from django.utils.timezone import localtime
+
+from main.context_processors import aload_viewer
+from main.forms import UserForm, ProfileForm, AdvertForm, ApplicationForm, ReviewForm, SubjectSearchForm, \
+    AdvertSearchForm
+from main.models import Profile, Chat, Conversation, Advert, AdvertRecommendation, Application, Review, Subject, \
+    SubjectClosure, SubjectRecommendation, RANKING_ORDERING
+from main import conditional, search, similar
+from main.page_cache import cache_anonymous_page, tag_page
+from main.pagination import KeysetPage, apaginate_keyset, paginate_keyset
 
-from main.forms import UserForm, ProfileForm, AdvertForm, ApplicationForm, ReviewForm, SubjectSearchForm
-from main.models import Profile, Chat, Advert, Application, Review, Subject
+CHAT_PAGE_SIZE = 50
+SEARCH_RESULT_LIMIT = 50
+CHAT_POLL_INTERVAL = 1
+CHAT_POLL_MAX_TIMEOUT = 25
 
 
 # ---------------------------- Authentication Views ---------------------------
@@ -110,6 +129,8 @@ def userLogout(request: HttpRequest) -> HttpResponse:
 # ------------------------------ Profile Views --------------------------------
 
 
+@cache_anonymous_page
+@conditional.conditional_page(conditional.profile_detail)
 def profileDetail(request: HttpRequest, pk: int) -> HttpResponse:
     """
     View function to display the details of a profile.
@@ -123,9 +144,47 @@ def profileDetail(request: HttpRequest, pk: int) -> HttpResponse:
     """
     template_name = 'main/profile_detail.html'
 
-    profile = get_object_or_404(Profile, pk=pk)
+    return render(request, template_name, profile_detail_context(request, pk))
+
+
+def profile_detail_context(request: HttpRequest, pk: int) -> dict:
+    """
+    Builds the context of the profile page. The profile owner's adverts,
+    reviews and applications are only fetched when the owner views the page.
+    """
+    profile = get_object_or_404(
+        Profile.objects.select_related('user'), pk=pk)
+    tag_page(f'user:{profile.user_id}')
+
+    lists = {name: list(queryset) for name, queryset in profile_lists(request, profile).items()}
+    return {'profile': profile, **lists}
+
+
+async def aprofile_detail_context(request: HttpRequest, pk: int) -> dict:
+    """
+    Async version of `profile_detail_context`.
+    """
+    profile = await aget_object_or_404(
+        Profile.objects.select_related('user'), pk=pk)
+    tag_page(f'user:{profile.user_id}')
+
+    lists = {name: [row async for row in queryset] for name, queryset in profile_lists(request, profile).items()}
+    return {'profile': profile, **lists}
+
 
-    return render(request, template_name, {'profile': profile})
+def profile_lists(request: HttpRequest, profile: Profile) -> dict[str, QuerySet]:
+    """
+    Returns the unevaluated lists of the profile page, which only its owner
+    sees: their adverts, or their reviews and applications for students.
+    """
+    if request.user != profile.user:
+        return {}
+    if profile.is_teacher:
+        return {'adverts': profile.user.adverts.select_related('subject')}
+    return {
+        'reviews': profile.user.reviews.select_related('advert__owner', 'advert__subject'),
+        'applications': profile.user.applications.select_related('advert__owner', 'advert__subject'),
+    }
 
 
 @login_required(login_url='login')
@@ -175,7 +234,8 @@ def profileUpdate(request: HttpRequest, pk: int) -> HttpResponse:
 @login_required(login_url='login')
 def chatList(request: HttpRequest) -> HttpResponse:
     """
-    View function that displays the list of chats for the logged-in user.
+    View function that displays the list of conversations of the logged-in user,
+    most recently active first.
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -185,7 +245,7 @@ def chatList(request: HttpRequest) -> HttpResponse:
     """
     template_name = 'main/chat_list.html'
 
-    chats = request.user.profile.viewable_users()
+    chats = Conversation.objects.for_user(request.user)
 
     return render(request, template_name, {'chats': chats})
 
@@ -195,7 +255,8 @@ def chatDetail(request: HttpRequest, pk: int) -> HttpResponse:
     """
     View function for displaying the chat detail page. View allows viewing all the
     messages that have been sent, but only allows sending to users that currently
-    have an active application with sender.
+    have an active application with sender. Messages are paginated starting from
+    the newest ones.
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -206,41 +267,164 @@ def chatDetail(request: HttpRequest, pk: int) -> HttpResponse:
     """
     template_name = 'main/chat_detail.html'
 
-    if not User.objects.filter(id=pk).exists():
-        messages.error(request, 'This user does not exist!')
-        return redirect('home')
-
-    if not request.user.profile.viewable_users().filter(id=pk).exists():
-        messages.error(request, 'You don\'t have access to this chat!')
-        return redirect('home')
-
-    chat = Chat.objects.filter(sender=request.user, receiver=pk) | Chat.objects.filter(
-        sender=pk, receiver=request.user).order_by('created_at')
-    receiver = User.objects.get(id=pk)
+    context = chat_detail_context(request, pk)
+    if isinstance(context, HttpResponse):
+        return context
 
     if request.method == 'POST':
-        if not request.user.profile.reachable_users().filter(id=pk).exists():
+        if not Profile.can_message(request.user.id, pk):
             messages.error(
                 request, 'You can no longer send messages to this user!')
             return redirect(reverse('chat_detail', args=[pk]))
 
         message = request.POST.get('message')
         if message:
-            chat = Chat.objects.create(
+            Chat.objects.create(
                 sender=request.user, receiver=User.objects.get(id=pk), message=message)
             return redirect(reverse('chat_detail', args=[pk]))
         else:
             messages.warning(request, 'Message cannot be empty!')
 
-    return render(request, template_name, {'chat': chat, 'receiver': receiver})
+    return render(request, template_name, context)
+
+
+def chat_detail_context(request: HttpRequest, pk: int) -> dict | HttpResponse:
+    """
+    Builds the context of the chat page, marking the chat read on GET
+    requests. Returns a redirect when the chat can't be shown.
+    """
+    receiver = User.objects.filter(id=pk).first()
+    if receiver is None:
+        messages.error(request, 'This user does not exist!')
+        return redirect('home')
+
+    if not Profile.can_view(request.user.id, pk):
+        messages.error(request, 'You don\'t have access to this chat!')
+        return redirect('home')
+
+    chat_page = paginate_keyset(
+        chat_messages(request, pk), request.GET.get('cursor'), per_page=CHAT_PAGE_SIZE)
+
+    if request.method == 'GET':
+        Conversation.mark_read(request.user.id, pk)
+
+    return chat_detail_page(chat_page, receiver)
+
+
+async def achat_detail_context(request: HttpRequest, pk: int) -> dict | HttpResponse:
+    """
+    Async version of `chat_detail_context` for GET requests.
+    """
+    receiver = await User.objects.filter(id=pk).afirst()
+    if receiver is None:
+        messages.error(request, 'This user does not exist!')
+        return redirect('home')
+
+    # The relations are usually cached
+    if not await sync_to_async(Profile.can_view)(request.user.id, pk):
+        messages.error(request, 'You don\'t have access to this chat!')
+        return redirect('home')
+
+    chat_page = await apaginate_keyset(
+        chat_messages(request, pk), request.GET.get('cursor'), per_page=CHAT_PAGE_SIZE)
+
+    await Conversation.amark_read(request.user.id, pk)
+    # Marking as read changed the count shown in the navigation bar
+    request.unread_message_count = await Conversation.objects.aunread_total(request.user)
+
+    return chat_detail_page(chat_page, receiver)
+
+
+def chat_messages(request: HttpRequest, pk: int) -> QuerySet:
+    """
+    Returns the messages between the viewer and another user.
+    """
+    chat = Chat.objects.filter(sender=request.user, receiver=pk) | Chat.objects.filter(
+        sender=pk, receiver=request.user)
+    return chat.select_related('sender')
+
+
+def chat_detail_page(chat_page: KeysetPage, receiver: User) -> dict:
+    """
+    Returns the context of the chat page for a page of its messages.
+    """
+    return {
+        # Pages are fetched newest first but displayed in chronological order
+        'chat': list(reversed(chat_page.object_list)),
+        'page_obj': chat_page,
+        'receiver': receiver,
+        'last_message_id': chat_page.object_list[0].id if chat_page.object_list else 0,
+    }
+
+
+async def chatPoll(request: HttpRequest, pk: int) -> JsonResponse:
+    """
+    Asynchronous view that returns the chat messages with the given user that
+    are newer than the `after` message id. If there are none, the request is
+    held open for up to `timeout` seconds while waiting for new messages.
+    Waiting does not occupy a worker thread when served through ASGI.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        pk (int): The primary key of the user to chat with.
+
+    Returns:
+        JsonResponse: The new messages in chronological order.
+    """
+    user = await request.auser()
+
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    try:
+        after = int(request.GET.get('after', 0))
+        timeout = float(request.GET.get('timeout', 0))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid parameters'}, status=400)
+
+    # NaN would never reach the deadline
+    if not math.isfinite(timeout):
+        return JsonResponse({'error': 'Invalid parameters'}, status=400)
+    timeout = min(max(timeout, 0), CHAT_POLL_MAX_TIMEOUT)
+
+    if not await sync_to_async(Profile.can_view)(user.id, pk):
+        return JsonResponse({'error': 'You don\'t have access to this chat!'}, status=403)
+
+    chat = (Chat.objects.filter(sender=user, receiver=pk, id__gt=after) | Chat.objects.filter(
+        sender=pk, receiver=user, id__gt=after)).order_by('id').values(
+        'id', 'message', 'created_at', 'sender__username')[:CHAT_PAGE_SIZE]
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        new_messages = [message async for message in chat]
+        if new_messages or loop.time() >= deadline:
+            break
+        await asyncio.sleep(CHAT_POLL_INTERVAL)
+
+    if new_messages:
+        await sync_to_async(Conversation.mark_read)(user.id, pk)
+
+    return JsonResponse({
+        'messages': [{
+            'id': message['id'],
+            'sender': message['sender__username'],
+            'message': message['message'],
+            'created_at': date_format(localtime(message['created_at']), 'F d, Y H:i'),
+        } for message in new_messages],
+        'last_id': new_messages[-1]['id'] if new_messages else after,
+    })
 
 
 # ------------------------------ Advert Views ---------------------------------
 
 
+@cache_anonymous_page
 def advertList(request: HttpRequest) -> HttpResponse:
     """
-    View function that renders a list of active adverts.
+    View function that renders a paginated list of active adverts. The adverts
+    can be filtered by subject, price and minimum rating and sorted by recency,
+    price or rating. Subject and price facet counts are shown alongside.
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -250,9 +434,46 @@ def advertList(request: HttpRequest) -> HttpResponse:
     """
     template_name = 'main/advert_list.html'
 
-    adverts = Advert.objects.filter(is_active=True)
+    return render(request, template_name, advert_list_context(request))
 
-    return render(request, template_name, {'advert_list': adverts})
+
+def advert_list_context(request: HttpRequest) -> dict:
+    """
+    Builds the context of the advert list page.
+    """
+    form = AdvertSearchForm(request.GET)
+    adverts, ordering = advert_list_query(request, form, form.is_valid())
+
+    page = paginate_keyset(adverts, request.GET.get('cursor'), ordering=ordering)
+
+    return {'advert_list': page, 'page_obj': page, 'form': form, 'facets': form.facets()}
+
+
+async def aadvert_list_context(request: HttpRequest) -> dict:
+    """
+    Async version of `advert_list_context`. Validating the subject filter and
+    counting the facets use the synchronous form methods.
+    """
+    form = AdvertSearchForm(request.GET)
+    adverts, ordering = advert_list_query(request, form, await sync_to_async(form.is_valid)())
+
+    page = await apaginate_keyset(adverts, request.GET.get('cursor'), ordering=ordering)
+
+    return {'advert_list': page, 'page_obj': page, 'form': form,
+            'facets': await sync_to_async(form.facets)()}
+
+
+def advert_list_query(request: HttpRequest, form: AdvertSearchForm, valid: bool) -> tuple[QuerySet, tuple]:
+    """
+    Returns the filtered adverts of the advert list page and their ordering.
+    """
+    tag_page('advert_list')
+    adverts = Advert.objects.filter(is_active=True).with_listing_data()
+
+    if not valid:
+        messages.error(request, form.errors.as_text())
+        return adverts, AdvertSearchForm.SORT_ORDERINGS['recent']
+    return form.filter(adverts), form.ordering()
 
 
 @login_required(login_url='login')
@@ -302,6 +523,8 @@ def advertCreate(request: HttpRequest, pk: int = None) -> HttpResponse:
     return render(request, template_name, {'form': form, 'page': 'create'})
 
 
+@cache_anonymous_page
+@conditional.conditional_page(conditional.advert_detail)
 def advertDetail(request: HttpRequest, pk: int) -> HttpResponse:
     """
     View function to display the details of an advert.
@@ -315,9 +538,67 @@ def advertDetail(request: HttpRequest, pk: int) -> HttpResponse:
     """
     template_name = 'main/advert_detail.html'
 
-    advert = get_object_or_404(Advert, pk=pk)
+    return render(request, template_name, advert_detail_context(request, pk))
 
-    return render(request, template_name, {'advert': advert})
+
+def advert_detail_context(request: HttpRequest, pk: int) -> dict:
+    """
+    Builds the context of the advert page, with the applications for the
+    advert's owner.
+    """
+    advert = get_object_or_404(Advert.objects.select_related('owner', 'subject'), pk=pk)
+    lists = {name: list(queryset) for name, queryset in advert_detail_lists(request, advert).items()}
+    similar_ids = [advert_id for advert_id, _ in similar.similar_adverts(advert.id)]
+    similar_adverts = Advert.objects.filter(is_active=True).select_related('owner', 'subject').in_bulk(similar_ids)
+    return advert_detail_page(advert, lists, [similar_adverts[advert_id] for advert_id in similar_ids
+                                              if advert_id in similar_adverts])
+
+
+async def aadvert_detail_context(request: HttpRequest, pk: int) -> dict:
+    """
+    Async version of `advert_detail_context`.
+    """
+    advert = await aget_object_or_404(Advert.objects.select_related('owner', 'subject'), pk=pk)
+    lists = {name: [row async for row in queryset]
+             for name, queryset in advert_detail_lists(request, advert).items()}
+    similar_ids = [advert_id for advert_id, _ in similar.similar_adverts(advert.id)]
+    similar_adverts = await Advert.objects.filter(is_active=True).select_related('owner', 'subject').ain_bulk(
+        similar_ids)
+    return advert_detail_page(advert, lists, [similar_adverts[advert_id] for advert_id in similar_ids
+                                              if advert_id in similar_adverts])
+
+
+def advert_detail_lists(request: HttpRequest, advert: Advert) -> dict[str, QuerySet]:
+    """
+    Returns the unevaluated lists of the advert page, with the applications
+    for the advert's owner.
+    """
+    lists = {
+        'reviews': advert.reviews.select_related('reviewer'),
+        'recommendations': AdvertRecommendation.objects.filter(
+            advert=advert, recommended__is_active=True).select_related(
+            'recommended__owner', 'recommended__subject').order_by('rank'),
+    }
+    if request.user == advert.owner:
+        lists['applications'] = advert.applications.select_related('applicant')
+    return lists
+
+
+def advert_detail_page(advert: Advert, lists: dict[str, list], similar_adverts: list[Advert]) -> dict:
+    """
+    Tags the advert page with everything it shows and returns its context.
+    """
+    reviews, recommendations = lists['reviews'], lists['recommendations']
+    tag_page(f'advert:{advert.id}', f'subject:{advert.subject_id}', f'user:{advert.owner_id}',
+             *(f'user:{review.reviewer_id}' for review in reviews),
+             'recommendations', *(f'advert:{recommendation.recommended_id}' for recommendation in recommendations),
+             *(f'user:{recommendation.recommended.owner_id}' for recommendation in recommendations),
+             *(f'subject:{recommendation.recommended.subject_id}' for recommendation in recommendations))
+    tag_page('similar_adverts', *(f'advert:{similar_advert.id}' for similar_advert in similar_adverts),
+             *(f'user:{similar_advert.owner_id}' for similar_advert in similar_adverts),
+             *(f'subject:{similar_advert.subject_id}' for similar_advert in similar_adverts))
+
+    return {'advert': advert, 'similar_adverts': similar_adverts, **lists}
 
 
 @login_required(login_url='login')
@@ -371,9 +652,11 @@ def createApplication(request: HttpRequest, pk: int) -> HttpResponse:
     """
     template_name = 'main/application_form.html'
 
-    if Application.objects.filter(advert=pk, applicant=request.user).exists():
+    application_id = Application.objects.filter(
+        advert=pk, applicant=request.user).values_list('id', flat=True).first()
+    if application_id is not None:
         messages.error(request, 'You have already applied for this advert')
-        return redirect(reverse('application_update', args=[Application.objects.get(advert=pk, applicant=request.user).id]))
+        return redirect(reverse('application_update', args=[application_id]))
 
     advert = get_object_or_404(Advert, pk=pk)
 
@@ -410,10 +693,10 @@ def viewApplication(request: HttpRequest, pk: int) -> HttpResponse:
     """
     template_name = 'main/application_detail.html'
 
-    application = get_object_or_404(Application, pk=pk)
+    application = get_object_or_404(
+        Application.objects.select_related('advert__owner', 'advert__subject', 'applicant'), pk=pk)
 
-    if (request.user != Application.objects.get(id=pk).advert.owner
-            and request.user != Application.objects.get(id=pk).applicant):
+    if request.user != application.advert.owner and request.user != application.applicant:
         messages.error(request, 'You don\'t have access to this application!')
         return redirect('home')
 
@@ -439,9 +722,10 @@ def updateApplication(request: HttpRequest, pk: int) -> HttpResponse:
     """
     template_name = 'main/application_form.html'
 
-    application = get_object_or_404(Application, pk=pk)
+    application = get_object_or_404(
+        Application.objects.select_related('advert__owner', 'advert__subject'), pk=pk)
 
-    if request.user != Application.objects.get(id=pk).applicant:
+    if request.user.id != application.applicant_id:
         messages.error(
             request, 'You don\'t have edit access to this application!')
         return redirect('home')
@@ -481,9 +765,11 @@ def createReview(request: HttpRequest, pk: int) -> HttpResponse:
 
     advert = get_object_or_404(Advert, pk=pk)
 
-    if Review.objects.filter(advert=pk, reviewer=request.user).exists():
+    review_id = Review.objects.filter(
+        advert=pk, reviewer=request.user).values_list('id', flat=True).first()
+    if review_id is not None:
         messages.error(request, 'You have already reviewed this advert')
-        return redirect(reverse('review_detail', args=[Review.objects.get(advert=pk, reviewer=request.user).id]))
+        return redirect(reverse('review_detail', args=[review_id]))
 
     if Application.objects.filter(applicant=request.user, advert=advert) != 'FINISHED':
         messages.error(request, 'You can only review finished adverts')
@@ -506,6 +792,7 @@ def createReview(request: HttpRequest, pk: int) -> HttpResponse:
     return render(request, template_name, context)
 
 
+@conditional.conditional_page(conditional.review_detail)
 def viewReview(request: HttpRequest, pk: int) -> HttpResponse:
     """
     View function to display a review detail.
@@ -519,7 +806,8 @@ def viewReview(request: HttpRequest, pk: int) -> HttpResponse:
     """
     template_name = 'main/review_detail.html'
 
-    review = get_object_or_404(Review, pk=pk)
+    review = get_object_or_404(
+        Review.objects.select_related('reviewer', 'advert__owner', 'advert__subject'), pk=pk)
 
     return render(request, template_name, {'review': review})
 
@@ -538,9 +826,10 @@ def updateReview(request: HttpRequest, pk: int) -> HttpResponse:
     """
     template_name = 'main/review_form.html'
 
-    review = get_object_or_404(Review, pk=pk)
+    review = get_object_or_404(
+        Review.objects.select_related('advert__owner', 'advert__subject'), pk=pk)
 
-    if request.user != Review.objects.get(id=pk).reviewer:
+    if request.user.id != review.reviewer_id:
         messages.error(request, 'You don\'t have edit access to this review!')
         return redirect(reverse('review_detail', args=[pk]))
 
@@ -560,10 +849,12 @@ def updateReview(request: HttpRequest, pk: int) -> HttpResponse:
 
 # ------------------------------ Subject Views -------------------------------
 
+@cache_anonymous_page
 def subjectList(request: HttpRequest) -> HttpResponse:
     """
-    View function that renders the subject list page. The view allows searching
-    for subjects by title.
+    View function that renders the paginated subject list page. The view allows
+    searching subjects by their title and description and the descriptions of
+    their adverts, in which case the most relevant subjects are shown.
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -573,23 +864,66 @@ def subjectList(request: HttpRequest) -> HttpResponse:
     """
     template_name = 'main/subject_list.html'
 
-    subjects = Subject.objects.all()
+    return render(request, template_name, subject_list_context(request))
+
+
+def subject_list_context(request: HttpRequest) -> dict:
+    """
+    Builds the context of the subject list page, a page of subjects or the
+    search results.
+    """
+    subjects, form, search_query = subject_list_query(request)
+
+    if search_query:
+        subject_ids = search.search_subject_ids(search_query, SEARCH_RESULT_LIMIT)
+        matches = subjects.in_bulk(subject_ids)
+        return {'subject_list': [matches[id] for id in subject_ids if id in matches], 'form': form}
+
+    page = paginate_keyset(subjects, request.GET.get('cursor'))
+
+    return {'subject_list': page, 'page_obj': page, 'form': form}
+
+
+async def asubject_list_context(request: HttpRequest) -> dict:
+    """
+    Async version of `subject_list_context`. The full-text search runs raw
+    SQL, so it uses a synchronous database call.
+    """
+    subjects, form, search_query = subject_list_query(request)
+
+    if search_query:
+        subject_ids = await sync_to_async(search.search_subject_ids)(search_query, SEARCH_RESULT_LIMIT)
+        matches = await subjects.ain_bulk(subject_ids)
+        return {'subject_list': [matches[id] for id in subject_ids if id in matches], 'form': form}
+
+    page = await apaginate_keyset(subjects, request.GET.get('cursor'))
+
+    return {'subject_list': page, 'page_obj': page, 'form': form}
+
+
+def subject_list_query(request: HttpRequest) -> tuple[QuerySet, SubjectSearchForm, str | None]:
+    """
+    Returns the subjects of the subject list page, its search form and the
+    searched text, if any.
+    """
+    tag_page('subject_list')
+    subjects = Subject.objects.annotate(advert_count=Count('adverts'))
 
     form = SubjectSearchForm(request.GET)
 
-    if form.is_valid():
-        search_query = form.cleaned_data.get('query')
-        if search_query:
-            subjects = subjects.filter(title__icontains=search_query)
-    else:
+    if not form.is_valid():
         messages.error(request, form.errors.as_text())
-
-    return render(request, template_name, {'subject_list': subjects, 'form': form})
+        return subjects, form, None
+    return subjects, form, form.cleaned_data.get('query')
 
 
+@cache_anonymous_page
+@conditional.conditional_page(conditional.subject_detail)
 def subjectDetail(request: HttpRequest, pk: int) -> HttpResponse:
     """
-    View function that displays the details of a subject.
+    View function that displays the details of a subject, including its full
+    prerequisite tree, the subjects that build on it and a page of its active
+    adverts, best ranked first.
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -600,6 +934,153 @@ def subjectDetail(request: HttpRequest, pk: int) -> HttpResponse:
     """
     template_name = 'main/subject_detail.html'
 
+    return render(request, template_name, subject_detail_context(request, pk))
+
+
+def subject_detail_context(request: HttpRequest, pk: int) -> dict:
+    """
+    Builds the context of the subject page.
+    """
     subject = get_object_or_404(Subject, pk=pk)
+    links, adverts, recommendations = subject_detail_querysets(subject)
+
+    return subject_detail_page(
+        subject, list(links),
+        paginate_keyset(adverts, request.GET.get('cursor'), ordering=RANKING_ORDERING),
+        list(recommendations))
+
+
+async def asubject_detail_context(request: HttpRequest, pk: int) -> dict:
+    """
+    Async version of `subject_detail_context`.
+    """
+    subject = await aget_object_or_404(Subject, pk=pk)
+    links, adverts, recommendations = subject_detail_querysets(subject)
 
-    return render(request, template_name, {'subject': subject})
+    return subject_detail_page(
+        subject, [link async for link in links],
+        await apaginate_keyset(adverts, request.GET.get('cursor'), ordering=RANKING_ORDERING),
+        [recommendation async for recommendation in recommendations])
+
+
+def subject_detail_querysets(subject: Subject) -> tuple[QuerySet, QuerySet, QuerySet]:
+    """
+    Returns the unevaluated prerequisite tree links, ranked adverts and
+    recommended subjects of the subject page.
+    """
+    return (
+        SubjectClosure.subject_links(subject.id).select_related('ancestor', 'descendant').order_by('depth', 'id'),
+        Advert.objects.ranked(subject).with_listing_data(),
+        SubjectRecommendation.objects.filter(subject=subject).select_related('recommended').order_by('rank'),
+    )
+
+
+def subject_detail_page(subject: Subject, links: list[SubjectClosure], adverts: KeysetPage,
+                        recommendations: list[SubjectRecommendation]) -> dict:
+    """
+    Tags the subject page with everything it shows and returns its context.
+    """
+    prerequisites = [link for link in links if link.ancestor_id == subject.id]
+    dependents = [link for link in links if link.descendant_id == subject.id]
+    tag_page(f'subject:{subject.id}', 'subject_tree', 'recommendations',
+             *(f'subject:{recommendation.recommended_id}' for recommendation in recommendations),
+             *(f'subject:{link.ancestor_id}' for link in dependents),
+             *(f'subject:{link.descendant_id}' for link in prerequisites),
+             *(f'advert:{advert.id}' for advert in adverts),
+             *(f'user:{advert.owner_id}' for advert in adverts))
+
+    return {
+        'subject': subject,
+        'prerequisites': prerequisites,
+        'prerequisite_tree': SubjectClosure.prerequisite_tree(subject.id, links),
+        'dependents': dependents,
+        'adverts': adverts,
+        'page_obj': adverts,
+        'recommendations': recommendations,
+    }
+
+
+# ------------------------------ Async Views ----------------------------------
+#
+# Async versions of the read-heavy views, used instead of the views above when
+# ASYNC_VIEWS is enabled (the default under ASGI). Their context builders run
+# the same queries through the async ORM before rendering, as templates can't
+# run queries in an async context.
+
+
+async def arender_page(request: HttpRequest, template_name: str, build_context, *args) -> HttpResponse:
+    """
+    Renders a template with the context built by an async function, which
+    may also return a response instead, such as a redirect.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        template_name (str): The rendered template.
+        build_context: The coroutine function building the context from the
+            request and args.
+
+    Returns:
+        HttpResponse: The rendered page or the response of `build_context`.
+    """
+    await aload_viewer(request)
+    context = await build_context(request, *args)
+    if isinstance(context, HttpResponse):
+        return context
+    return render(request, template_name, context)
+
+
+@cache_anonymous_page
+@conditional.conditional_page(conditional.profile_detail)
+async def profileDetailAsync(request: HttpRequest, pk: int) -> HttpResponse:
+    """
+    Async version of `profileDetail`.
+    """
+    return await arender_page(request, 'main/profile_detail.html', aprofile_detail_context, pk)
+
+
+async def chatDetailAsync(request: HttpRequest, pk: int) -> HttpResponse:
+    """
+    Async version of the GET requests of `chatDetail`. Sending a message is
+    handled by the synchronous view.
+    """
+    if request.method != 'GET':
+        return await sync_to_async(chatDetail)(request, pk)
+
+    if not (await request.auser()).is_authenticated:
+        return redirect_to_login(request.get_full_path(), 'login')
+
+    return await arender_page(request, 'main/chat_detail.html', achat_detail_context, pk)
+
+
+@cache_anonymous_page
+async def advertListAsync(request: HttpRequest) -> HttpResponse:
+    """
+    Async version of `advertList`.
+    """
+    return await arender_page(request, 'main/advert_list.html', aadvert_list_context)
+
+
+@cache_anonymous_page
+@conditional.conditional_page(conditional.advert_detail)
+async def advertDetailAsync(request: HttpRequest, pk: int) -> HttpResponse:
+    """
+    Async version of `advertDetail`.
+    """
+    return await arender_page(request, 'main/advert_detail.html', aadvert_detail_context, pk)
+
+
+@cache_anonymous_page
+async def subjectListAsync(request: HttpRequest) -> HttpResponse:
+    """
+    Async version of `subjectList`.
+    """
+    return await arender_page(request, 'main/subject_list.html', asubject_list_context)
+
+
+@cache_anonymous_page
+@conditional.conditional_page(conditional.subject_detail)
+async def subjectDetailAsync(request: HttpRequest, pk: int) -> HttpResponse:
+    """
+    Async version of `subjectDetail`.
+    """
+    return await arender_page(request, 'main/subject_detail.html', asubject_detail_context, pk)